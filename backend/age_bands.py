@@ -0,0 +1,23 @@
+"""Age bands that group learners into peer cohorts.
+
+Kept free of the ML stack, so the percentile ranks and the dashboards work
+whether or not scikit-learn is installed; ``cohort_models`` builds its
+per-band difficulty models on the same bands.
+"""
+from bisect import bisect_right
+
+# Upper bounds (exclusive) of the age bands; see age_band().
+AGE_BAND_EDGES = (8, 11, 14)
+AGE_BANDS = ('under8', '8to10', '11to13', '14plus')
+AGE_BAND_RANGES = {
+    'under8': (None, 7),
+    '8to10': (8, 10),
+    '11to13': (11, 13),
+    '14plus': (14, None),
+}
+
+
+def age_band(age):
+    if age is None:
+        return None
+    return AGE_BANDS[bisect_right(AGE_BAND_EDGES, age)]
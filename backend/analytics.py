@@ -0,0 +1,359 @@
+"""Column-oriented cohort analytics.
+
+The dashboards answer questions about one user at a time with ORM queries.
+School and class level reporting needs the same numbers across thousands of
+children, so this module keeps the relevant columns of ``User``,
+``TestResult`` and ``GameScore`` in NumPy arrays and answers group-by and
+percentile queries with vectorized operations.
+
+Result and score rows are append-only, so they are loaded incrementally past
+an id watermark. The watermark is the id alone, not ``created_at``:
+``created_at`` is set before the INSERT waits for SQLite's write lock, so a
+row can commit after rows with a later timestamp, while ids are assigned
+under the lock and so follow commit order. The user columns are small and mutable
+(``current_difficulty`` changes after every submission), so they are reloaded
+whole on each refresh. ``partitions`` returns one context manager per
+database to read (one per shard when sharding is enabled); each keeps its own
+watermark.
+"""
+import threading
+import time
+from contextlib import nullcontext
+from datetime import timedelta
+
+import numpy as np
+
+DIFFICULTY_BINS = np.arange(0.5, 3.0 + 0.25, 0.25)
+PERCENTILES = (10, 25, 50, 75, 90)
+
+# NumPy counts days from 1970-01-01 (a Thursday); shifting by three days
+# makes integer week numbers start on Monday.
+_WEEK_OFFSET = 3
+
+
+def _as_float(value):
+    value = float(value)
+    return None if np.isnan(value) else round(value, 3)
+
+
+def _week_start(week_number):
+    return np.datetime64(int(week_number) * 7 - _WEEK_OFFSET, 'D').item()
+
+
+class _Codes:
+    """Maps category strings (test or game types) to small integer codes."""
+
+    def __init__(self):
+        self.names = []
+        self._index = {}
+
+    def encode(self, values):
+        codes = np.empty(len(values), dtype=np.int16)
+        for i, value in enumerate(values):
+            code = self._index.get(value)
+            if code is None:
+                code = self._index[value] = len(self.names)
+                self.names.append(value)
+            codes[i] = code
+        return codes
+
+
+class _Columns:
+    """A set of equally long column arrays that grows by appending batches."""
+
+    def __init__(self, dtypes):
+        self.dtypes = dtypes
+        self.data = {name: np.empty(0, dtype=dtype) for name, dtype in dtypes.items()}
+        self.watermarks = {}
+
+    def __len__(self):
+        return len(self.data['user_id'])
+
+    def append(self, batch):
+        for name, values in batch.items():
+            self.data[name] = np.concatenate([self.data[name], np.asarray(values, dtype=self.dtypes[name])])
+
+
+class CohortStore:
+    def __init__(self, db, user_model, test_model, game_model, min_interval=30, partitions=None):
+        self.db = db
+        self.partitions = partitions or (lambda: [nullcontext()])
+        self.User = user_model
+        self.TestResult = test_model
+        self.GameScore = game_model
+        self.min_interval = min_interval
+        self.test_types = _Codes()
+        self.game_types = _Codes()
+        self._lock = threading.Lock()
+        self._last_refresh = 0.0
+        self._reset()
+
+    def _reset(self):
+        self.users = {
+            'id': np.empty(0, dtype=np.int64),
+            'age': np.empty(0, dtype=np.float64),
+            'parent_id': np.empty(0, dtype=np.int64),
+            'difficulty': np.empty(0, dtype=np.float64),
+        }
+        self.tests = _Columns({
+            'user_id': np.int64,
+            'type': np.int16,
+            'score': np.float64,
+            'accuracy': np.float64,
+            'wpm': np.float64,
+            'created_at': 'datetime64[s]',
+        })
+        self.games = _Columns({
+            'user_id': np.int64,
+            'type': np.int16,
+            'score': np.float64,
+            'created_at': 'datetime64[s]',
+        })
+
+    def refresh(self, force=False):
+        with self._lock:
+            if not force and time.monotonic() - self._last_refresh < self.min_interval:
+                return
+            user_rows = []
+            for partition, scope in enumerate(self.partitions()):
+                with scope:
+                    user_rows.extend(self._query_users())
+                    self._load_rows(partition, self.tests, self.TestResult, (
+                        self.TestResult.test_type,
+                        self.TestResult.score,
+                        self.TestResult.accuracy,
+                        self.TestResult.words_per_minute,
+                    ), self._test_batch)
+                    self._load_rows(partition, self.games, self.GameScore, (
+                        self.GameScore.game_type,
+                        self.GameScore.score,
+                    ), self._game_batch)
+            self._set_users(sorted(user_rows, key=lambda r: r[0]))
+            self._last_refresh = time.monotonic()
+
+    def rebuild(self):
+        with self._lock:
+            self._reset()
+            self._last_refresh = 0.0
+        self.refresh(force=True)
+
+    def _query_users(self):
+        User = self.User
+        return self.db.session.query(
+            User.id, User.age, User.parent_id, User.current_difficulty
+        ).filter(User.user_type == 'child').all()
+
+    def _set_users(self, rows):
+        self.users = {
+            'id': np.array([r[0] for r in rows], dtype=np.int64),
+            'age': np.array([np.nan if r[1] is None else r[1] for r in rows], dtype=np.float64),
+            'parent_id': np.array([-1 if r[2] is None else r[2] for r in rows], dtype=np.int64),
+            'difficulty': np.array([1.0 if r[3] is None else r[3] for r in rows], dtype=np.float64),
+        }
+
+    def _load_rows(self, partition, columns, model, extra_columns, to_batch):
+        query = self.db.session.query(model.id, model.user_id, model.created_at, *extra_columns)
+        last_id = columns.watermarks.get(partition)
+        if last_id is not None:
+            query = query.filter(model.id > last_id)
+        rows = query.order_by(model.id).all()
+        if not rows:
+            return
+
+        columns.watermarks[partition] = rows[-1][0]
+        rows = [r for r in rows if r[2] is not None]
+        if rows:
+            columns.append(to_batch(rows))
+
+    def _test_batch(self, rows):
+        return {
+            'user_id': [r[1] for r in rows],
+            'created_at': [r[2] for r in rows],
+            'type': self.test_types.encode([r[3] for r in rows]),
+            'score': [r[4] for r in rows],
+            'accuracy': [r[5] for r in rows],
+            'wpm': [np.nan if r[6] is None else r[6] for r in rows],
+        }
+
+    def _game_batch(self, rows):
+        return {
+            'user_id': [r[1] for r in rows],
+            'created_at': [r[2] for r in rows],
+            'type': self.game_types.encode([r[3] for r in rows]),
+            'score': [r[4] for r in rows],
+        }
+
+    # ---- queries -------------------------------------------------------
+
+    def _user_mask(self, age_min, age_max, parent_id):
+        users = self.users
+        mask = np.ones(len(users['id']), dtype=bool)
+        if age_min is not None:
+            mask &= users['age'] >= age_min
+        if age_max is not None:
+            mask &= users['age'] <= age_max
+        if parent_id is not None:
+            mask &= users['parent_id'] == parent_id
+        return mask
+
+    def _row_index(self, columns, user_mask, start, end):
+        """Return (row mask, user index per row) for rows of selected users."""
+        user_ids = self.users['id']
+        row_user = columns.data['user_id']
+        idx = np.searchsorted(user_ids, row_user)
+        idx = np.clip(idx, 0, max(len(user_ids) - 1, 0))
+        if len(user_ids):
+            mask = (user_ids[idx] == row_user) & user_mask[idx]
+        else:
+            mask = np.zeros(len(row_user), dtype=bool)
+
+        created = columns.data['created_at']
+        if start is not None:
+            mask &= created >= np.datetime64(start, 's')
+        if end is not None:
+            mask &= created < np.datetime64(end + timedelta(days=1), 's')
+        return mask, idx
+
+    def cohort_stats(self, age_min=None, age_max=None, parent_id=None,
+                     start=None, end=None, group_by=None):
+        with self._lock:
+            user_mask = self._user_mask(age_min, age_max, parent_id)
+            test_mask, test_user = self._row_index(self.tests, user_mask, start, end)
+            game_mask, game_user = self._row_index(self.games, user_mask, start, end)
+
+            stats = {
+                'filters': {
+                    'age_min': age_min,
+                    'age_max': age_max,
+                    'parent_id': parent_id,
+                    'start': start.isoformat() if start else None,
+                    'end': end.isoformat() if end else None,
+                },
+                'total_children': int(user_mask.sum()),
+                'difficulty': self._difficulty_stats(self.users['difficulty'][user_mask]),
+                'tests_by_type': self._tests_by_type(test_mask),
+                'games_by_type': self._games_by_type(game_mask),
+                'words_per_minute_trend': self._wpm_trend(test_mask),
+                'active_days_per_week': self._active_days_per_week(
+                    test_mask, test_user, game_mask, game_user, int(user_mask.sum())
+                ),
+            }
+            if group_by == 'age':
+                stats['by_age'] = self._by_age(user_mask, test_mask, test_user)
+            return stats
+
+    def _difficulty_stats(self, values):
+        if not len(values):
+            return {'mean': None, 'percentiles': {}, 'histogram': []}
+
+        counts, edges = np.histogram(values, bins=DIFFICULTY_BINS)
+        return {
+            'mean': _as_float(values.mean()),
+            'percentiles': {
+                f'p{p}': _as_float(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))
+            },
+            'histogram': [
+                {'from': float(edges[i]), 'to': float(edges[i + 1]), 'count': int(counts[i])}
+                for i in range(len(counts))
+            ],
+        }
+
+    def _tests_by_type(self, mask):
+        types = self.tests.data['type'][mask]
+        n = len(self.test_types.names)
+        counts = np.bincount(types, minlength=n)
+        accuracy = np.bincount(types, weights=self.tests.data['accuracy'][mask], minlength=n)
+        score = np.bincount(types, weights=self.tests.data['score'][mask], minlength=n)
+
+        return {
+            name: {
+                'count': int(counts[code]),
+                'mean_accuracy': _as_float(accuracy[code] / counts[code]),
+                'mean_score': _as_float(score[code] / counts[code]),
+            }
+            for code, name in enumerate(self.test_types.names) if counts[code]
+        }
+
+    def _games_by_type(self, mask):
+        types = self.games.data['type'][mask]
+        n = len(self.game_types.names)
+        counts = np.bincount(types, minlength=n)
+        score = np.bincount(types, weights=self.games.data['score'][mask], minlength=n)
+
+        return {
+            name: {
+                'count': int(counts[code]),
+                'mean_score': _as_float(score[code] / counts[code]),
+            }
+            for code, name in enumerate(self.game_types.names) if counts[code]
+        }
+
+    @staticmethod
+    def _week_numbers(created_at):
+        days = created_at.astype('datetime64[D]').astype(np.int64)
+        return (days + _WEEK_OFFSET) // 7
+
+    def _wpm_trend(self, mask):
+        wpm = self.tests.data['wpm']
+        mask = mask & ~np.isnan(wpm)
+        if not mask.any():
+            return []
+
+        weeks, inverse = np.unique(self._week_numbers(self.tests.data['created_at'][mask]),
+                                   return_inverse=True)
+        counts = np.bincount(inverse)
+        totals = np.bincount(inverse, weights=wpm[mask])
+        return [
+            {'week_start': _week_start(week).isoformat(), 'mean_wpm': _as_float(totals[i] / counts[i]),
+             'count': int(counts[i])}
+            for i, week in enumerate(weeks)
+        ]
+
+    def _active_days_per_week(self, test_mask, test_user, game_mask, game_user, total_children):
+        days = np.concatenate([
+            self.tests.data['created_at'][test_mask].astype('datetime64[D]').astype(np.int64),
+            self.games.data['created_at'][game_mask].astype('datetime64[D]').astype(np.int64),
+        ])
+        if not len(days) or not total_children:
+            return []
+
+        users = np.concatenate([test_user[test_mask], game_user[game_mask]]).astype(np.int64)
+        # One entry per (child, day) the child was active on.
+        active = np.unique(users * 1_000_000 + days)
+        active_days = active % 1_000_000
+        weeks, per_week = np.unique((active_days + _WEEK_OFFSET) // 7, return_counts=True)
+        return [
+            {'week_start': _week_start(week).isoformat(),
+             'active_days_per_child': _as_float(count / total_children)}
+            for week, count in zip(weeks, per_week)
+        ]
+
+    def _by_age(self, user_mask, test_mask, test_user):
+        ages = self.users['age']
+        known = user_mask & ~np.isnan(ages)
+        if not known.any():
+            return []
+
+        age_values, inverse = np.unique(ages[known], return_inverse=True)
+        children = np.bincount(inverse)
+        difficulty = np.bincount(inverse, weights=self.users['difficulty'][known])
+
+        # Position of every known-age child in age_values, -1 for the rest.
+        age_slot = np.full(len(ages), -1, dtype=np.int64)
+        age_slot[known] = inverse
+        row_slot = age_slot[test_user[test_mask]]
+        valid = row_slot >= 0
+        test_counts = np.bincount(row_slot[valid], minlength=len(age_values))
+        accuracy = np.bincount(row_slot[valid], weights=self.tests.data['accuracy'][test_mask][valid],
+                               minlength=len(age_values))
+
+        return [
+            {
+                'age': int(age),
+                'children': int(children[i]),
+                'mean_difficulty': _as_float(difficulty[i] / children[i]),
+                'tests': int(test_counts[i]),
+                'mean_accuracy': _as_float(accuracy[i] / test_counts[i]) if test_counts[i] else None,
+            }
+            for i, age in enumerate(age_values)
+        ]
@@ -1,21 +1,71 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy.exc import IntegrityError
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, date, timedelta
 import numpy as np
 import os
 import json
 import pickle
+import time
+import gzip
+import csv
+import io
+import zlib
+import click
+import hmac
+import hashlib
+import random
+import multiprocessing
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import wraps
+from analytics import CohortStore
+from events import EventHub, create_broker
+from singleflight import SingleFlight
+from timeseries import BUCKETS, bucket_mean, downsample
+from sharding import ShardRouter, current_shard, enable_wal, install_id_allocation, split_database
+from simulator import PolicyParams, SimulatedPolicy, simulate
+from word_bank import WordBank
+from profiler import ProfileStore, RequestProfiler, SamplingProfiler
+from replica import Replica, read_target, snapshot
+from age_bands import age_band
+from percentiles import PeerPercentiles
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 CORS(app)
 
 # Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///dyslexia.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///dyslexia.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+
+class RoutingSession(Session):
+    # With SHARD_COUNT set, every query goes to the shard selected for the
+    # current request. Inside reporting_read() with ?consistency=fast, reads
+    # go to the replica. Otherwise this behaves like the default session.
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        shard = current_shard.get()
+        if bind is None and shard is not None:
+            return shard_router.engine(shard)
+        if bind is None and read_target.get() == 'replica':
+            return replica.engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+shard_router = ShardRouter(
+    int(os.environ.get('SHARD_COUNT', 0)),
+    os.environ.get('SHARD_DIR', app.instance_path),
+    db.metadata,
+    migrate=lambda engine: add_version_column(engine)
+)
 
 # Database Models
 class User(db.Model):
@@ -32,6 +82,8 @@ class User(db.Model):
     current_difficulty = db.Column(db.Float, default=1.0)
     performance_history = db.Column(db.Text, default='[]')
     consecutive_low_scores = db.Column(db.Integer, default=0)
+    # Bumped by every difficulty update; see apply_difficulty_update().
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     
     children = db.relationship('User', 
                               backref=db.backref('parent', remote_side=[id]),
@@ -47,6 +99,8 @@ class TestResult(db.Model):
     time_spent = db.Column(db.Integer, default=0)
     difficulty_level = db.Column(db.Float, default=1.0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_test_result_user_created', 'user_id', 'created_at'),)
 
 class GameScore(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -58,6 +112,8 @@ class GameScore(db.Model):
     time_spent = db.Column(db.Integer, default=0)
     difficulty_level = db.Column(db.Float, default=1.0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_game_score_user_created', 'user_id', 'created_at'),)
 
 class LearningSession(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -68,44 +124,94 @@ class LearningSession(db.Model):
     date = db.Column(db.Date, nullable=False, default=date.today)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class IdempotencyRecord(db.Model):
+    # Keyed by a digest of (endpoint, user, Idempotency-Key) so rows stay the
+    # same small size whatever clients send as keys. status_code is null
+    # while the first request with the key is still running.
+    key = db.Column(db.LargeBinary(16), primary_key=True)
+    fingerprint = db.Column(db.LargeBinary(8), nullable=False)
+    status_code = db.Column(db.Integer, nullable=True)
+    response = db.Column(db.LargeBinary, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+install_id_allocation(shard_router, RoutingSession, User)
+
+MAX_TRAINING_ROWS = 5000
+COHORT_RETRAIN_INTERVAL = float(os.environ.get('COHORT_RETRAIN_INTERVAL', 600))
+
 # Check if scikit-learn is available
 try:
     from sklearn.svm import SVC
     from sklearn.preprocessing import StandardScaler
+    import joblib
+    from model_registry import ModelRegistry
+    from cohort_models import AGE_BAND_RANGES, CohortModelCache, cohort_keys, retrain_cohorts
     ML_AVAILABLE = True
     print("✓ ML Libraries Available")
     
     class AdaptiveDifficultySystem:
         def __init__(self):
+            # difficulty_model.pkl is the pre-registry single-file model; it
+            # is imported as the first registry version when present.
             self.model_path = 'difficulty_model.pkl'
-            self.model = self.load_or_create_model()
+            self.registry_root = os.environ.get('MODEL_REGISTRY_DIR', 'models')
+            self.registry = ModelRegistry(self.registry_root)
+            self.cohort_models = CohortModelCache(
+                self.registry_root, int(os.environ.get('MODEL_CACHE_BYTES', 64 * 1024 * 1024))
+            )
+            self.load_or_create_model()
             self.consecutive_threshold = 3
             self.low_score_threshold = 0.4
             self.high_score_threshold = 0.75
         
+        @property
+        def model(self):
+            return self.registry.get()[1]
+        
+        @property
+        def model_version(self):
+            return self.registry.get()[0]
+        
         def load_or_create_model(self):
+            if self.registry.current_version() is not None:
+                return self.model
+            
             if os.path.exists(self.model_path):
-                with open(self.model_path, 'rb') as f:
-                    return pickle.load(f)
-            else:
-                model = SVC(kernel='rbf', probability=True, C=1.0, gamma='scale')
-                X = np.array([[0.3, 0.0], [0.7, 0.1], [0.5, -0.1], [0.8, 0.2], 
-                             [0.4, -0.2], [0.9, 0.3], [0.35, -0.15], [0.85, 0.25]])
-                y = np.array([0, 1, 0, 1, 0, 1, 0, 1])
-                model.fit(X, y)
-                self.save_model(model)
-                return model
-        
-        def save_model(self, model):
-            with open(self.model_path, 'wb') as f:
-                pickle.dump(model, f)
-        
-        def predict_adjustment(self, current_score, recent_trend, consecutive_low_scores):
+                try:
+                    with open(self.model_path, 'rb') as f:
+                        model = pickle.load(f)
+                    self.save_model(model, {'source': self.model_path})
+                    return self.model
+                except Exception as e:
+                    print(f"Could not import {self.model_path}: {e}")
+            
+            model = SVC(kernel='rbf', probability=True, C=1.0, gamma='scale')
+            X = np.array([[0.3, 0.0], [0.7, 0.1], [0.5, -0.1], [0.8, 0.2], 
+                         [0.4, -0.2], [0.9, 0.3], [0.35, -0.15], [0.85, 0.25]])
+            y = np.array([0, 1, 0, 1, 0, 1, 0, 1])
+            model.fit(X, y)
+            self.save_model(model, {'source': 'default'})
+            return self.model
+        
+        def save_model(self, model, metadata=None):
+            return self.registry.publish(model, metadata)
+        
+        def model_for(self, age=None, activity=None):
+            # The most specific cohort with a published model, otherwise the
+            # global model.
+            for key in cohort_keys(age, activity):
+                version, model = self.cohort_models.get(key)
+                if model is not None:
+                    return key, version, model
+            version, model = self.registry.get()
+            return 'global', version, model
+        
+        def predict_adjustment(self, current_score, recent_trend, consecutive_low_scores, age=None, activity=None):
             if consecutive_low_scores >= 3:
                 return 0
             try:
                 features = np.array([[current_score, recent_trend]])
-                proba = self.model.predict_proba(features)[0]
+                proba = self.model_for(age, activity)[2].predict_proba(features)[0]
                 
                 if proba[1] > 0.65 and current_score > self.high_score_threshold:
                     return 1
@@ -120,13 +226,20 @@ try:
                     return 0
                 return -1
         
-        def update_model(self, X, y):
-            try:
-                if len(X) >= 10:
-                    self.model.fit(X, y)
-                    self.save_model(self.model)
-            except:
-                pass
+        def trained_within(self, band, seconds):
+            if band is None:
+                version = self.registry.current_version()
+                manifest = self.registry.manifest(version) if version is not None else None
+            else:
+                manifest = self.cohort_models.manifest(band)
+            if not manifest:
+                return False
+            age = datetime.utcnow() - datetime.fromisoformat(manifest['created_at'])
+            return age.total_seconds() < seconds
+        
+        def retrain(self, band, sequences):
+            """Fit and publish the models of one age band, or the global model."""
+            return retrain_cohorts(self.registry_root, band, sequences)
     
     difficulty_system = AdaptiveDifficultySystem()
     
@@ -136,11 +249,12 @@ except ImportError:
     
     class AdaptiveDifficultySystem:
         def __init__(self):
+            self.model_version = None
             self.consecutive_threshold = 3
             self.low_score_threshold = 0.4
             self.high_score_threshold = 0.75
         
-        def predict_adjustment(self, current_score, recent_trend, consecutive_low_scores):
+        def predict_adjustment(self, current_score, recent_trend, consecutive_low_scores, age=None, activity=None):
             if consecutive_low_scores >= 3:
                 return 0
             if current_score > self.high_score_threshold:
@@ -154,11 +268,126 @@ except ImportError:
     
     difficulty_system = AdaptiveDifficultySystem()
 
+GAME_MAX_SCORES = {
+    'word_jumble': 110,
+    'memory_match': 60,
+    'spelling_bee': 110
+}
+
+def add_version_column(engine):
+    # create_all() does not alter existing tables, so databases created
+    # before User.version existed get the column here.
+    columns = {c['name'] for c in db.inspect(engine).get_columns(User.__tablename__)}
+    if 'version' not in columns:
+        table = engine.dialect.identifier_preparer.quote(User.__tablename__)
+        with engine.begin() as conn:
+            conn.execute(db.text(f'ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 1'))
+
 # Initialize database
 with app.app_context():
+    # WAL lets snapshots and the replica refresh read while submissions write.
+    enable_wal(db.engine)
     db.create_all()
+    # create_all() skips tables that already exist, so add indexes introduced
+    # after a database was first created explicitly.
+    for model in (TestResult, GameScore):
+        for index in model.__table__.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+    # Shards are migrated by shard_router when their engines are created.
+    add_version_column(db.engine)
+
+def shard_scopes():
+    if not shard_router.enabled:
+        return [nullcontext()]
+    return [shard_router.use_shard(shard) for shard in shard_router.shard_ids()]
+
+cohort_store = CohortStore(db, User, TestResult, GameScore, partitions=shard_scopes)
+peer_percentiles = PeerPercentiles(db, User, TestResult, GameScore, partitions=shard_scopes,
+                                   min_interval=float(os.environ.get('PERCENTILES_INTERVAL', 10)))
+event_hub = EventHub(create_broker(os.environ.get('EVENT_BROKER_URL')))
+request_flights = SingleFlight()
+word_bank = WordBank()
+# Shared by every worker process; see profiler.py.
+profile_store = ProfileStore(os.environ.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles')))
+request_profiler = RequestProfiler(profile_store)
+sampling_profiler = SamplingProfiler(profile_store)
+
+# Read-only copy of the database for reporting reads; not used with sharding.
+REPLICA_MAX_STALENESS = float(os.environ.get('REPLICA_MAX_STALENESS', 300))
+replica = None
+if not shard_router.enabled:
+    with app.app_context():
+        replica = Replica(
+            db.engine.url.database,
+            os.environ.get('REPLICA_PATH', os.path.join(app.instance_path, 'replica.db')),
+            interval=float(os.environ.get('REPLICA_INTERVAL', 60))
+        )
+
+model_retrain_executor = ThreadPoolExecutor(max_workers=1)
+# Fitting is seconds of CPU, so it runs in its own process (see run_model_retrain).
+model_fit_executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('forkserver'))
+model_retrain_attempts = {}
 
 # Helper functions
+def load_training_sequences(band=None):
+    # Most recent submissions of the band's learners (everyone for the global
+    # model), as per-learner (score, difficulty, activity) sequences.
+    age_min, age_max = AGE_BAND_RANGES[band] if band else (None, None)
+    sources = (
+        (TestResult, TestResult.accuracy, TestResult.test_type),
+        (GameScore, GameScore.score, GameScore.game_type),
+    )
+    rows = []
+    for scope in shard_scopes():
+        with scope:
+            for model, score, kind in sources:
+                query = db.session.query(model.user_id, score, model.difficulty_level, kind, model.created_at)\
+                    .join(User, User.id == model.user_id)
+                if age_min is not None:
+                    query = query.filter(User.age >= age_min)
+                if age_max is not None:
+                    query = query.filter(User.age <= age_max)
+                for user_id, value, difficulty, kind_value, created_at in \
+                        query.order_by(model.created_at.desc()).limit(MAX_TRAINING_ROWS):
+                    if model is GameScore:
+                        value = min(value / GAME_MAX_SCORES.get(kind_value, 100), 1.0)
+                        kind_value = 'games'
+                    rows.append((user_id, created_at, value, difficulty or 1.0, kind_value))
+    
+    by_user = defaultdict(list)
+    for user_id, created_at, value, difficulty, kind_value in sorted(rows, key=lambda r: (r[0], r[1])):
+        by_user[user_id].append((value, difficulty, kind_value))
+    return list(by_user.values())
+
+def run_model_retrain(band):
+    try:
+        with app.app_context():
+            # Another worker may have published this cohort recently.
+            if difficulty_system.trained_within(band, COHORT_RETRAIN_INTERVAL):
+                return
+            sequences = load_training_sequences(band)
+        # Only the query runs here. The fit would hold this worker's CPU (and,
+        # under gevent, every request on it) for seconds, so it runs in the
+        # fit process and publishes through the registry, where this and
+        # every other worker pick the new versions up.
+        model_fit_executor.submit(retrain_cohorts, difficulty_system.registry_root, band, sequences).result()
+    except Exception as e:
+        print(f"Error retraining difficulty models for {band or 'global'}: {e}")
+
+def schedule_model_retrain(age):
+    # Retraining runs on one background thread, with the fitting in a
+    # separate process, at most once per COHORT_RETRAIN_INTERVAL per cohort
+    # in each worker.
+    if not ML_AVAILABLE:
+        return
+    now = time.monotonic()
+    for band in {age_band(age), None}:
+        key = band or 'global'
+        if now - model_retrain_attempts.get(key, -COHORT_RETRAIN_INTERVAL) < COHORT_RETRAIN_INTERVAL:
+            continue
+        model_retrain_attempts[key] = now
+        model_retrain_executor.submit(run_model_retrain, band)
+
 def calculate_new_difficulty(current_difficulty, adjustment, score):
     if adjustment == 1:
         increase = 0.2 if score > 0.85 else 0.15 if score > 0.75 else 0.1
@@ -168,6 +397,334 @@ def calculate_new_difficulty(current_difficulty, adjustment, score):
         return max(0.5, current_difficulty - decrease)
     return current_difficulty
 
+def current_streak(user_id):
+    dates = {row[0] for row in db.session.query(LearningSession.date)
+             .filter_by(user_id=user_id).distinct()}
+    streak = 0
+    check_date = date.today()
+    while check_date in dates:
+        streak += 1
+        check_date = check_date - timedelta(days=1)
+    return streak
+
+def publish_user_event(user, event_type, data):
+    # Children's events also go to their parent's channel so the parent
+    # dashboard can follow every child from one stream.
+    channels = [user.id]
+    if user.parent_id:
+        channels.append(user.parent_id)
+    try:
+        event_hub.publish(channels, event_type, dict(data, user_id=user.id))
+    except Exception as e:
+        print(f"Error publishing {event_type} event: {e}")
+
+def publish_submission_events(user, previous_difficulty, first_session_today):
+    if user.current_difficulty != previous_difficulty:
+        publish_user_event(user, 'difficulty', {
+            'previous_difficulty': previous_difficulty,
+            'current_difficulty': user.current_difficulty
+        })
+    if first_session_today:
+        publish_user_event(user, 'streak', {'streak': current_streak(user.id)})
+
+HEATMAP_DAYS = 150
+# Lower bounds of heatmap intensities 1-4; anything below the first is 0.
+INTENSITY_MINUTES = [1, 15, 30, 60]
+
+def learning_heatmap(activity_by_date, end_date, days=HEATMAP_DAYS):
+    start_date = end_date - timedelta(days=days - 1)
+    minutes = np.array([activity_by_date.get(start_date + timedelta(days=i), 0) for i in range(days)],
+                       dtype=np.int64)
+    return start_date, minutes, np.digitize(minutes, INTENSITY_MINUTES)
+
+def expand_learning_blocks(start_date, minutes, intensity):
+    return [
+        {
+            'date': (start_date + timedelta(days=i)).isoformat(),
+            'minutes': m,
+            'intensity': level,
+            'filled': m > 0
+        } for i, (m, level) in enumerate(zip(minutes.tolist(), intensity.tolist()))
+    ]
+
+def compact_learning_blocks(start_date, minutes, intensity):
+    # One entry per day from start_date; intensity is one digit per day and
+    # 'filled' is simply minutes > 0.
+    return {
+        'start_date': start_date.isoformat(),
+        'days': len(minutes),
+        'minutes': minutes.tolist(),
+        'intensity': ''.join(map(str, intensity.tolist()))
+    }
+
+def columnar_history(history):
+    return {
+        'timestamp': [h.get('timestamp') for h in history],
+        'score': [h.get('score') for h in history],
+        'difficulty': [h.get('difficulty') for h in history]
+    }
+
+COMPRESSION_MIN_BYTES = 1024
+
+@app.after_request
+def compress_response(response):
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(['br', 'gzip'] if brotli else ['gzip'])
+    if encoding is None or response.content_length is None \
+            or response.content_length < COMPRESSION_MIN_BYTES:
+        return response
+    
+    data = response.get_data()
+    if encoding == 'br':
+        data = brotli.compress(data, quality=4)
+    else:
+        data = gzip.compress(data, compresslevel=5)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', 24 * 3600))
+# How long an unfinished claim is honoured before it is treated as abandoned
+# by a crashed worker.
+IDEMPOTENCY_CLAIM_SECONDS = 60
+IDEMPOTENCY_PURGE_INTERVAL = 60.0
+idempotency_next_purge = [0.0]
+
+def claim_idempotency_key(digest, fingerprint):
+    # Returns None once this request owns the key, otherwise the record of
+    # the request that does.
+    while True:
+        now = datetime.utcnow()
+        record = db.session.get(IdempotencyRecord, digest, populate_existing=True)
+        if record is not None and record.expires_at > now:
+            return record
+        if record is not None:
+            db.session.query(IdempotencyRecord)\
+                .filter_by(key=digest, expires_at=record.expires_at).delete()
+        db.session.add(IdempotencyRecord(
+            key=digest,
+            fingerprint=fingerprint,
+            expires_at=now + timedelta(seconds=IDEMPOTENCY_CLAIM_SECONDS)
+        ))
+        try:
+            db.session.commit()
+            return None
+        except IntegrityError:
+            db.session.rollback()
+
+def store_idempotent_response(digest, response):
+    # Server errors and 409 (a concurrent update won; the client is told to
+    # retry) release the key so the retry runs again. Anything else is
+    # stored and replayed until the TTL expires. Commits nothing itself.
+    query = db.session.query(IdempotencyRecord).filter_by(key=digest)
+    if response.status_code >= 500 or response.status_code == 409:
+        query.delete()
+    else:
+        query.update({
+            'status_code': response.status_code,
+            'response': zlib.compress(response.get_data()),
+            'expires_at': datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_TTL)
+        })
+    
+    now = time.monotonic()
+    if now >= idempotency_next_purge[0]:
+        idempotency_next_purge[0] = now + IDEMPOTENCY_PURGE_INTERVAL
+        db.session.query(IdempotencyRecord)\
+            .filter(IdempotencyRecord.expires_at < datetime.utcnow()).delete()
+
+def finish_idempotency_key(digest, response):
+    store_idempotent_response(digest, response)
+    db.session.commit()
+
+def commit_submission(body, status=200):
+    # Commits the view's writes and returns its response. Under @idempotent
+    # the response is stored in the same transaction, so a retry never finds
+    # the write without its response or the response without the write.
+    response = app.make_response((jsonify(body), status))
+    digest = g.get('idempotency_digest')
+    if digest is not None:
+        store_idempotent_response(digest, response)
+    db.session.commit()
+    g.idempotency_stored = digest is not None
+    return response
+
+def idempotent(view):
+    # Requests carrying an Idempotency-Key run at most once per key: repeats
+    # get the stored response (with Idempotent-Replayed: true) without
+    # touching the write path, and repeats that arrive while the first is
+    # still running get a 409 with Retry-After. Views that write store their
+    # response through commit_submission(); other outcomes are stored here.
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({'error': 'Idempotency-Key must be at most 255 characters'}), 400
+        
+        data = request.get_json(silent=True)
+        user_id = data.get('user_id') if isinstance(data, dict) else None
+        digest = hashlib.sha256(f'{request.endpoint}\0{user_id}\0{key}'.encode()).digest()[:16]
+        fingerprint = hashlib.sha256(json.dumps(data, sort_keys=True).encode()).digest()[:8]
+        
+        record = claim_idempotency_key(digest, fingerprint)
+        if record is not None:
+            if record.fingerprint != fingerprint:
+                return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+            if record.status_code is None:
+                response = jsonify({'error': 'A request with this Idempotency-Key is still in progress'})
+                response.headers['Retry-After'] = '1'
+                return response, 409
+            response = Response(zlib.decompress(record.response), status=record.status_code,
+                                mimetype='application/json')
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        
+        g.idempotency_digest = digest
+        try:
+            response = app.make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            finish_idempotency_key(digest, app.make_response(('', 500)))
+            raise
+        if g.get('idempotency_stored'):
+            return response
+        
+        try:
+            finish_idempotency_key(digest, response)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error storing idempotent response: {e}")
+        return response
+    return wrapper
+
+def coalesce_requests(timeout=10.0):
+    # Identical concurrent GETs share one computation; the leader's response
+    # is frozen to bytes so every waiter gets its own Response object.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            def compute():
+                response = app.make_response(view(*args, **kwargs))
+                return response.get_data(), response.status_code, list(response.headers.items())
+            
+            body, status, headers = request_flights.do(
+                request.full_path, compute, timeout=timeout, group=request.endpoint
+            )
+            return Response(body, status=status, headers=headers)
+        return wrapper
+    return decorator
+
+def reporting_read(view):
+    # ?consistency=fast serves the request from the replica when it is at
+    # most max_staleness seconds old (default REPLICA_MAX_STALENESS); the
+    # default, consistency=fresh, always reads the primary.
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.args.get('consistency') != 'fast' or replica is None:
+            return view(*args, **kwargs)
+        
+        max_staleness = request.args.get('max_staleness', REPLICA_MAX_STALENESS, type=float)
+        staleness = replica.staleness()
+        if staleness is None or staleness > max_staleness:
+            response = app.make_response(view(*args, **kwargs))
+            response.headers['X-Read-Source'] = 'primary'
+            return response
+        
+        token = read_target.set('replica')
+        try:
+            response = app.make_response(view(*args, **kwargs))
+        finally:
+            read_target.reset(token)
+        response.headers['X-Read-Source'] = 'replica'
+        response.headers['X-Replica-Staleness'] = f'{staleness:.3f}'
+        return response
+    return wrapper
+
+def admin_required(view):
+    # Admin endpoints are disabled unless ADMIN_TOKEN is set.
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        expected = os.environ.get('ADMIN_TOKEN')
+        provided = request.headers.get('X-Admin-Token', '')
+        if not expected or not hmac.compare_digest(provided.encode(), expected.encode()):
+            return jsonify({'error': 'Admin access required'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+def resolve_register_shard(data):
+    # A taken username or email routes to the shard that holds it, so the
+    # duplicate checks in register() report it exactly as before.
+    location = shard_router.locate_username(data.get('username')) or \
+        shard_router.locate_email(data.get('email'))
+    if location:
+        return location
+    
+    if data.get('user_type') == 'child':
+        parent = shard_router.locate_username(f"parent_{data.get('username')}")
+        if parent:
+            return parent
+    
+    return shard_router.tenant_for(data.get('school'))
+
+def resolve_request_shard():
+    view_args = request.view_args or {}
+    data = request.get_json(silent=True) if request.is_json else None
+    data = data if isinstance(data, dict) else {}
+    
+    user_id = view_args.get('user_id') or view_args.get('parent_id') or \
+        data.get('user_id') or request.args.get('user_id')
+    if user_id is not None:
+        try:
+            return shard_router.locate_user(int(user_id))
+        except (TypeError, ValueError):
+            return None
+    
+    if request.endpoint == 'register':
+        return resolve_register_shard(data)
+    if request.endpoint == 'register_roster':
+        return shard_router.tenant_for(data.get('school') or request.values.get('school'))
+    if data.get('username'):
+        return shard_router.locate_username(data['username'])
+    if data.get('email'):
+        return shard_router.locate_email(data['email'])
+    return None
+
+@app.before_request
+def start_background_refresh():
+    # Started by the first request rather than at import, so CLI commands
+    # and the debug reloader's parent process never copy the database or
+    # load the peer distributions.
+    if replica is not None:
+        replica.start()
+    peer_percentiles.start(app)
+
+@app.before_request
+def sync_profilers():
+    # Join or leave profiling sessions started from another worker.
+    request_profiler.sync(app)
+    sampling_profiler.sync()
+
+@app.before_request
+def select_request_shard():
+    if not shard_router.enabled:
+        return
+    location = resolve_request_shard()
+    if location is not None:
+        g.shard_scope = shard_router.use_shard(*location)
+        g.shard_scope.__enter__()
+
+@app.teardown_request
+def release_request_shard(exc):
+    scope = g.pop('shard_scope', None)
+    if scope is not None:
+        scope.__exit__(None, None, None)
+
 # Routes
 @app.route('/api/register', methods=['POST'])
 def register():
@@ -254,6 +811,204 @@ def register():
         db.session.rollback()
         return jsonify({'error': f'Registration failed: {str(e)}'}), 400
 
+ROSTER_MAX_ROWS = 2000
+ROSTER_FIELDS = ('username', 'email', 'password')
+
+def hash_passwords(passwords):
+    # Hash in separate processes: under gevent workers a thread pool runs the
+    # hashing one password at a time on the worker's own loop. The forkserver
+    # context forks from a clean helper instead of this threaded process.
+    workers = min(os.cpu_count() or 1, len(passwords)) or 1
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('forkserver')) as pool:
+        return list(pool.map(generate_password_hash, passwords, chunksize=16))
+
+def parse_roster_csv(text):
+    return [
+        {key.strip(): (value or '').strip() for key, value in row.items() if key}
+        for row in csv.DictReader(io.StringIO(text))
+    ]
+
+def import_roster(rows):
+    """Create children (and their parent_<username> accounts) in one transaction.
+    
+    Returns one report entry per input row, in input order.
+    """
+    report = [{'row': i + 1, 'username': row.get('username'), 'status': 'pending'}
+              for i, row in enumerate(rows)]
+    
+    def fail(entry, message):
+        entry['status'] = 'error'
+        entry['error'] = message
+    
+    seen_usernames = set()
+    seen_emails = set()
+    candidates = []
+    for entry, row in zip(report, rows):
+        missing = [field for field in ROSTER_FIELDS if not row.get(field)]
+        if missing:
+            fail(entry, f"Missing {', '.join(missing)}")
+            continue
+        if row['email'].count('@') != 1:
+            fail(entry, 'Invalid email')
+            continue
+        if row['username'] in seen_usernames:
+            fail(entry, 'Duplicate username in roster')
+            continue
+        if row['email'] in seen_emails:
+            fail(entry, 'Duplicate email in roster')
+            continue
+        try:
+            age = int(row['age']) if row.get('age') not in (None, '') else None
+        except (TypeError, ValueError):
+            fail(entry, 'Invalid age')
+            continue
+        
+        seen_usernames.add(row['username'])
+        seen_emails.add(row['email'])
+        local, domain = row['email'].split('@')
+        candidates.append({
+            'entry': entry,
+            'username': row['username'],
+            'email': row['email'],
+            'password': row['password'],
+            'age': age,
+            'parent_username': f"parent_{row['username']}",
+            'parent_email': f"{local}+parent@{domain}",
+            'parent_password': f"{row['password']}@parent"
+        })
+    
+    # One set-based query covers every child and parent username and email.
+    # With sharding, usernames and emails are unique across all shards, so
+    # the query goes to the catalog's directory instead of this shard.
+    usernames = [c['username'] for c in candidates] + [c['parent_username'] for c in candidates]
+    emails = [c['email'] for c in candidates] + [c['parent_email'] for c in candidates]
+    if not candidates:
+        existing = []
+    elif shard_router.enabled:
+        existing = shard_router.find_users(usernames, emails)
+    else:
+        existing = db.session.query(User.id, User.username, User.email, db.literal(None)).filter(
+            db.or_(User.username.in_(usernames), User.email.in_(emails))
+        ).all()
+    taken_usernames = {username: (user_id, shard) for user_id, username, email, shard in existing}
+    taken_emails = {email for user_id, username, email, shard in existing}
+    
+    # A new parent account must not collide with a child created by another
+    # row, or the unique constraints would fail the whole transaction.
+    roster_usernames = {c['username'] for c in candidates}
+    roster_emails = {c['email'] for c in candidates}
+    
+    accepted = []
+    for c in candidates:
+        parent_id, parent_shard = taken_usernames.get(c['parent_username'], (None, None))
+        if c['username'] in taken_usernames:
+            fail(c['entry'], 'Username already exists')
+            continue
+        if c['email'] in taken_emails:
+            fail(c['entry'], 'Email already registered')
+            continue
+        if parent_id is not None and parent_shard != current_shard.get():
+            fail(c['entry'], f"Parent account {c['parent_username']} belongs to another school")
+            continue
+        c['parent_id'] = parent_id
+        c['new_parent'] = c['parent_id'] is None
+        if c['new_parent']:
+            if c['parent_username'] in roster_usernames:
+                fail(c['entry'], f"Parent username {c['parent_username']} is used by another row")
+                continue
+            if c['parent_email'] in taken_emails:
+                local, domain = c['email'].split('@')
+                c['parent_email'] = f"{local}+parent{int(datetime.utcnow().timestamp())}@{domain}"
+            if c['parent_email'] in roster_emails:
+                fail(c['entry'], f"Parent email {c['parent_email']} is used by another row")
+                continue
+        accepted.append(c)
+    
+    if not accepted:
+        return report
+    
+    new_parents = [c for c in accepted if c['new_parent']]
+    hashes = hash_passwords([c['password'] for c in accepted] +
+                            [c['parent_password'] for c in new_parents])
+    child_hashes = hashes[:len(accepted)]
+    parent_hashes = hashes[len(accepted):]
+    
+    try:
+        parents = [
+            User(
+                username=c['parent_username'],
+                email=c['parent_email'],
+                password_hash=password_hash,
+                user_type='parent'
+            ) for c, password_hash in zip(new_parents, parent_hashes)
+        ]
+        db.session.add_all(parents)
+        db.session.flush()
+        for c, parent in zip(new_parents, parents):
+            c['parent_id'] = parent.id
+        
+        children = [
+            User(
+                username=c['username'],
+                email=c['email'],
+                password_hash=password_hash,
+                user_type='child',
+                parent_id=c['parent_id'],
+                age=c['age'],
+                current_difficulty=1.0,
+                performance_history='[]',
+                consecutive_low_scores=0
+            ) for c, password_hash in zip(accepted, child_hashes)
+        ]
+        db.session.add_all(children)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        for c in accepted:
+            fail(c['entry'], f'Registration failed: {str(e)}')
+        return report
+    
+    for c, child in zip(accepted, children):
+        c['entry'].update({
+            'status': 'created',
+            'user_id': child.id,
+            'parent_id': c['parent_id'],
+            'parent_username': c['parent_username'],
+            'parent_password': c['parent_password'] if c['new_parent'] else None
+        })
+    return report
+
+@app.route('/api/register-roster', methods=['POST'])
+def register_roster():
+    try:
+        if 'roster' in request.files:
+            rows = parse_roster_csv(request.files['roster'].read().decode('utf-8-sig'))
+        elif request.mimetype == 'text/csv':
+            rows = parse_roster_csv(request.get_data(as_text=True))
+        else:
+            data = request.get_json(silent=True) or {}
+            rows = data.get('children')
+            if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+                return jsonify({'error': 'Expected a list of children'}), 400
+        
+        if not rows:
+            return jsonify({'error': 'Roster is empty'}), 400
+        if len(rows) > ROSTER_MAX_ROWS:
+            return jsonify({'error': f'Roster is limited to {ROSTER_MAX_ROWS} rows'}), 400
+        
+        report = import_roster(rows)
+        created = sum(1 for entry in report if entry['status'] == 'created')
+        
+        return jsonify({
+            'created': created,
+            'failed': len(report) - created,
+            'rows': report
+        }), 201 if created else 400
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Roster import failed: {str(e)}'}), 500
+
 @app.route('/api/login', methods=['POST'])
 def login():
     data = request.json
@@ -281,66 +1036,34 @@ def update_difficulty():
     score = data['score']
     
     try:
-        user = User.query.get(user_id)
-        if not user:
+        result = apply_difficulty_update(user_id, score, activity=data.get('activity'))
+        if result is None:
             return jsonify({'error': 'User not found'}), 404
         
-        history = json.loads(user.performance_history or '[]')
-        
-        recent_scores = [h['score'] for h in history[-3:]] if len(history) >= 3 else [0.5]
-        recent_trend = score - np.mean(recent_scores) if recent_scores else 0
-        
-        if score < 0.4:
-            user.consecutive_low_scores = (user.consecutive_low_scores or 0) + 1
-        else:
-            user.consecutive_low_scores = 0
-        
-        adjustment = difficulty_system.predict_adjustment(score, recent_trend, user.consecutive_low_scores or 0)
-        
-        new_difficulty = calculate_new_difficulty(user.current_difficulty, adjustment, score)
-        
-        user.current_difficulty = new_difficulty
-        
-        history.append({
-            'timestamp': datetime.utcnow().isoformat(),
-            'score': score,
-            'difficulty': new_difficulty
-        })
-        
-        if len(history) > 20:
-            history = history[-20:]
-        
-        user.performance_history = json.dumps(history)
-        
-        if ML_AVAILABLE and len(history) >= 10:
-            X = []
-            y = []
-            for i in range(len(history) - 1):
-                if i + 1 < len(history):
-                    prev_score = history[i]['score']
-                    next_difficulty = history[i + 1]['difficulty']
-                    current_difficulty = history[i]['difficulty']
-                    
-                    trend = next_difficulty - current_difficulty
-                    X.append([prev_score, 0])
-                    y.append(1 if trend > 0 else 0)
-            
-            if len(X) >= 10:
-                difficulty_system.update_model(np.array(X), np.array(y))
-        
         db.session.commit()
         
+        if result['new_difficulty'] != result['previous_difficulty']:
+            publish_user_event(result['user'], 'difficulty', {
+                'previous_difficulty': result['previous_difficulty'],
+                'current_difficulty': result['new_difficulty']
+            })
+        
         return jsonify({
-            'new_difficulty': new_difficulty,
-            'adjustment': adjustment,
-            'consecutive_low_scores': user.consecutive_low_scores,
+            'new_difficulty': result['new_difficulty'],
+            'adjustment': result['adjustment'],
+            'consecutive_low_scores': result['consecutive_low_scores'],
             'ml_available': ML_AVAILABLE
         }), 200
         
+    except ConcurrentUpdateError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/speech-test', methods=['POST'])
+@idempotent
 def speech_test():
     try:
         data = request.json
@@ -361,6 +1084,10 @@ def speech_test():
                           if i < len(original_words) and word == original_words[i])
         accuracy = correct_words / len(original_words) if original_words else 0
         
+        first_session_today = not LearningSession.query.filter_by(
+            user_id=user_id, date=date.today()
+        ).first()
+        
         learning_session = LearningSession(
             user_id=user_id,
             session_type='test',
@@ -384,27 +1111,41 @@ def speech_test():
         
         learning_session.activity_id = test_result.id
         
-        user.total_learning_time = (user.total_learning_time or 0) + 1
-        user.last_active = datetime.utcnow()
-        
-        update_response = update_difficulty_internal(user_id, accuracy)
+        update_response = update_difficulty_internal(user_id, accuracy, learning_time=1, activity='speech')
         
-        db.session.commit()
-        
-        return jsonify({
+        response = commit_submission({
             'accuracy': accuracy,
             'score': accuracy * 100,
             'words_per_minute': len(spoken_words) * 2,
             'difficulty_level': current_difficulty,
             'new_difficulty': update_response.get('new_difficulty', current_difficulty),
             'ml_available': ML_AVAILABLE
-        }), 200
+        })
         
+        publish_user_event(user, 'test_result', {
+            'test_result_id': test_result.id,
+            'test_type': test_result.test_type,
+            'score': test_result.score,
+            'accuracy': test_result.accuracy,
+            'words_per_minute': test_result.words_per_minute,
+            'difficulty_level': test_result.difficulty_level,
+            'date': test_result.created_at.isoformat()
+        })
+        publish_submission_events(
+            user, update_response.get('previous_difficulty', current_difficulty), first_session_today
+        )
+        
+        return response
+        
+    except ConcurrentUpdateError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/listening-test', methods=['POST'])
+@idempotent
 def listening_test():
     try:
         data = request.json
@@ -425,6 +1166,10 @@ def listening_test():
                           if i < len(original_words) and word == original_words[i])
         accuracy = correct_words / len(original_words) if original_words else 0
         
+        first_session_today = not LearningSession.query.filter_by(
+            user_id=user_id, date=date.today()
+        ).first()
+        
         learning_session = LearningSession(
             user_id=user_id,
             session_type='test',
@@ -447,46 +1192,69 @@ def listening_test():
         
         learning_session.activity_id = test_result.id
         
-        user.total_learning_time = (user.total_learning_time or 0) + 1
-        user.last_active = datetime.utcnow()
-        
-        update_response = update_difficulty_internal(user_id, accuracy)
-        
-        db.session.commit()
+        update_response = update_difficulty_internal(user_id, accuracy, learning_time=1, activity='listening')
         
-        return jsonify({
+        response = commit_submission({
             'accuracy': accuracy,
             'score': accuracy * 100,
             'difficulty_level': current_difficulty,
             'new_difficulty': update_response.get('new_difficulty', current_difficulty),
             'ml_available': ML_AVAILABLE
-        }), 200
+        })
+        
+        publish_user_event(user, 'test_result', {
+            'test_result_id': test_result.id,
+            'test_type': test_result.test_type,
+            'score': test_result.score,
+            'accuracy': test_result.accuracy,
+            'words_per_minute': test_result.words_per_minute,
+            'difficulty_level': test_result.difficulty_level,
+            'date': test_result.created_at.isoformat()
+        })
+        publish_submission_events(
+            user, update_response.get('previous_difficulty', current_difficulty), first_session_today
+        )
+        
+        return response
         
+    except ConcurrentUpdateError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-def update_difficulty_internal(user_id, score):
-    try:
-        user = User.query.get(user_id)
+class ConcurrentUpdateError(Exception):
+    pass
+
+DIFFICULTY_UPDATE_RETRIES = 8
+
+def apply_difficulty_update(user_id, score, learning_time=0, activity=None):
+    # Optimistic concurrency instead of row locks: the new state is computed
+    # from the row as read and written with UPDATE ... WHERE version = <read
+    # version>. If another submission for the same user got in first, no row
+    # matches and the update is recomputed from a fresh read. Different users
+    # never wait on each other.
+    for attempt in range(DIFFICULTY_UPDATE_RETRIES):
+        if attempt:
+            time.sleep(random.uniform(0, 0.002 * 2 ** min(attempt, 5)))
+        user = db.session.get(User, user_id, populate_existing=attempt > 0)
         if not user:
-            return {'error': 'User not found'}
+            return None
         
         history = json.loads(user.performance_history or '[]')
         
         recent_scores = [h['score'] for h in history[-3:]] if len(history) >= 3 else [0.5]
         recent_trend = score - np.mean(recent_scores) if recent_scores else 0
         
-        if score < 0.4:
-            user.consecutive_low_scores = (user.consecutive_low_scores or 0) + 1
-        else:
-            user.consecutive_low_scores = 0
+        consecutive_low_scores = (user.consecutive_low_scores or 0) + 1 if score < 0.4 else 0
         
-        adjustment = difficulty_system.predict_adjustment(score, recent_trend, user.consecutive_low_scores or 0)
-        
-        new_difficulty = calculate_new_difficulty(user.current_difficulty, adjustment, score)
+        adjustment = difficulty_system.predict_adjustment(
+            score, recent_trend, consecutive_low_scores, age=user.age, activity=activity
+        )
         
-        user.current_difficulty = new_difficulty
+        previous_difficulty = user.current_difficulty
+        new_difficulty = calculate_new_difficulty(previous_difficulty, adjustment, score)
         
         history.append({
             'timestamp': datetime.utcnow().isoformat(),
@@ -497,18 +1265,55 @@ def update_difficulty_internal(user_id, score):
         if len(history) > 20:
             history = history[-20:]
         
-        user.performance_history = json.dumps(history)
+        values = {
+            'current_difficulty': new_difficulty,
+            'consecutive_low_scores': consecutive_low_scores,
+            'performance_history': json.dumps(history),
+            'version': User.version + 1
+        }
+        if learning_time:
+            values['total_learning_time'] = db.func.coalesce(User.total_learning_time, 0) + learning_time
+            values['last_active'] = datetime.utcnow()
+        
+        updated = db.session.execute(
+            db.update(User)
+            .where(User.id == user_id, User.version == user.version)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if updated:
+            db.session.expire(user)
+            schedule_model_retrain(user.age)
+            return {
+                'user': user,
+                'previous_difficulty': previous_difficulty,
+                'new_difficulty': new_difficulty,
+                'adjustment': adjustment,
+                'consecutive_low_scores': consecutive_low_scores
+            }
+    
+    raise ConcurrentUpdateError(f'Too many concurrent updates for user {user_id}, please retry')
+
+def update_difficulty_internal(user_id, score, learning_time=0, activity=None):
+    try:
+        result = apply_difficulty_update(user_id, score, learning_time, activity)
+        if result is None:
+            return {'error': 'User not found'}
         
         return {
-            'new_difficulty': new_difficulty,
-            'adjustment': adjustment
+            'previous_difficulty': result['previous_difficulty'],
+            'new_difficulty': result['new_difficulty'],
+            'adjustment': result['adjustment']
         }
         
+    except ConcurrentUpdateError:
+        raise
     except Exception as e:
         print(f"Error updating difficulty: {e}")
         return {'error': str(e)}
 
 @app.route('/api/save-game-score', methods=['POST'])
+@idempotent
 def save_game_score():
     try:
         data = request.json
@@ -523,12 +1328,7 @@ def save_game_score():
             
         current_difficulty = user.current_difficulty
         
-        max_scores = {
-            'word_jumble': 110,
-            'memory_match': 60,
-            'spelling_bee': 110
-        }
-        max_score = max_scores.get(game_type, 100)
+        max_score = GAME_MAX_SCORES.get(game_type, 100)
         normalized_score = min(score / max_score, 1.0)
         
         game_score = GameScore(
@@ -542,6 +1342,10 @@ def save_game_score():
         db.session.add(game_score)
         db.session.flush()
         
+        first_session_today = not LearningSession.query.filter_by(
+            user_id=user_id, date=date.today()
+        ).first()
+        
         learning_session = LearningSession(
             user_id=user_id,
             session_type='game',
@@ -551,12 +1355,7 @@ def save_game_score():
         )
         db.session.add(learning_session)
         
-        user.total_learning_time = (user.total_learning_time or 0) + 2
-        user.last_active = datetime.utcnow()
-        
-        update_response = update_difficulty_internal(user_id, normalized_score)
-        
-        db.session.commit()
+        update_response = update_difficulty_internal(user_id, normalized_score, learning_time=2, activity='games')
         
         highest_score = db.session.query(
             db.func.max(GameScore.score)
@@ -567,7 +1366,7 @@ def save_game_score():
         
         is_new_high_score = score > highest_score
         
-        return jsonify({
+        response = commit_submission({
             'message': 'Score saved successfully',
             'is_new_high_score': is_new_high_score,
             'previous_high_score': highest_score,
@@ -575,99 +1374,199 @@ def save_game_score():
             'difficulty_level': current_difficulty,
             'new_difficulty': update_response.get('new_difficulty', current_difficulty),
             'ml_available': ML_AVAILABLE
-        }), 200
+        })
+        
+        publish_user_event(user, 'game_score', {
+            'game_score_id': game_score.id,
+            'game_type': game_type,
+            'score': score,
+            'level': level,
+            'difficulty_level': game_score.difficulty_level,
+            'is_new_high_score': is_new_high_score,
+            'date': game_score.created_at.isoformat()
+        })
+        publish_submission_events(
+            user, update_response.get('previous_difficulty', current_difficulty), first_session_today
+        )
+        
+        return response
+    except ConcurrentUpdateError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def highest_scores_for(user_ids):
+    # Best test and game scores for every user in two grouped queries rather
+    # than one query per user and activity.
+    best = {
+        user_id: {'speech_test': 0, 'listening_test': 0, 'word_jumble': 0, 'memory_match': 0, 'spelling_bee': 0}
+        for user_id in user_ids
+    }
+    if not best:
+        return best
+    
+    tests = db.session.query(TestResult.user_id, TestResult.test_type, db.func.max(TestResult.score))\
+        .filter(TestResult.user_id.in_(best), TestResult.test_type.in_(('speech', 'listening')))\
+        .group_by(TestResult.user_id, TestResult.test_type)
+    for user_id, test_type, score in tests:
+        best[user_id][f'{test_type}_test'] = score or 0
+    
+    games = db.session.query(GameScore.user_id, GameScore.game_type, db.func.max(GameScore.score))\
+        .filter(GameScore.user_id.in_(best), GameScore.game_type.in_(list(GAME_MAX_SCORES)))\
+        .group_by(GameScore.user_id, GameScore.game_type)
+    for user_id, game_type, score in games:
+        best[user_id][game_type] = score or 0
+    
+    return best
+
+def rounded_highest_scores(highest):
+    return dict(highest, speech_test=round(highest['speech_test'], 1),
+                listening_test=round(highest['listening_test'], 1))
+
+def progress_payload(user, highest):
+    # Get all test results
+    test_results = TestResult.query.filter_by(user_id=user.id)\
+        .order_by(TestResult.created_at.desc())\
+        .all()
+    
+    # Get all game scores
+    game_scores = GameScore.query.filter_by(user_id=user.id)\
+        .order_by(GameScore.created_at.desc())\
+        .all()
+    
+    # Format test results
+    formatted_tests = []
+    for test in test_results:
+        formatted_tests.append({
+            'id': test.id,
+            'test_type': test.test_type,
+            'score': test.score,
+            'accuracy': test.accuracy,
+            'words_per_minute': test.words_per_minute,
+            'date': test.created_at.isoformat(),
+            'difficulty_level': test.difficulty_level
+        })
+    
+    # Format game scores
+    formatted_games = []
+    for game in game_scores:
+        formatted_games.append({
+            'id': game.id,
+            'game_type': game.game_type,
+            'score': game.score,
+            'level': game.level,
+            'date': game.created_at.isoformat(),
+            'difficulty_level': game.difficulty_level
+        })
+    
+    # Calculate average score
+    avg_score = 0
+    if test_results:
+        avg_score = sum(t.score for t in test_results) / len(test_results)
+    
+    return {
+        'user_id': user.id,
+        'username': user.username,
+        'test_results': formatted_tests,
+        'game_scores': formatted_games,
+        'highest_scores': rounded_highest_scores(highest),
+        'average_score': round(avg_score, 1),
+        'total_tests': len(test_results),
+        'total_games': len(game_scores),
+        'current_difficulty': user.current_difficulty,
+        'ml_available': ML_AVAILABLE
+    }
+
 # ============ PROGRESS ROUTE - ADDED HERE ============
 @app.route('/api/progress/<int:user_id>', methods=['GET'])
+@coalesce_requests()
+@reporting_read
 def get_progress(user_id):
     try:
         user = User.query.get(user_id)
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Get all test results
-        test_results = TestResult.query.filter_by(user_id=user_id)\
-            .order_by(TestResult.created_at.desc())\
-            .all()
-        
-        # Get all game scores
-        game_scores = GameScore.query.filter_by(user_id=user_id)\
-            .order_by(GameScore.created_at.desc())\
-            .all()
-        
-        # Get highest scores for each test type
-        highest_speech = db.session.query(db.func.max(TestResult.score))\
-            .filter_by(user_id=user_id, test_type='speech').scalar() or 0
-        
-        highest_listening = db.session.query(db.func.max(TestResult.score))\
-            .filter_by(user_id=user_id, test_type='listening').scalar() or 0
-        
-        # Get highest scores for each game
-        highest_word_jumble = db.session.query(db.func.max(GameScore.score))\
-            .filter_by(user_id=user_id, game_type='word_jumble').scalar() or 0
-        
-        highest_memory_match = db.session.query(db.func.max(GameScore.score))\
-            .filter_by(user_id=user_id, game_type='memory_match').scalar() or 0
-        
-        highest_spelling_bee = db.session.query(db.func.max(GameScore.score))\
-            .filter_by(user_id=user_id, game_type='spelling_bee').scalar() or 0
-        
-        # Format test results
-        formatted_tests = []
-        for test in test_results:
-            formatted_tests.append({
-                'id': test.id,
-                'test_type': test.test_type,
-                'score': test.score,
-                'accuracy': test.accuracy,
-                'words_per_minute': test.words_per_minute,
-                'date': test.created_at.isoformat(),
-                'difficulty_level': test.difficulty_level
-            })
-        
-        # Format game scores
-        formatted_games = []
-        for game in game_scores:
-            formatted_games.append({
-                'id': game.id,
-                'game_type': game.game_type,
-                'score': game.score,
-                'level': game.level,
-                'date': game.created_at.isoformat(),
-                'difficulty_level': game.difficulty_level
-            })
-        
-        # Calculate average score
-        avg_score = 0
-        if test_results:
-            avg_score = sum(t.score for t in test_results) / len(test_results)
-        
-        return jsonify({
-            'user_id': user.id,
-            'username': user.username,
-            'test_results': formatted_tests,
-            'game_scores': formatted_games,
-            'highest_scores': {
-                'speech_test': round(highest_speech, 1),
-                'listening_test': round(highest_listening, 1),
-                'word_jumble': highest_word_jumble,
-                'memory_match': highest_memory_match,
-                'spelling_bee': highest_spelling_bee
-            },
-            'average_score': round(avg_score, 1),
-            'total_tests': len(test_results),
-            'total_games': len(game_scores),
-            'current_difficulty': user.current_difficulty,
-            'ml_available': ML_AVAILABLE
-        }), 200
+        return jsonify(progress_payload(user, highest_scores_for([user_id])[user_id])), 200
         
     except Exception as e:
         print(f"Error in get_progress: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def adaptive_sentences(content_type, difficulty):
+    if difficulty < 1.3:
+        if content_type == 'speech_test':
+            sentences = [
+                "The cat sleeps",
+                "We eat food",
+                "Birds fly high",
+                "I love my family",
+                "The sun is bright"
+            ]
+        else:
+            sentences = [
+                "Hello world",
+                "Good morning",
+                "How are you",
+                "Thank you",
+                "See you later"
+            ]
+    elif difficulty < 1.8:
+        if content_type == 'speech_test':
+            sentences = [
+                "The quick brown fox jumps over the lazy dog",
+                "She sells seashells by the seashore",
+                "My little brother loves to play with his red ball",
+                "We visit the library every Saturday to borrow books",
+                "The bright moon shines at night"
+            ]
+        else:
+            sentences = [
+                "The library has many interesting books about animals",
+                "Children should eat healthy food and exercise regularly",
+                "Our planet Earth revolves around the sun",
+                "The curious explorer discovered ancient ruins",
+                "Musicians practice for hours to perfect their performances"
+            ]
+    elif difficulty < 2.3:
+        if content_type == 'speech_test':
+            sentences = [
+                "Despite the inclement weather conditions, the expedition team persevered",
+                "The astrophysicist postulated a revolutionary theory regarding quantum entanglement",
+                "Beneath the phosphorescent bioluminescence of the abyssal trench",
+                "Through meticulous anthropological analysis, researchers deciphered inscriptions",
+                "The symphony's crescendo evoked profound emotional resonance"
+            ]
+        else:
+            sentences = [
+                "Quantum superposition allows particles to exist in multiple states simultaneously",
+                "The geopolitical implications of transcontinental trade agreements necessitate diplomacy",
+                "Neuroplasticity enables cognitive adaptation through synaptic reorganization",
+                "Photosynthetic organisms convert electromagnetic radiation into biochemical energy",
+                "Algorithmic complexity analysis evaluates computational efficiency"
+            ]
+    else:
+        if content_type == 'speech_test':
+            sentences = [
+                "The quintessential manifestation of existential phenomenology transcends conventional epistemological paradigms",
+                "Multifaceted interdisciplinary synergies catalyze unprecedented innovations in quantum computing architectures",
+                "Epistemological deconstruction of hegemonic narratives necessitates dialectical interrogation of ideological presuppositions",
+                "Biopsychosocial models of psychopathology integrate neurobiological, psychological, and sociocultural determinants",
+                "Poststructuralist literary criticism problematizes authorial intentionality and textual determinacy"
+            ]
+        else:
+            sentences = [
+                "The ontological implications of quantum decoherence challenge classical metaphysical assumptions about reality",
+                "Epistemological relativism posits that knowledge claims are contingent upon specific cultural and historical contexts",
+                "Neurophenomenological approaches seek to bridge first-person subjective experience with third-person neuroscientific data",
+                "Sociolinguistic analysis reveals how power dynamics are encoded and reproduced through discursive practices",
+                "The hermeneutic circle describes the iterative process of understanding texts through the interplay of parts and whole"
+            ]
+    
+    return sentences
+
 @app.route('/api/get-adaptive-content/<string:content_type>', methods=['GET'])
 def get_adaptive_content(content_type):
     try:
@@ -679,78 +1578,40 @@ def get_adaptive_content(content_type):
             if user:
                 difficulty = user.current_difficulty
         
-        if difficulty < 1.3:
-            if content_type == 'speech_test':
-                sentences = [
-                    "The cat sleeps",
-                    "We eat food",
-                    "Birds fly high",
-                    "I love my family",
-                    "The sun is bright"
-                ]
-            else:
-                sentences = [
-                    "Hello world",
-                    "Good morning",
-                    "How are you",
-                    "Thank you",
-                    "See you later"
-                ]
-        elif difficulty < 1.8:
-            if content_type == 'speech_test':
-                sentences = [
-                    "The quick brown fox jumps over the lazy dog",
-                    "She sells seashells by the seashore",
-                    "My little brother loves to play with his red ball",
-                    "We visit the library every Saturday to borrow books",
-                    "The bright moon shines at night"
-                ]
-            else:
-                sentences = [
-                    "The library has many interesting books about animals",
-                    "Children should eat healthy food and exercise regularly",
-                    "Our planet Earth revolves around the sun",
-                    "The curious explorer discovered ancient ruins",
-                    "Musicians practice for hours to perfect their performances"
-                ]
-        elif difficulty < 2.3:
-            if content_type == 'speech_test':
-                sentences = [
-                    "Despite the inclement weather conditions, the expedition team persevered",
-                    "The astrophysicist postulated a revolutionary theory regarding quantum entanglement",
-                    "Beneath the phosphorescent bioluminescence of the abyssal trench",
-                    "Through meticulous anthropological analysis, researchers deciphered inscriptions",
-                    "The symphony's crescendo evoked profound emotional resonance"
-                ]
-            else:
-                sentences = [
-                    "Quantum superposition allows particles to exist in multiple states simultaneously",
-                    "The geopolitical implications of transcontinental trade agreements necessitate diplomacy",
-                    "Neuroplasticity enables cognitive adaptation through synaptic reorganization",
-                    "Photosynthetic organisms convert electromagnetic radiation into biochemical energy",
-                    "Algorithmic complexity analysis evaluates computational efficiency"
-                ]
-        else:
-            if content_type == 'speech_test':
-                sentences = [
-                    "The quintessential manifestation of existential phenomenology transcends conventional epistemological paradigms",
-                    "Multifaceted interdisciplinary synergies catalyze unprecedented innovations in quantum computing architectures",
-                    "Epistemological deconstruction of hegemonic narratives necessitates dialectical interrogation of ideological presuppositions",
-                    "Biopsychosocial models of psychopathology integrate neurobiological, psychological, and sociocultural determinants",
-                    "Poststructuralist literary criticism problematizes authorial intentionality and textual determinacy"
-                ]
-            else:
-                sentences = [
-                    "The ontological implications of quantum decoherence challenge classical metaphysical assumptions about reality",
-                    "Epistemological relativism posits that knowledge claims are contingent upon specific cultural and historical contexts",
-                    "Neurophenomenological approaches seek to bridge first-person subjective experience with third-person neuroscientific data",
-                    "Sociolinguistic analysis reveals how power dynamics are encoded and reproduced through discursive practices",
-                    "The hermeneutic circle describes the iterative process of understanding texts through the interplay of parts and whole"
-                ]
+        return jsonify({
+            'content': adaptive_sentences(content_type, difficulty),
+            'difficulty_level': difficulty,
+            'ml_available': ML_AVAILABLE
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/game-round/<string:game_type>', methods=['GET'])
+def get_game_round(game_type):
+    try:
+        if game_type not in GAME_MAX_SCORES:
+            return jsonify({'error': 'Unknown game type'}), 404
+        
+        user_id = request.args.get('user_id', type=int)
+        difficulty = 1.0
+        if user_id:
+            user = User.query.get(user_id)
+            if not user:
+                return jsonify({'error': 'User not found'}), 404
+            difficulty = user.current_difficulty
+        
+        count = request.args.get('count', type=int)
+        if count is not None:
+            count = max(1, min(count, 50))
+        
+        tier, items = word_bank.round(game_type, difficulty, count=count, user_id=user_id)
         
         return jsonify({
-            'content': sentences,
+            'game_type': game_type,
             'difficulty_level': difficulty,
+            'tier': tier,
+            'items': items,
             'ml_available': ML_AVAILABLE
         }), 200
         
@@ -758,6 +1619,8 @@ def get_adaptive_content(content_type):
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/parent-dashboard/<int:parent_id>', methods=['GET'])
+@coalesce_requests(timeout=20.0)
+@reporting_read
 def get_parent_dashboard(parent_id):
     try:
         parent = User.query.get(parent_id)
@@ -767,23 +1630,9 @@ def get_parent_dashboard(parent_id):
         children = User.query.filter_by(parent_id=parent_id).all()
         
         children_data = []
+        highest_scores = highest_scores_for([child.id for child in children])
         
         for child in children:
-            highest_speech = db.session.query(db.func.max(TestResult.score))\
-                .filter_by(user_id=child.id, test_type='speech').scalar() or 0
-            
-            highest_listening = db.session.query(db.func.max(TestResult.score))\
-                .filter_by(user_id=child.id, test_type='listening').scalar() or 0
-            
-            highest_word_jumble = db.session.query(db.func.max(GameScore.score))\
-                .filter_by(user_id=child.id, game_type='word_jumble').scalar() or 0
-            
-            highest_memory_match = db.session.query(db.func.max(GameScore.score))\
-                .filter_by(user_id=child.id, game_type='memory_match').scalar() or 0
-            
-            highest_spelling_bee = db.session.query(db.func.max(GameScore.score))\
-                .filter_by(user_id=child.id, game_type='spelling_bee').scalar() or 0
-            
             recent_tests = TestResult.query.filter_by(user_id=child.id)\
                 .order_by(TestResult.created_at.desc()).limit(5).all()
             
@@ -820,11 +1669,7 @@ def get_parent_dashboard(parent_id):
                 prev_date = learning_date
             
             today = date.today()
-            today_sessions = LearningSession.query.filter_by(
-                user_id=child.id, 
-                date=today
-            ).all()
-            today_learning = sum(session.time_spent for session in today_sessions) // 60
+            today_learning = sum(session.time_spent for session in sessions if session.date == today) // 60
             
             child_data = {
                 'child_id': child.id,
@@ -837,13 +1682,9 @@ def get_parent_dashboard(parent_id):
                 'streak': current_streak,
                 'longest_streak': longest_streak,
                 'today_learning': today_learning,
-                'highest_scores': {
-                    'speech_test': highest_speech,
-                    'listening_test': highest_listening,
-                    'word_jumble': highest_word_jumble,
-                    'memory_match': highest_memory_match,
-                    'spelling_bee': highest_spelling_bee
-                },
+                'highest_scores': highest_scores[child.id],
+                'percentile_ranks': peer_percentiles.ranks(child.id, child.age, highest_scores[child.id]),
+                'peer_group': age_band(child.age),
                 'recent_tests': [
                     {
                         'test_type': test.test_type,
@@ -878,137 +1719,316 @@ def get_parent_dashboard(parent_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def dashboard_payload(user, highest, compact=False):
+    sessions = LearningSession.query.filter_by(user_id=user.id)\
+        .order_by(LearningSession.date.desc()).all()
+    
+    activity_by_date = {}
+    for session in sessions:
+        activity_by_date[session.date] = activity_by_date.get(session.date, 0) + session.time_spent
+    
+    today = date.today()
+    current_streak = 0
+    check_date = today
+    
+    while check_date in activity_by_date:
+        current_streak += 1
+        check_date = check_date - timedelta(days=1)
+    
+    dates = sorted(activity_by_date.keys())
+    longest_streak = 0
+    temp_streak = 0
+    prev_date = None
+    
+    for d in dates:
+        if prev_date is None:
+            temp_streak = 1
+        else:
+            if (d - prev_date).days == 1:
+                temp_streak += 1
+            else:
+                temp_streak = 1
+        longest_streak = max(longest_streak, temp_streak)
+        prev_date = d
+    
+    today_learning = activity_by_date.get(today, 0) // 60
+    
+    start_date, minutes, intensity = learning_heatmap(activity_by_date, today)
+    if compact:
+        learning_blocks = compact_learning_blocks(start_date, minutes, intensity)
+    else:
+        learning_blocks = expand_learning_blocks(start_date, minutes, intensity)
+    
+    performance_history = json.loads(user.performance_history or '[]')
+    
+    recent_scores = [h['score'] for h in performance_history[-5:]] if performance_history else [0]
+    improvement_rate = 0
+    if len(recent_scores) >= 2 and recent_scores[0] > 0:
+        improvement_rate = ((recent_scores[-1] - recent_scores[0]) / recent_scores[0] * 100)
+    
+    dashboard_data = {
+        'user_info': {
+            'username': user.username,
+            'user_id': user.id,
+            'email': user.email,
+            'user_type': user.user_type,
+            'age': user.age,
+            'current_difficulty': user.current_difficulty,
+            'performance_history': columnar_history(performance_history) if compact else performance_history
+        },
+        'highest_scores': rounded_highest_scores(highest),
+        'percentile_ranks': peer_percentiles.ranks(user.id, user.age, highest),
+        'peer_group': age_band(user.age),
+        'learning_metrics': {
+            'streak': current_streak,
+            'longest_streak': longest_streak,
+            'total_learning_time': user.total_learning_time or 0,
+            'today_learning': today_learning,
+            'improvement_rate': round(improvement_rate, 1),
+            'blocks_earned': (user.total_learning_time or 0) // 30,
+            'daily_goal': today_learning >= 60,
+            'daily_goal_target': 60,
+            'current_difficulty': user.current_difficulty,
+            'last_active': user.last_active.isoformat() if user.last_active else None
+        },
+        'learning_blocks': learning_blocks,
+        'ml_available': ML_AVAILABLE
+    }
+    if compact:
+        dashboard_data['format'] = 'compact'
+    
+    return dashboard_data
+
 @app.route('/api/dashboard-data/<int:user_id>', methods=['GET'])
+@coalesce_requests()
+@reporting_read
 def get_dashboard_data(user_id):
     try:
         user = User.query.get(user_id)
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        highest_speech = db.session.query(db.func.max(TestResult.score))\
-            .filter_by(user_id=user_id, test_type='speech').scalar() or 0
-        
-        highest_listening = db.session.query(db.func.max(TestResult.score))\
-            .filter_by(user_id=user_id, test_type='listening').scalar() or 0
-        
-        highest_memory_match = db.session.query(db.func.max(GameScore.score))\
-            .filter_by(user_id=user_id, game_type='memory_match').scalar() or 0
-        
-        highest_word_jumble = db.session.query(db.func.max(GameScore.score))\
-            .filter_by(user_id=user_id, game_type='word_jumble').scalar() or 0
+        highest = highest_scores_for([user_id])[user_id]
+        compact = request.args.get('format') == 'compact'
+        return jsonify(dashboard_payload(user, highest, compact)), 200
         
-        highest_spelling_bee = db.session.query(db.func.max(GameScore.score))\
-            .filter_by(user_id=user_id, game_type='spelling_bee').scalar() or 0
-        
-        sessions = LearningSession.query.filter_by(user_id=user_id)\
-            .order_by(LearningSession.date.desc()).all()
+    except Exception as e:
+        print(f"Error in get_dashboard_data: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+BOOTSTRAP_FIELDS = ('dashboard', 'progress', 'content')
+
+@app.route('/api/bootstrap/<int:user_id>', methods=['GET'])
+@coalesce_requests()
+@reporting_read
+def get_bootstrap(user_id):
+    # The child home screen's dashboard-data, progress and adaptive-content
+    # calls in one response, sharing the user lookup and the highest-scores
+    # query. ?fields= selects sections; each section has the same shape as
+    # the body of the matching endpoint.
+    try:
+        fields = request.args.get('fields')
+        fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else list(BOOTSTRAP_FIELDS)
+        unknown = [f for f in fields if f not in BOOTSTRAP_FIELDS]
+        if unknown:
+            return jsonify({'error': f'Unknown fields: {", ".join(unknown)}'}), 400
         
-        activity_by_date = {}
-        for session in sessions:
-            activity_by_date[session.date] = activity_by_date.get(session.date, 0) + session.time_spent
+        user = User.query.get(user_id)
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
         
-        today = date.today()
-        current_streak = 0
-        check_date = today
+        bootstrap = {
+            'user_id': user.id,
+            'current_difficulty': user.current_difficulty,
+            'ml_available': ML_AVAILABLE
+        }
         
-        while check_date in activity_by_date:
-            current_streak += 1
-            check_date = check_date - timedelta(days=1)
+        if 'dashboard' in fields or 'progress' in fields:
+            highest = highest_scores_for([user_id])[user_id]
+            if 'dashboard' in fields:
+                compact = request.args.get('format') == 'compact'
+                bootstrap['dashboard'] = dashboard_payload(user, highest, compact)
+            if 'progress' in fields:
+                bootstrap['progress'] = progress_payload(user, highest)
+        
+        if 'content' in fields:
+            content_types = request.args.get('content_type') or 'speech_test,listening_test'
+            bootstrap['content'] = {
+                content_type: {
+                    'content': adaptive_sentences(content_type, user.current_difficulty),
+                    'difficulty_level': user.current_difficulty
+                }
+                for content_type in content_types.split(',')
+            }
         
-        dates = sorted(activity_by_date.keys())
-        longest_streak = 0
-        temp_streak = 0
-        prev_date = None
+        return jsonify(bootstrap), 200
         
-        for d in dates:
-            if prev_date is None:
-                temp_streak = 1
-            else:
-                if (d - prev_date).days == 1:
-                    temp_streak += 1
-                else:
-                    temp_streak = 1
-            longest_streak = max(longest_streak, temp_streak)
-            prev_date = d
+    except Exception as e:
+        print(f"Error in get_bootstrap: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analytics/cohort', methods=['GET'])
+def get_cohort_analytics():
+    try:
+        start = request.args.get('start')
+        end = request.args.get('end')
+        group_by = request.args.get('group_by')
+        if group_by not in (None, 'age'):
+            return jsonify({'error': 'group_by must be "age"'}), 400
+        
+        try:
+            start = date.fromisoformat(start) if start else None
+            end = date.fromisoformat(end) if end else None
+        except ValueError:
+            return jsonify({'error': 'start and end must be YYYY-MM-DD dates'}), 400
+        
+        cohort_store.refresh(force=request.args.get('refresh') == '1')
+        
+        stats = cohort_store.cohort_stats(
+            age_min=request.args.get('age_min', type=int),
+            age_max=request.args.get('age_max', type=int),
+            parent_id=request.args.get('parent_id', type=int),
+            start=start,
+            end=end,
+            group_by=group_by
+        )
+        stats['ml_available'] = ML_AVAILABLE
         
-        today_sessions = LearningSession.query.filter_by(
-            user_id=user_id, 
-            date=today
-        ).all()
-        today_learning = sum(s.time_spent for s in today_sessions) // 60
+        return jsonify(stats), 200
         
-        end_date = today
-        start_date = end_date - timedelta(days=149)
+    except Exception as e:
+        print(f"Error in get_cohort_analytics: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+TIMESERIES_METRICS = ('score', 'accuracy', 'words_per_minute', 'difficulty')
+TIMESERIES_MAX_POINTS = 2000
+
+def load_user_timeseries(user_id, start, end):
+    # Fetch only the charted columns; tests and games are merged into one
+    # time-ordered set of columns with NaN where a metric does not apply.
+    window_end = datetime.combine(end + timedelta(days=1), datetime.min.time())
+    window_start = datetime.combine(start, datetime.min.time())
+    
+    tests = db.session.query(
+        TestResult.created_at, TestResult.score, TestResult.accuracy,
+        TestResult.words_per_minute, TestResult.difficulty_level
+    ).filter(
+        TestResult.user_id == user_id,
+        TestResult.created_at >= window_start,
+        TestResult.created_at < window_end
+    ).all()
+    
+    games = db.session.query(
+        GameScore.created_at, GameScore.game_type, GameScore.score, GameScore.difficulty_level
+    ).filter(
+        GameScore.user_id == user_id,
+        GameScore.created_at >= window_start,
+        GameScore.created_at < window_end
+    ).all()
+    
+    nan = float('nan')
+    timestamps = [t[0] for t in tests] + [g[0] for g in games]
+    columns = {
+        'score': [t[1] for t in tests] + [
+            min(g[2] / GAME_MAX_SCORES.get(g[1], 100), 1.0) * 100 for g in games
+        ],
+        'accuracy': [t[2] for t in tests] + [nan] * len(games),
+        'words_per_minute': [nan if t[3] is None else t[3] for t in tests] + [nan] * len(games),
+        'difficulty': [t[4] for t in tests] + [g[3] for g in games]
+    }
+    
+    timestamps = np.array(timestamps, dtype='datetime64[s]')
+    order = np.argsort(timestamps, kind='stable')
+    return timestamps[order], {
+        name: np.array([nan if v is None else v for v in values], dtype=np.float64)[order]
+        for name, values in columns.items()
+    }
+
+@app.route('/api/timeseries/<int:user_id>', methods=['GET'])
+@reporting_read
+def get_timeseries(user_id):
+    try:
+        user = User.query.get(user_id)
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
         
-        learning_blocks = []
-        for i in range(150):
-            block_date = end_date - timedelta(days=149 - i)
-            minutes = activity_by_date.get(block_date, 0)
-            
-            if minutes == 0:
-                intensity = 0
-            elif minutes < 15:
-                intensity = 1
-            elif minutes < 30:
-                intensity = 2
-            elif minutes < 60:
-                intensity = 3
+        try:
+            end = date.fromisoformat(request.args['end']) if request.args.get('end') else date.today()
+            start = date.fromisoformat(request.args['start']) if request.args.get('start') \
+                else end - timedelta(days=89)
+        except ValueError:
+            return jsonify({'error': 'start and end must be YYYY-MM-DD dates'}), 400
+        if start > end:
+            return jsonify({'error': 'start must not be after end'}), 400
+        
+        bucket = request.args.get('bucket')
+        if bucket is not None and bucket not in BUCKETS:
+            return jsonify({'error': f'bucket must be one of {", ".join(BUCKETS)}'}), 400
+        
+        points = request.args.get('points', TIMESERIES_MAX_POINTS // 4, type=int)
+        points = max(3, min(points, TIMESERIES_MAX_POINTS))
+        
+        metrics = request.args.get('metrics')
+        metrics = metrics.split(',') if metrics else list(TIMESERIES_METRICS)
+        unknown = [m for m in metrics if m not in TIMESERIES_METRICS]
+        if unknown:
+            return jsonify({'error': f'Unknown metrics: {", ".join(unknown)}'}), 400
+        
+        timestamps, columns = load_user_timeseries(user_id, start, end)
+        
+        series = {}
+        for metric in metrics:
+            if bucket:
+                t, values = bucket_mean(timestamps, columns[metric], bucket)
+                t = [d.isoformat() for d in t.tolist()]
             else:
-                intensity = 4
-            
-            learning_blocks.append({
-                'date': block_date.isoformat(),
-                'minutes': minutes,
-                'intensity': intensity,
-                'filled': minutes > 0
-            })
-        
-        performance_history = json.loads(user.performance_history or '[]')
-        
-        recent_scores = [h['score'] for h in performance_history[-5:]] if performance_history else [0]
-        improvement_rate = 0
-        if len(recent_scores) >= 2 and recent_scores[0] > 0:
-            improvement_rate = ((recent_scores[-1] - recent_scores[0]) / recent_scores[0] * 100)
-        
-        dashboard_data = {
-            'user_info': {
-                'username': user.username,
-                'user_id': user.id,
-                'email': user.email,
-                'user_type': user.user_type,
-                'age': user.age,
-                'current_difficulty': user.current_difficulty,
-                'performance_history': performance_history
-            },
-            'highest_scores': {
-                'speech_test': round(highest_speech, 1),
-                'listening_test': round(highest_listening, 1),
-                'word_jumble': highest_word_jumble,
-                'memory_match': highest_memory_match,
-                'spelling_bee': highest_spelling_bee
-            },
-            'learning_metrics': {
-                'streak': current_streak,
-                'longest_streak': longest_streak,
-                'total_learning_time': user.total_learning_time or 0,
-                'today_learning': today_learning,
-                'improvement_rate': round(improvement_rate, 1),
-                'blocks_earned': (user.total_learning_time or 0) // 30,
-                'daily_goal': today_learning >= 60,
-                'daily_goal_target': 60,
-                'current_difficulty': user.current_difficulty,
-                'last_active': user.last_active.isoformat() if user.last_active else None
-            },
-            'learning_blocks': learning_blocks,
-            'ml_available': ML_AVAILABLE
-        }
+                t, values = downsample(timestamps, columns[metric], points)
+                t = [ts.isoformat() for ts in t.tolist()]
+            series[metric] = {
+                'timestamps': t,
+                'values': [round(v, 3) for v in values.tolist()]
+            }
         
-        return jsonify(dashboard_data), 200
+        return jsonify({
+            'user_id': user_id,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'mode': 'bucket' if bucket else 'lttb',
+            'bucket': bucket,
+            'points': None if bucket else points,
+            'raw_points': int(len(timestamps)),
+            'current_difficulty': user.current_difficulty,
+            'series': series
+        }), 200
         
     except Exception as e:
-        print(f"Error in get_dashboard_data: {str(e)}")
+        print(f"Error in get_timeseries: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/events/<int:user_id>', methods=['GET'])
+def stream_events(user_id):
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Invalid Last-Event-ID'}), 400
+    
+    # Release the pooled connection; the stream itself never touches the DB.
+    db.session.remove()
+    
+    return Response(
+        event_hub.stream([user_id], last_event_id),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
 @app.route('/api/change-password', methods=['POST'])
 def change_password():
     try:
@@ -1050,14 +2070,309 @@ def forgot_password():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/metrics/coalescing', methods=['GET'])
+def get_coalescing_metrics():
+    return jsonify(request_flights.stats()), 200
+
+@app.route('/api/admin/profiler/requests', methods=['POST'])
+@admin_required
+def start_request_profiling():
+    try:
+        data = request.get_json(silent=True) or {}
+        endpoints = data.get('endpoints') or []
+        if isinstance(endpoints, str):
+            endpoints = [endpoints]
+        if not endpoints:
+            return jsonify({'error': 'endpoints is required'}), 400
+        
+        rate = float(data.get('rate', 0.1))
+        max_requests = int(data.get('max_requests', 200))
+        if not 0 < rate <= 1 or max_requests < 1:
+            return jsonify({'error': 'rate must be in (0, 1] and max_requests positive'}), 400
+        
+        profile = request_profiler.start(app, endpoints, rate=rate, max_requests=max_requests)
+        return jsonify(profile.summary()), 201
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        print(f"Error in start_request_profiling: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/profiler/requests', methods=['DELETE'])
+@admin_required
+def stop_request_profiling():
+    profile = request_profiler.stop(app)
+    if profile is None:
+        return jsonify({'error': 'Request profiling is not running'}), 404
+    return jsonify(profile.summary()), 200
+
+@app.route('/api/admin/profiler/sample', methods=['POST'])
+@admin_required
+def start_sampling_profiler():
+    try:
+        data = request.get_json(silent=True) or {}
+        duration = float(data.get('duration', 30))
+        interval_ms = float(data.get('interval_ms', 10))
+        if duration <= 0 or interval_ms <= 0:
+            return jsonify({'error': 'duration and interval_ms must be positive'}), 400
+        
+        profile = sampling_profiler.start(duration=duration, interval=interval_ms / 1000.0)
+        return jsonify(profile.summary()), 201
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        print(f"Error in start_sampling_profiler: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/profiler/sample', methods=['DELETE'])
+@admin_required
+def stop_sampling_profiler():
+    if not sampling_profiler.active:
+        return jsonify({'error': 'No sampling session is running'}), 404
+    sampling_profiler.stop()
+    return jsonify({'message': 'Sampling session stopping'}), 202
+
+@app.route('/api/admin/profiles', methods=['GET'])
+@admin_required
+def list_profiles():
+    return jsonify({
+        'profiles': profile_store.list(),
+        'request_profiling': request_profiler.active,
+        'sampling': sampling_profiler.active
+    }), 200
+
+@app.route('/api/admin/profiles/<string:profile_id>', methods=['GET'])
+@admin_required
+def get_profile(profile_id):
+    profile = profile_store.get(profile_id)
+    if not profile:
+        return jsonify({'error': 'Profile not found'}), 404
+    limit = request.args.get('limit', 30, type=int)
+    return jsonify({**profile.summary(), 'top_functions': profile.top_functions(limit)}), 200
+
+@app.route('/api/admin/profiles/<string:profile_id>/collapsed', methods=['GET'])
+@admin_required
+def download_collapsed_profile(profile_id):
+    profile = profile_store.get(profile_id)
+    if not profile:
+        return jsonify({'error': 'Profile not found'}), 404
+    return Response(profile.collapsed(), mimetype='text/plain', headers={
+        'Content-Disposition': f'attachment; filename=profile-{profile.id}.collapsed.txt'
+    })
+
+@app.route('/api/admin/replica', methods=['GET'])
+@admin_required
+def get_replica_status():
+    if replica is None:
+        return jsonify({'error': 'The replica is not available with sharding enabled'}), 404
+    return jsonify(replica.status()), 200
+
+@app.route('/api/admin/replica/refresh', methods=['POST'])
+@admin_required
+def refresh_replica():
+    if replica is None:
+        return jsonify({'error': 'The replica is not available with sharding enabled'}), 404
+    try:
+        return jsonify(replica.refresh(force=True)), 200
+    except Exception as e:
+        print(f"Error in refresh_replica: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/snapshot', methods=['POST'])
+@admin_required
+def create_snapshot():
+    try:
+        backup_dir = os.environ.get('BACKUP_DIR', os.path.join(app.instance_path, 'backups'))
+        os.makedirs(backup_dir, exist_ok=True)
+        
+        if shard_router.enabled:
+            engines = {f'shard{shard:03d}': shard_router.engine(shard) for shard in shard_router.shard_ids()}
+            engines['catalog'] = shard_router.catalog
+        else:
+            engines = {'dyslexia': db.engine}
+        
+        stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+        snapshots = [
+            snapshot(engine.url.database, os.path.join(backup_dir, f'{name}-{stamp}.db'))
+            for name, engine in engines.items()
+        ]
+        return jsonify({'snapshots': snapshots}), 201
+        
+    except Exception as e:
+        print(f"Error in create_snapshot: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/metrics/models', methods=['GET'])
+def get_model_metrics():
+    if not ML_AVAILABLE:
+        return jsonify({'ml_available': False}), 200
+    return jsonify({
+        'ml_available': True,
+        'global_version': difficulty_system.model_version,
+        'cohort_cache': difficulty_system.cohort_models.stats()
+    }), 200
+
 @app.route('/api/test', methods=['GET'])
 def test():
     return jsonify({
         'message': 'Backend is working!',
         'status': 'success',
-        'ml_available': ML_AVAILABLE
+        'ml_available': ML_AVAILABLE,
+        'model_version': difficulty_system.model_version
     }), 200
 
+@app.cli.command('shard-split')
+def shard_split_command():
+    """Copy the single-file database into SHARD_COUNT tenant shards."""
+    if not shard_router.enabled:
+        print("Set SHARD_COUNT to the number of shards to create.")
+        return
+    if shard_router.catalog_size():
+        print(f"Shard catalog in {shard_router.directory} is not empty; refusing to split again.")
+        return
+    
+    tables = {
+        table.name: table for table in db.metadata.sorted_tables
+        if table.name == 'user' or 'user_id' in table.c
+    }
+    counts = split_database(db.engine, shard_router, tables)
+    for shard, users in sorted(counts.items()):
+        print(f"shard {shard}: {users} users -> {shard_router.shard_path(shard)}")
+
+@app.cli.command('snapshot')
+@click.argument('path')
+def snapshot_command(path):
+    """Copy the live database to PATH without stopping the app."""
+    with app.app_context():
+        info = snapshot(db.engine.url.database, os.path.abspath(path))
+    print(f"Wrote {info['pages']} pages to {info['path']} in {info['duration']}s "
+          f"({info['restarts']} restarts)")
+
+@app.cli.command('train-models')
+@click.option('--band', 'bands', multiple=True,
+              help='Age band to train (repeatable); default is every band plus the global model.')
+def train_models_command(bands):
+    """Retrain the per-cohort and global difficulty models now."""
+    if not ML_AVAILABLE:
+        print("scikit-learn is not installed; nothing to train.")
+        return
+    targets = list(bands) or list(AGE_BAND_RANGES) + [None]
+    with app.app_context():
+        for band in targets:
+            if band is not None and band not in AGE_BAND_RANGES:
+                print(f"Unknown band {band}; choose from {', '.join(AGE_BAND_RANGES)}")
+                continue
+            started = time.perf_counter()
+            results = difficulty_system.retrain(band, load_training_sequences(band))
+            for key, result in results.items():
+                detail = f"v{result['version']}" if result['trained'] else 'skipped (too little data)'
+                print(f"{key}: {result['samples']} samples, {detail}")
+            print(f"  {band or 'global'} done in {time.perf_counter() - started:.2f}s")
+
+@app.cli.command('rebuild-percentiles')
+def rebuild_percentiles_command():
+    """Rebuild the peer score distributions from scratch."""
+    started = time.perf_counter()
+    with app.app_context():
+        peer_percentiles.rebuild()
+    stats = peer_percentiles.stats()
+    print(f"{stats['children']} children loaded in {time.perf_counter() - started:.2f}s")
+    for name, size in stats['distributions'].items():
+        print(f"  {name}: {size}")
+
+@app.cli.command('check-percentiles')
+def check_percentiles_command():
+    """Compare peer percentile ranks against exact ranks from the database."""
+    with app.app_context():
+        peer_percentiles.refresh(force=True)
+        # Bands come from User.age here, not from the structure under check.
+        bands = {}
+        exact_best = {}
+        for scope in shard_scopes():
+            with scope:
+                bands.update(
+                    (user_id, age_band(age)) for user_id, age in db.session.query(User.id, User.age)
+                    .filter(User.user_type == 'child')
+                )
+                for user_id, test_type, score in db.session.query(
+                    TestResult.user_id, TestResult.test_type, db.func.max(TestResult.score)
+                ).group_by(TestResult.user_id, TestResult.test_type):
+                    exact_best[(user_id, f'{test_type}_test')] = score
+                for user_id, game_type, score in db.session.query(
+                    GameScore.user_id, GameScore.game_type, db.func.max(GameScore.score)
+                ).group_by(GameScore.user_id, GameScore.game_type):
+                    exact_best[(user_id, game_type)] = score
+        result = peer_percentiles.check(exact_best, bands)
+    print(f"{result['comparisons']} ranks compared, max error {result['max_error']} percentile points")
+
+@app.cli.command('import-roster')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--school', default=None, help='School (tenant) name when sharding is enabled.')
+def import_roster_command(path, school):
+    """Register every child in a CSV roster (username,email,password,age)."""
+    with open(path, encoding='utf-8-sig') as f:
+        rows = parse_roster_csv(f.read())
+    
+    scope = shard_router.use_shard(*shard_router.tenant_for(school)) if shard_router.enabled else nullcontext()
+    started = time.perf_counter()
+    with scope:
+        report = import_roster(rows)
+    
+    for entry in report:
+        detail = entry.get('error') or f"user_id={entry['user_id']} parent={entry['parent_username']}"
+        print(f"{entry['row']:>5} {entry['username'] or '-':<24} {entry['status']:<8} {detail}")
+    created = sum(1 for entry in report if entry['status'] == 'created')
+    print(f"{created}/{len(report)} created in {time.perf_counter() - started:.2f}s")
+
+@app.cli.command('simulate-policy')
+@click.option('--learners', default=10000, help='Simulated learners.')
+@click.option('--sessions', default=100, help='Sessions per learner.')
+@click.option('--workers', default=1, help='Processes to split the population across.')
+@click.option('--seed', default=0)
+@click.option('--model-version', type=int, default=None,
+              help='Registry version to use instead of the live model.')
+@click.option('--model-path', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='Joblib or pickle file with a candidate model; it is not published.')
+@click.option('--rule-based', is_flag=True, help='Simulate the rule-based fallback policy.')
+@click.option('--low', type=float, default=None, help='Low score threshold.')
+@click.option('--high', type=float, default=None, help='High score threshold.')
+@click.option('--consecutive', type=int, default=None, help='Consecutive low scores before forcing a decrease.')
+def simulate_policy_command(learners, sessions, workers, seed, model_version, model_path, rule_based,
+                            low, high, consecutive):
+    """Run the difficulty policy against a synthetic learner population."""
+    if sum(bool(option) for option in (model_version, model_path, rule_based)) > 1:
+        raise click.UsageError('Use only one of --model-version, --model-path and --rule-based.')
+    
+    params = PolicyParams(
+        low_score_threshold=difficulty_system.low_score_threshold if low is None else low,
+        high_score_threshold=difficulty_system.high_score_threshold if high is None else high,
+        consecutive_threshold=difficulty_system.consecutive_threshold if consecutive is None else consecutive
+    )
+    
+    model = None
+    if ML_AVAILABLE and not rule_based:
+        if model_path:
+            # joblib.load also reads plain pickles such as difficulty_model.pkl.
+            model = joblib.load(model_path)
+        elif model_version:
+            model = difficulty_system.registry.load(model_version)
+        else:
+            model = difficulty_system.model
+    
+    started = time.perf_counter()
+    report = simulate(SimulatedPolicy(model, params), learners=learners, sessions=sessions,
+                      seed=seed, workers=workers)
+    report['model_version'] = model_version or (difficulty_system.model_version if model and not model_path else None)
+    report['model_path'] = model_path
+    report['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+    print(json.dumps(report, indent=2))
+
 if __name__ == '__main__':
     print(f"ML Available: {ML_AVAILABLE}")
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,114 @@
+"""One bootstrap call against the separate home screen calls.
+
+Seeds a child with a mixed submission history, then times opening the
+child home screen both ways:
+
+* ``separate``: ``/api/dashboard-data``, ``/api/progress`` and
+  ``/api/get-adaptive-content`` for speech and listening, the calls the
+  Dashboard, Progress and Tests components make
+* ``bootstrap``: one ``/api/bootstrap`` call returning the same data
+
+The frontend does not call ``/api/bootstrap`` yet. Each of those components
+is its own route and fetches only its own data, so this measures what a
+client loading all of it up front would save.
+
+For each it reports the requests made, the SQL statements run and the
+milliseconds per home screen open.
+
+Run from ``backend/``::
+
+    python bench/bootstrap.py
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(directory):
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'dyslexia.db')}",
+        'MODEL_REGISTRY_DIR': os.path.join(directory, 'models'),
+        'REPLICA_INTERVAL': '0',
+    })
+    os.environ.pop('SHARD_COUNT', None)
+    sys.path.insert(0, BACKEND_DIR)
+    import app
+    return app
+
+
+def seed_child(client, games, submissions):
+    user_id = client.post('/api/register', json={
+        'username': 'bench', 'email': 'bench@bench.example', 'password': 'bench',
+        'user_type': 'child', 'age': 9,
+    }).get_json()['user_id']
+    rng = random.Random(0)
+    for _ in range(submissions):
+        client.post('/api/speech-test', json={'user_id': user_id, 'spoken_text': 'the cat sat',
+                                              'original_text': rng.choice(['the cat sat', 'the bat sat'])})
+        client.post('/api/listening-test', json={'user_id': user_id, 'typed_text': 'a big dog',
+                                                 'original_text': rng.choice(['a big dog', 'a dig bog'])})
+        client.post('/api/save-game-score', json={'user_id': user_id, 'game_type': rng.choice(games),
+                                                  'score': rng.randint(10, 100)})
+    return user_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--submissions', type=int, default=30, help='Submissions of each kind to seed.')
+    parser.add_argument('--repeat', type=int, default=200, help='Home screen opens timed per variant.')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench-bootstrap-')
+    try:
+        backend = load_app(directory)
+        client = backend.app.test_client()
+        user_id = seed_child(client, list(backend.GAME_MAX_SCORES), args.submissions)
+
+        variants = {
+            'separate': [
+                f'/api/dashboard-data/{user_id}',
+                f'/api/progress/{user_id}',
+                f'/api/get-adaptive-content/speech_test?user_id={user_id}',
+                f'/api/get-adaptive-content/listening_test?user_id={user_id}',
+            ],
+            'bootstrap': [f'/api/bootstrap/{user_id}'],
+        }
+
+        statements = [0]
+
+        def count_statement(*args):
+            statements[0] += 1
+
+        with backend.app.app_context():
+            engine = backend.db.engine
+        event.listen(engine, 'before_cursor_execute', count_statement)
+
+        print(f"{'variant':<10} {'requests':>8} {'statements':>10} {'ms/open':>8}")
+        for name, urls in variants.items():
+            for url in urls:
+                assert client.get(url).status_code == 200, url
+            statements[0] = 0
+            for url in urls:
+                client.get(url)
+            per_open = statements[0]
+
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                for url in urls:
+                    client.get(url)
+            elapsed = (time.perf_counter() - started) / args.repeat * 1000
+            print(f"{name:<10} {len(urls):>8} {per_open:>10} {elapsed:>8.2f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
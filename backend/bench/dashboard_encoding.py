@@ -0,0 +1,113 @@
+"""Bytes and CPU of the dashboard-data formats.
+
+Seeds one child with a learning session on most of the last 150 days and a
+full performance history, then measures ``/api/dashboard-data`` in the
+default and ``?format=compact`` encodings, each uncompressed, gzip and (when
+the ``brotli`` package is installed) brotli. For every variant it reports
+the bytes sent, the time per request end to end, and the time spent
+serializing and compressing the payload alone. The payload is built once,
+so the last column leaves out the database reads that every variant
+shares.
+
+Run from ``backend/``::
+
+    python bench/dashboard_encoding.py
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(directory):
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'dyslexia.db')}",
+        'MODEL_REGISTRY_DIR': os.path.join(directory, 'models'),
+        'REPLICA_INTERVAL': '0',
+    })
+    os.environ.pop('SHARD_COUNT', None)
+    sys.path.insert(0, BACKEND_DIR)
+    import app
+    return app
+
+
+def seed_child(backend, submissions):
+    client = backend.app.test_client()
+    user_id = client.post('/api/register', json={
+        'username': 'bench', 'email': 'bench@bench.example', 'password': 'bench',
+        'user_type': 'child', 'age': 9,
+    }).get_json()['user_id']
+    rng = random.Random(0)
+    for _ in range(submissions):
+        client.post('/api/update-difficulty', json={'user_id': user_id, 'score': rng.random()})
+    with backend.app.app_context():
+        today = date.today()
+        backend.db.session.add_all(
+            backend.LearningSession(user_id=user_id, session_type='game', activity_id=0,
+                                    time_spent=rng.randint(60, 3600), date=today - timedelta(days=day))
+            for day in range(150) if rng.random() < 0.8
+        )
+        backend.db.session.commit()
+    return user_id
+
+
+def per_call(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--submissions', type=int, default=200, help='Submissions in the child\'s history.')
+    parser.add_argument('--repeat', type=int, default=200, help='Requests timed per variant.')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench-dashboard-')
+    try:
+        backend = load_app(directory)
+        user_id = seed_child(backend, args.submissions)
+        client = backend.app.test_client()
+
+        encodings = [('identity', None), ('gzip', lambda data: gzip.compress(data, compresslevel=5))]
+        if backend.brotli is not None:
+            encodings.append(('br', lambda data: backend.brotli.compress(data, quality=4)))
+
+        print(f"{'format':<8} {'encoding':<9} {'bytes':>7} {'ms/request':>10} {'ms/encode':>9}")
+        for name, compact in (('full', False), ('compact', True)):
+            url = f'/api/dashboard-data/{user_id}' + ('?format=compact' if compact else '')
+            with backend.app.test_request_context():
+                user = backend.db.session.get(backend.User, user_id)
+                highest = backend.highest_scores_for([user_id])[user_id]
+                payload = backend.dashboard_payload(user, highest, compact)
+
+                for encoding, compress in encodings:
+                    def encode():
+                        data = backend.jsonify(payload).get_data()
+                        return compress(data) if compress else data
+
+                    response = client.get(url, headers={'Accept-Encoding': encoding})
+                    assert response.headers.get('Content-Encoding', 'identity') == encoding
+                    request_ms = per_call(lambda: client.get(url, headers={'Accept-Encoding': encoding}),
+                                          args.repeat)
+                    encode_ms = per_call(encode, args.repeat)
+                    print(f"{name:<8} {encoding:<9} {len(response.data):>7} {request_ms:>10.3f} {encode_ms:>9.3f}")
+
+        full = json.loads(client.get(f'/api/dashboard-data/{user_id}').data)
+        print(f"{len(full['learning_blocks'])} heatmap days, "
+              f"{len(full['user_info']['performance_history'])} history entries")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Prediction latency of the per-cohort difficulty models.
+
+Publishes an SVC for every cohort (each age band, alone and per activity),
+then times ``predict_adjustment`` when:
+
+* ``global``: the learner has no age, so the global model is used
+* ``hit``: the cohort's model is already in the worker's LRU
+* ``miss``: the LRU is empty, so the model is loaded from the registry
+* ``skewed``: requests spread over every cohort with a few hot ones (a
+  Zipf-like mix, as when most learners are in a couple of age bands) while
+  the memory budget only holds about half of the models, so cold cohorts
+  get evicted
+
+Run from ``backend/``::
+
+    python bench/model_cache.py
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(directory):
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'dyslexia.db')}",
+        'MODEL_REGISTRY_DIR': os.path.join(directory, 'models'),
+        'REPLICA_INTERVAL': '0',
+    })
+    os.environ.pop('SHARD_COUNT', None)
+    sys.path.insert(0, BACKEND_DIR)
+    import app
+    return app
+
+
+def per_call_us(fn, repeat):
+    started = time.perf_counter()
+    for i in range(repeat):
+        fn(i)
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--samples', type=int, default=2000, help='Training rows per cohort model.')
+    parser.add_argument('--repeat', type=int, default=500)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench-models-')
+    try:
+        backend = load_app(directory)
+        if not backend.ML_AVAILABLE:
+            sys.exit('scikit-learn is not installed')
+        from cohort_models import ACTIVITIES, AGE_BAND_RANGES, CohortModelCache
+        system = backend.difficulty_system
+
+        rng = np.random.default_rng(0)
+        cohorts = []
+        for band, (low, high) in AGE_BAND_RANGES.items():
+            age = high if low is None else low
+            for activity in (None,) + ACTIVITIES:
+                X = rng.random((args.samples, 2)) * [1, 0.6] - [0, 0.3]
+                y = (X[:, 0] + X[:, 1] + rng.normal(0, 0.1, len(X)) > 0.6).astype(int)
+                model = backend.SVC(kernel='rbf', probability=True, C=1.0, gamma='scale').fit(X, y)
+                key = band if activity is None else f'{band}-{activity}'
+                system.cohort_models.publish(key, model)
+                cohorts.append((age, activity))
+        root = system.cohort_models.root
+
+        def predict(age, activity):
+            return system.predict_adjustment(0.8, 0.1, 0, age=age, activity=activity)
+
+        results = {'global': per_call_us(lambda i: predict(None, None), args.repeat)}
+
+        predict(9, 'speech')
+        results['hit'] = per_call_us(lambda i: predict(9, 'speech'), args.repeat)
+
+        def miss(i):
+            system.cohort_models = CohortModelCache(root)
+            predict(9, 'speech')
+        results['miss'] = per_call_us(miss, args.repeat // 5)
+
+        system.cohort_models = CohortModelCache(root)
+        for age, activity in cohorts:
+            predict(age, activity)
+        full = system.cohort_models.stats()['bytes']
+        system.cohort_models = CohortModelCache(root, budget_bytes=full // 2)
+        weights = 1.0 / np.arange(1, len(cohorts) + 1)
+        mix = rng.choice(len(cohorts), size=args.repeat, p=weights / weights.sum())
+        results['skewed'] = per_call_us(lambda i: predict(*cohorts[mix[i]]), args.repeat)
+        stats = system.cohort_models.stats()
+
+        print(f"{len(cohorts)} cohort models, {full / 1024:.0f} KiB loaded in all")
+        print(f"{'case':<9} {'us/predict':>10}")
+        for case, us in results.items():
+            print(f"{case:<9} {us:>10.1f}")
+        lookups = stats['hits'] + stats['misses']
+        print(f"skewed: {stats['hits']}/{lookups} lookups hit, {stats['evictions']} evictions, "
+              f"{stats['bytes'] / 1024:.0f}/{stats['budget_bytes'] / 1024:.0f} KiB held")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
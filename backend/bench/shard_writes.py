@@ -0,0 +1,125 @@
+"""Submission write throughput against the number of shards.
+
+For each shard count this starts a fresh set of shard files, registers
+``--children`` children in each of ``--schools`` schools (one tenant each),
+then runs one worker process per school. Each worker posts
+``--submissions`` game scores for its own school's children. The workers
+start together and the script reports submissions per second over the
+whole run, from the first worker starting to the last one finishing.
+
+Worker processes stand in for the server's worker processes. With a single
+shard they all queue on the one SQLite write lock. With more shards a
+school only waits for the schools on its own shard. Scaling tops out at
+the number of CPU cores, because each submission also spends CPU time in
+the view.
+
+Run from ``backend/``::
+
+    python bench/shard_writes.py --shards 1,2,4,8
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(directory, shard_count):
+    os.environ.update({
+        'SHARD_COUNT': str(shard_count),
+        'SHARD_DIR': directory,
+        'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'main.db')}",
+        'MODEL_REGISTRY_DIR': os.path.join(directory, 'models'),
+        'REPLICA_INTERVAL': '0',
+    })
+    sys.path.insert(0, BACKEND_DIR)
+    import app
+    return app.app
+
+
+def register_schools(directory, shard_count, schools, children, results):
+    client = load_app(directory, shard_count).test_client()
+    rosters = []
+    for school in range(schools):
+        user_ids = []
+        for child in range(children):
+            name = f's{school}c{child}'
+            response = client.post('/api/register', json={
+                'username': name, 'email': f'{name}@bench.example', 'password': 'bench',
+                'user_type': 'child', 'age': 9, 'school': f'school-{school}',
+            })
+            user_ids.append(response.get_json()['user_id'])
+        rosters.append(user_ids)
+    results.put(rosters)
+
+
+def submit_scores(directory, shard_count, user_ids, submissions, barrier, results):
+    client = load_app(directory, shard_count).test_client()
+    barrier.wait()
+    started = time.perf_counter()
+    errors = 0
+    for i in range(submissions):
+        response = client.post('/api/save-game-score', json={
+            'user_id': user_ids[i % len(user_ids)], 'game_type': 'word_jumble', 'score': 40 + i % 60,
+        })
+        errors += response.status_code != 200
+    results.put((started, time.perf_counter(), errors))
+
+
+def run(shard_count, schools, children, submissions):
+    context = multiprocessing.get_context('spawn')
+    directory = tempfile.mkdtemp(prefix=f'bench-shards-{shard_count}-')
+    try:
+        results = context.Queue()
+        setup = context.Process(target=register_schools,
+                                args=(directory, shard_count, schools, children, results))
+        setup.start()
+        rosters = results.get()
+        setup.join()
+
+        barrier = context.Barrier(schools)
+        workers = [
+            context.Process(target=submit_scores,
+                            args=(directory, shard_count, user_ids, submissions, barrier, results))
+            for user_ids in rosters
+        ]
+        for worker in workers:
+            worker.start()
+        timings = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    elapsed = max(t[1] for t in timings) - min(t[0] for t in timings)
+    total = schools * submissions
+    return {
+        'shards': shard_count,
+        'submissions': total,
+        'errors': sum(t[2] for t in timings),
+        'seconds': round(elapsed, 3),
+        'per_second': round(total / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--shards', default='1,2,4,8', help='Comma-separated shard counts.')
+    parser.add_argument('--schools', type=int, default=8, help='Schools, and so worker processes.')
+    parser.add_argument('--children', type=int, default=5, help='Children per school.')
+    parser.add_argument('--submissions', type=int, default=100, help='Submissions per worker.')
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.schools} workers x {args.submissions} submissions")
+    print(f"{'shards':>6} {'submissions':>11} {'errors':>6} {'seconds':>8} {'per second':>10}")
+    for shard_count in [int(n) for n in args.shards.split(',')]:
+        r = run(shard_count, args.schools, args.children, args.submissions)
+        print(f"{r['shards']:>6} {r['submissions']:>11} {r['errors']:>6} {r['seconds']:>8} {r['per_second']:>10}")
+
+
+if __name__ == '__main__':
+    main()
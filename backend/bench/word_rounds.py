@@ -0,0 +1,87 @@
+"""Game round throughput of the word bank.
+
+Serves rounds for every game at every difficulty tier, cycling through
+``--users`` users so the recently-served windows fill up as they do in
+production. It reports rounds per second for ``WordBank.round`` alone and,
+per game, for ``/api/game-round`` including the user lookup and JSON
+encoding.
+
+Run from ``backend/``::
+
+    python bench/word_rounds.py
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from word_bank import SPELLING_TIERS, TIER_BOUNDARIES, WordBank  # noqa: E402
+
+GAMES = ('spelling_bee', 'memory_match', 'word_jumble')
+# One difficulty inside each tier.
+TIER_DIFFICULTIES = [TIER_BOUNDARIES[0] - 0.2] + [b + 0.1 for b in TIER_BOUNDARIES]
+
+
+def rounds_per_second(serve, rounds):
+    started = time.perf_counter()
+    for i in range(rounds):
+        serve(i)
+    return rounds / (time.perf_counter() - started)
+
+
+def load_app(directory):
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'dyslexia.db')}",
+        'MODEL_REGISTRY_DIR': os.path.join(directory, 'models'),
+        'REPLICA_INTERVAL': '0',
+    })
+    os.environ.pop('SHARD_COUNT', None)
+    import app
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rounds', type=int, default=20000, help='Rounds per game and tier.')
+    parser.add_argument('--requests', type=int, default=1000, help='Endpoint requests per game.')
+    parser.add_argument('--users', type=int, default=1000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    bank = WordBank(seed=0)
+    print(f"word bank loaded in {(time.perf_counter() - started) * 1000:.1f} ms: "
+          f"{len(bank.words)} words, {len(bank.sentences)} sentences")
+
+    print(f"{'game':<13} " + ' '.join(f'tier {t:<5}' for t in range(len(SPELLING_TIERS))) + '  (rounds/s)')
+    for game in GAMES:
+        rates = [
+            rounds_per_second(lambda i: bank.round(game, difficulty, user_id=i % args.users), args.rounds)
+            for difficulty in TIER_DIFFICULTIES
+        ]
+        print(f"{game:<13} " + ' '.join(f'{rate:>10.0f}' for rate in rates))
+
+    directory = tempfile.mkdtemp(prefix='bench-rounds-')
+    try:
+        backend = load_app(directory)
+        client = backend.app.test_client()
+        user_id = client.post('/api/register', json={
+            'username': 'bench', 'email': 'bench@bench.example', 'password': 'bench',
+            'user_type': 'child', 'age': 9,
+        }).get_json()['user_id']
+        print(f"{'endpoint':<13} rounds/s")
+        for game in GAMES:
+            rate = rounds_per_second(
+                lambda i: client.get(f'/api/game-round/{game}?user_id={user_id}'), args.requests
+            )
+            print(f"{game:<13} {rate:>8.0f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""Difficulty models per learner cohort.
+
+A cohort is an age band (see ``age_bands``), optionally narrowed to one
+activity (speech, listening or games). Every cohort model lives in its own ``ModelRegistry``
+under ``<root>/cohorts/<key>``, so cohorts are versioned, published and
+hot-reloaded exactly like the global model.
+
+``CohortModelCache`` keeps the registries of recently used cohorts in an
+LRU. The LRU is bounded by the estimated size of the models it holds
+rather than by the number of cohorts, and cold cohorts are dropped first.
+A cohort without a published model is cached as a miss until its next
+registry check, so that lookups fall through to the next cohort quickly.
+
+``retrain_cohorts`` fits and publishes models given only the registry root,
+so the app runs it in a separate process and every worker picks the new
+versions up on its next registry check.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from sklearn.svm import SVC
+
+from age_bands import AGE_BAND_RANGES, age_band  # noqa: F401
+from model_registry import ModelRegistry
+
+ACTIVITIES = ('speech', 'listening', 'games')
+MIN_COHORT_SAMPLES = 50
+
+
+def cohort_keys(age, activity=None):
+    """Cohort keys to try for a learner, most specific first."""
+    band = age_band(age)
+    if band is None:
+        return []
+    keys = [band]
+    if activity in ACTIVITIES:
+        keys.insert(0, f'{band}-{activity}')
+    return keys
+
+
+def training_examples(sequences, activity=None):
+    """Build ``(X, y)`` from per-learner submission sequences.
+
+    Each sequence is a list of ``(score, difficulty, activity)`` in time
+    order, scores normalised to 0-1 and difficulty as it was when the
+    submission was made. Features match ``predict_adjustment``: the score
+    and its trend against the previous three scores (or 0.5 before there
+    are three). The label is whether difficulty went up after the
+    submission. With ``activity`` set, only that activity's submissions
+    become examples, but the labels still come from the full sequence.
+    """
+    X = []
+    y = []
+    for sequence in sequences:
+        scores = [s[0] for s in sequence]
+        for i in range(len(sequence) - 1):
+            score, difficulty, kind = sequence[i]
+            if activity is not None and kind != activity:
+                continue
+            baseline = np.mean(scores[i - 3:i]) if i >= 3 else 0.5
+            X.append([score, score - baseline])
+            y.append(1 if sequence[i + 1][1] > difficulty else 0)
+    return np.array(X, dtype=np.float64).reshape(-1, 2), np.array(y, dtype=np.int64)
+
+
+def retrain_cohorts(root, band, sequences):
+    """Fit and publish the models of one age band, or the global model.
+
+    ``sequences`` are as for ``training_examples``. Returns per-cohort
+    results: samples used, and the published version when trained.
+    """
+    if band is None:
+        targets = [('global', None)]
+    else:
+        targets = [(band, None)] + [(f'{band}-{activity}', activity) for activity in ACTIVITIES]
+
+    results = {}
+    for key, activity in targets:
+        X, y = training_examples(sequences, activity)
+        # Too little data (or only one outcome) and the cohort keeps
+        # falling back to the next model in model_for().
+        if len(X) < MIN_COHORT_SAMPLES or len(set(y)) < 2:
+            results[key] = {'trained': False, 'samples': len(X)}
+            continue
+
+        model = SVC(kernel='rbf', probability=True, C=1.0, gamma='scale')
+        model.fit(X, y)
+        metadata = {'source': 'retrain', 'cohort': key, 'samples': len(X)}
+        registry = ModelRegistry(root) if band is None else ModelRegistry(root, os.path.join('cohorts', key))
+        results[key] = {'trained': True, 'samples': len(X), 'version': registry.publish(model, metadata)}
+    return results
+
+
+def model_nbytes(model):
+    """Approximate resident size of a fitted estimator's array attributes."""
+    if model is None:
+        return 0
+    return sum(value.nbytes for value in vars(model).values() if isinstance(value, np.ndarray))
+
+
+class _Entry:
+    __slots__ = ('registry', 'size')
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.size = 0
+
+
+class CohortModelCache:
+    def __init__(self, root, budget_bytes=64 * 1024 * 1024, check_interval=2.0):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.check_interval = check_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def registry(self, key):
+        return ModelRegistry(self.root, os.path.join('cohorts', key), check_interval=self.check_interval)
+
+    def _entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            entry = self._entries[key] = _Entry(self.registry(key))
+            return entry
+
+    def get(self, key):
+        """Return ``(version, model)`` for a cohort, ``(None, None)`` if it has none."""
+        entry = self._entry(key)
+        # Loading happens outside the cache lock so a slow load of one cohort
+        # does not hold up lookups of the others.
+        version, model = entry.registry.get()
+        size = model_nbytes(model)
+        if size != entry.size:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    self._bytes += size - entry.size
+                    entry.size = size
+                    self._evict(keep=key)
+        return version, model
+
+    def _evict(self, keep):
+        while self._bytes > self.budget_bytes and len(self._entries) > 1:
+            key, entry = next(iter(self._entries.items()))
+            if key == keep:
+                self._entries.move_to_end(key)
+                continue
+            del self._entries[key]
+            self._bytes -= entry.size
+            self.evictions += 1
+
+    def publish(self, key, model, metadata=None):
+        with self._lock:
+            entry = self._entries.get(key)
+        registry = entry.registry if entry is not None else self.registry(key)
+        return registry.publish(model, metadata)
+
+    def manifest(self, key):
+        registry = self.registry(key)
+        version = registry.current_version()
+        return registry.manifest(version) if version is not None else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'cohorts_cached': len(self._entries),
+                'models_loaded': sum(1 for e in self._entries.values() if e.size),
+                'bytes': self._bytes,
+                'budget_bytes': self.budget_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,285 @@
+"""Server-Sent Events pub/sub for live dashboard updates.
+
+Submission endpoints publish small delta events (new test result, new game
+score, difficulty or streak change) to per-user channels, and
+``/api/events/<user_id>`` streams them to the browser so dashboards do not
+have to re-fetch their whole payload to notice something new.
+
+Every event gets an increasing id from the broker, which is what clients send
+back as ``Last-Event-ID`` to resume after a reconnect. Two brokers are
+provided:
+
+* ``InProcessBroker`` keeps a bounded ring of recent events in memory. It is
+  enough when the API runs as a single process.
+* ``SQLiteBroker`` stores events in a small local SQLite file shared by all
+  worker processes on a host. One poller thread per process reads new rows
+  once and fans them out to that process's streams, so events published by
+  any worker reach streams served by every other worker.
+
+Open streams do not poll anything themselves: each waits on its own
+channels, and a publish wakes only the streams subscribed to the event's
+channels. Under
+gevent workers that means an idle connection costs a greenlet rather than
+an OS thread, so each worker can hold thousands of them. ``app.run`` is a
+threaded development server and uses a thread per stream; serve streams in
+production with (from ``backend/``)::
+
+    EVENT_BROKER_URL=sqlite:///instance/events.db \
+        gunicorn -k gevent --worker-connections 4000 -w 4 -b 0.0.0.0:5000 app:app
+
+The gevent worker patches ``threading`` before the app is imported, so the
+brokers' locks, events and poller thread become greenlet-aware with no changes
+here.
+
+Broker ids are only meaningful to the broker that issued them. An
+``InProcessBroker`` starts again from 0 when its process restarts, and each
+process has its own counter, so a client can come back with a
+``Last-Event-ID`` the broker has not reached. Such a stream is sent a
+``reset`` event and continues from the broker's current position.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+
+HEARTBEAT_SECONDS = 15
+RETRY_MILLISECONDS = 3000
+
+
+class _Fanout:
+    """Recent events in memory, and the streams waiting on each channel.
+
+    Both brokers keep the newest events in a bounded ring ordered by id. A
+    stream reading what it missed walks the ring from the newest end and
+    stops at its last id. A waiting stream registers on its own channels
+    only, so a publish wakes just the streams it concerns.
+    """
+
+    def __init__(self, history):
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=history)
+        self._last_id = 0
+        self._dropped_through = 0
+        self._channel_last = {}
+        self._waiters = {}
+
+    def _append(self, event_id, channels, event_type, payload):
+        # Called with self._lock held.
+        if len(self._events) == self._events.maxlen:
+            self._dropped_through = self._events[0][0]
+        self._events.append((event_id, channels, event_type, payload))
+        self._last_id = event_id
+        for channel in channels:
+            self._channel_last[channel] = event_id
+            for waiter in self._waiters.get(channel, ()):
+                waiter.set()
+
+    def _recent_since(self, last_id, channels):
+        # Called with self._lock held. Ids in the ring only increase.
+        events = []
+        for event_id, event_channels, event_type, payload in reversed(self._events):
+            if event_id <= last_id:
+                break
+            if not event_channels.isdisjoint(channels):
+                events.append((event_id, event_type, payload))
+        events.reverse()
+        return events
+
+    def latest_id(self):
+        return self._last_id
+
+    def wait(self, last_id, channels, timeout):
+        """Block until ``channels`` have an event after ``last_id``.
+
+        Returns False if ``timeout`` passed first.
+        """
+        waiter = threading.Event()
+        with self._lock:
+            if any(self._channel_last.get(channel, 0) > last_id for channel in channels):
+                return True
+            for channel in channels:
+                self._waiters.setdefault(channel, set()).add(waiter)
+        try:
+            return waiter.wait(timeout)
+        finally:
+            with self._lock:
+                for channel in channels:
+                    waiters = self._waiters.get(channel)
+                    if waiters is not None:
+                        waiters.discard(waiter)
+                        if not waiters:
+                            del self._waiters[channel]
+
+
+class InProcessBroker(_Fanout):
+    def __init__(self, history=4096):
+        super().__init__(history)
+
+    def publish(self, channels, event_type, payload):
+        with self._lock:
+            event_id = self._last_id + 1
+            self._append(event_id, frozenset(channels), event_type, payload)
+            return event_id
+
+    def read_since(self, last_id, channels):
+        """Return (events, complete); complete is False when history was lost."""
+        with self._lock:
+            return self._recent_since(last_id, channels), last_id >= self._dropped_through
+
+
+class SQLiteBroker(_Fanout):
+    """Events shared between processes through a SQLite file.
+
+    Each process's poller reads the rows added since its last poll once,
+    decodes their channels once, and fans them out to local streams through
+    the in-memory ring. Only a stream resuming from before the ring's oldest
+    event reads the table, with its channels matched in SQL.
+    """
+
+    def __init__(self, path, history=20000, poll_interval=0.5, memory_history=4096):
+        super().__init__(memory_history)
+        self.path = path
+        self.history = history
+        self.poll_interval = poll_interval
+        self._db_lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS event ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' channels TEXT NOT NULL,'
+            ' event_type TEXT NOT NULL,'
+            ' payload TEXT NOT NULL,'
+            ' created_at REAL NOT NULL)'
+        )
+        self._conn.commit()
+        with self._db_lock:
+            self._last_id = self._conn.execute('SELECT COALESCE(MAX(id), 0) FROM event').fetchone()[0]
+        # Events from before this process started are only in the table.
+        self._dropped_through = self._last_id
+        self._poller = None
+
+    def publish(self, channels, event_type, payload):
+        with self._db_lock:
+            cursor = self._conn.execute(
+                'INSERT INTO event (channels, event_type, payload, created_at) VALUES (?, ?, ?, ?)',
+                (json.dumps(sorted(channels)), event_type, payload, time.time())
+            )
+            event_id = cursor.lastrowid
+            if event_id % 500 == 0:
+                self._conn.execute('DELETE FROM event WHERE id <= ?', (event_id - self.history,))
+            self._conn.commit()
+        # Fan out now rather than at the next poll, together with anything
+        # other processes published before this event.
+        self._poll_once()
+        return event_id
+
+    def read_since(self, last_id, channels):
+        with self._lock:
+            if last_id >= self._dropped_through:
+                return self._recent_since(last_id, channels), True
+
+        channels = list(channels)
+        with self._db_lock:
+            oldest = self._conn.execute('SELECT MIN(id) FROM event').fetchone()[0]
+            rows = self._conn.execute(
+                'SELECT id, event_type, payload FROM event WHERE id > ? AND EXISTS ('
+                ' SELECT 1 FROM json_each(event.channels)'
+                f' WHERE json_each.value IN ({", ".join("?" * len(channels))})'
+                ') ORDER BY id',
+                [last_id] + channels
+            ).fetchall()
+        return [tuple(row) for row in rows], oldest is None or oldest <= last_id + 1
+
+    def wait(self, last_id, channels, timeout):
+        self._ensure_poller()
+        return super().wait(last_id, channels, timeout)
+
+    def _poll_once(self):
+        # Rows are read in id order, and SQLite assigns ids in commit order,
+        # so nothing committed below the last polled id can appear later.
+        with self._poll_lock:
+            with self._db_lock:
+                rows = self._conn.execute(
+                    'SELECT id, channels, event_type, payload FROM event WHERE id > ? ORDER BY id',
+                    (self._last_id,)
+                ).fetchall()
+            if not rows:
+                return
+            events = [(event_id, frozenset(json.loads(channels)), event_type, payload)
+                      for event_id, channels, event_type, payload in rows]
+            with self._lock:
+                for event in events:
+                    self._append(*event)
+
+    def _ensure_poller(self):
+        if self._poller is not None:
+            return
+        with self._poll_lock:
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name='sse-broker-poller', daemon=True)
+                self._poller.start()
+
+    def _poll(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self._poll_once()
+            except sqlite3.Error as e:
+                print(f"Error polling event broker: {e}")
+
+
+def create_broker(url=None):
+    """Build a broker from a URL: ``memory://`` (default) or ``sqlite:///path``."""
+    if not url or url.startswith('memory://'):
+        return InProcessBroker()
+    if url.startswith('sqlite:///'):
+        return SQLiteBroker(url[len('sqlite:///'):])
+    raise ValueError(f'Unsupported event broker URL: {url}')
+
+
+def format_event(event_id, event_type, payload):
+    return f'id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n'
+
+
+class EventHub:
+    def __init__(self, broker):
+        self.broker = broker
+
+    def publish(self, channels, event_type, data):
+        return self.broker.publish(channels, event_type, json.dumps(data))
+
+    def stream(self, channels, last_event_id=None, heartbeat=HEARTBEAT_SECONDS):
+        """Yield SSE frames for ``channels``, resuming after ``last_event_id``."""
+        channels = frozenset(channels)
+        yield f'retry: {RETRY_MILLISECONDS}\n\n'
+
+        if last_event_id is None:
+            last_id = self.broker.latest_id()
+        elif last_event_id > self.broker.latest_id():
+            # The id came from another broker (or from before a restart).
+            # Nothing it would skip is known to have been seen.
+            last_id = self.broker.latest_id()
+            yield format_event(last_id, 'reset', '{}')
+        else:
+            last_id = last_event_id
+            _, complete = self.broker.read_since(last_id, channels)
+            if not complete:
+                # The client missed more than the broker retains; tell it to
+                # re-fetch the full payload instead of replaying a partial gap.
+                last_id = self.broker.latest_id()
+                yield format_event(last_id, 'reset', '{}')
+
+        while True:
+            # Read the broker position first so that nothing published while
+            # we scan can be skipped by advancing past it.
+            latest = self.broker.latest_id()
+            events, _ = self.broker.read_since(last_id, channels)
+            for event_id, event_type, payload in events:
+                yield format_event(event_id, event_type, payload)
+            last_id = max(last_id, latest, *(e[0] for e in events))
+
+            if not events and not self.broker.wait(last_id, channels, heartbeat):
+                yield ': keepalive\n\n'
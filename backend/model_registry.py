@@ -0,0 +1,178 @@
+"""Versioned on-disk registry for the difficulty models.
+
+Layout of a registry directory::
+
+    <root>/<name>/v000001.joblib   model artifact (joblib, uncompressed)
+    <root>/<name>/v000001.json     manifest: version, sha256, size, metadata
+    <root>/<name>/CURRENT          version number of the active model
+
+Publishing writes the artifact and manifest under temporary names and
+renames them into place before the ``CURRENT`` pointer is replaced, so a
+reader never sees a half-written model. Every worker process stats
+``CURRENT`` at most once per ``check_interval`` seconds and hot-swaps to a
+newly published version without a restart. Artifacts are memory-mapped on
+load so the NumPy arrays inside a model are shared through the page cache
+instead of being copied into every worker. The mapping is copy-on-write
+(``mmap_mode='c'``) because libsvm rejects read-only buffers even though it
+never writes to them.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import joblib
+
+_ARTIFACT = re.compile(r'^v(\d{6})\.joblib$')
+
+
+class ModelChecksumError(Exception):
+    pass
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    def __init__(self, root, name='difficulty', check_interval=2.0, keep_versions=10, mmap_mode='c'):
+        self.directory = os.path.join(root, name)
+        self.check_interval = check_interval
+        self.keep_versions = keep_versions
+        self.mmap_mode = mmap_mode
+        self._lock = threading.Lock()
+        self._model = None
+        self._version = None
+        self._pointer_stat = None
+        self._next_check = 0.0
+        os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def _pointer_path(self):
+        return os.path.join(self.directory, 'CURRENT')
+
+    def _artifact_path(self, version):
+        return os.path.join(self.directory, f'v{version:06d}.joblib')
+
+    def _manifest_path(self, version):
+        return os.path.join(self.directory, f'v{version:06d}.json')
+
+    def versions(self):
+        return sorted(int(m.group(1)) for m in map(_ARTIFACT.match, os.listdir(self.directory)) if m)
+
+    def current_version(self):
+        try:
+            with open(self._pointer_path) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def manifest(self, version):
+        with open(self._manifest_path(version)) as f:
+            return json.load(f)
+
+    def _write_atomic(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def publish(self, model, metadata=None):
+        """Store ``model`` as a new version and make it current."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-', suffix='.joblib')
+        os.close(fd)
+        try:
+            joblib.dump(model, tmp_path)
+            checksum = _sha256(tmp_path)
+            size = os.path.getsize(tmp_path)
+
+            # os.link fails if the name exists, which makes claiming a version
+            # number safe when several workers publish at the same time.
+            version = (self.versions() or [0])[-1] + 1
+            while True:
+                try:
+                    os.link(tmp_path, self._artifact_path(version))
+                    break
+                except FileExistsError:
+                    version += 1
+        finally:
+            os.unlink(tmp_path)
+
+        self._write_atomic(self._manifest_path(version), json.dumps({
+            'version': version,
+            'sha256': checksum,
+            'size': size,
+            'created_at': datetime.utcnow().isoformat(),
+            'metadata': metadata or {}
+        }))
+        self._write_atomic(self._pointer_path, str(version))
+        self._prune(version)
+        # Let this process see its own publish on the next get().
+        self._next_check = 0.0
+        return version
+
+    def _prune(self, current):
+        for version in self.versions()[:-self.keep_versions]:
+            if version == current:
+                continue
+            for path in (self._artifact_path(version), self._manifest_path(version)):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def load(self, version):
+        path = self._artifact_path(version)
+        expected = self.manifest(version)['sha256']
+        if _sha256(path) != expected:
+            raise ModelChecksumError(f'Checksum mismatch for model version {version}')
+        return joblib.load(path, mmap_mode=self.mmap_mode)
+
+    def _pointer_changed(self):
+        try:
+            st = os.stat(self._pointer_path)
+        except FileNotFoundError:
+            return False, None
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        return signature != self._pointer_stat, signature
+
+    def get(self):
+        """Return ``(version, model)``, reloading if a new version was published."""
+        # A registry with nothing published yet is checked no more often
+        # than one with a model, so lookups of cohorts without a model stay
+        # off the lock and the filesystem between checks.
+        now = time.monotonic()
+        if now < self._next_check:
+            return self._version, self._model
+
+        with self._lock:
+            if now >= self._next_check:
+                self._next_check = now + self.check_interval
+                changed, signature = self._pointer_changed()
+                if changed or self._model is None:
+                    version = self.current_version()
+                    if version is not None and version != self._version:
+                        try:
+                            self._model = self.load(version)
+                            self._version = version
+                        except (OSError, ModelChecksumError) as e:
+                            # Keep serving the previous model; the next check
+                            # retries once the artifact is readable.
+                            print(f"Error loading model version {version}: {e}")
+                            return self._version, self._model
+                    self._pointer_stat = signature
+            return self._version, self._model
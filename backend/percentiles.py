@@ -0,0 +1,263 @@
+"""Peer percentile ranks of children's best scores.
+
+For every age band (see ``age_bands``) and activity (the keys
+of the dashboards' ``highest_scores``) this keeps the best score of every
+child in the band as a sorted NumPy array. A percentile rank is then two
+binary searches:
+
+    rank = 100 * (peers below + half of peers equal) / peers
+
+Result rows are append-only, so new ones are read past an id watermark
+per table and database (one per shard), as in ``analytics``. Only a
+child's new best changes the distributions: its old value is removed and
+the new one inserted in place. When a batch changes a large share of a
+distribution, that distribution is re-sorted from scratch instead. Users
+are re-read on every refresh so a birthday that moves a child into the
+next band moves its scores with it.
+
+Refreshing reads every child, so it never runs on the request path:
+``start`` runs it every ``min_interval`` seconds on a background thread
+(the app starts it on its first request), and requests read whatever the
+last refresh built. Until the first refresh finishes, ranks are ``None``.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+
+import numpy as np
+
+from age_bands import AGE_BANDS, age_band
+from replica import read_target
+
+ACTIVITIES = ('speech_test', 'listening_test', 'word_jumble', 'memory_match', 'spelling_bee')
+MIN_PEERS = 5
+
+
+def _activity(kind, value):
+    return f'{value}_test' if kind == 'test' else value
+
+
+def percentile_rank(sorted_scores, score):
+    n = len(sorted_scores)
+    if n == 0:
+        return None
+    below = np.searchsorted(sorted_scores, score, side='left')
+    equal = np.searchsorted(sorted_scores, score, side='right') - below
+    return 100.0 * (below + 0.5 * equal) / n
+
+
+def _remove_sorted(values, removed):
+    """Remove one occurrence of each of ``removed`` from sorted ``values``."""
+    removed = np.sort(removed)
+    positions = np.searchsorted(values, removed, side='left')
+    # Equal values removed together must hit consecutive slots.
+    _, first, counts = np.unique(removed, return_index=True, return_counts=True)
+    positions += np.arange(len(removed)) - np.repeat(first, counts)
+    return np.delete(values, positions)
+
+
+def _insert_sorted(values, added):
+    added = np.sort(added)
+    return np.insert(values, np.searchsorted(values, added), added)
+
+
+class PeerPercentiles:
+    def __init__(self, db, user_model, test_model, game_model, min_interval=10, partitions=None,
+                 min_peers=MIN_PEERS):
+        self.db = db
+        self.User = user_model
+        self.TestResult = test_model
+        self.GameScore = game_model
+        self.min_interval = min_interval
+        self.min_peers = min_peers
+        self.partitions = partitions or (lambda: [nullcontext()])
+        self._lock = threading.Lock()
+        self._last_refresh = 0.0
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._reset()
+
+    def _reset(self):
+        self.bands = {}
+        self.best = {}
+        self.members = defaultdict(dict)
+        self.distributions = {}
+        self.watermarks = {}
+
+    # ---- loading -------------------------------------------------------
+
+    def refresh(self, force=False):
+        with self._lock:
+            if not force and time.monotonic() - self._last_refresh < self.min_interval:
+                return
+            # Always read the primary, even inside a ?consistency=fast
+            # request: children missing from a stale replica would be taken
+            # out of their bands.
+            token = read_target.set(None)
+            try:
+                self._refresh()
+            finally:
+                read_target.reset(token)
+            self._last_refresh = time.monotonic()
+
+    def start(self, app):
+        if self._thread is not None or self.min_interval <= 0:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, args=(app,), name='peer-percentiles',
+                                                daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, app):
+        while not self._stop.is_set():
+            try:
+                with app.app_context():
+                    self.refresh(force=True)
+            except Exception as e:
+                print(f"Error refreshing peer percentiles: {e}")
+            self._stop.wait(self.min_interval)
+
+    def _refresh(self):
+        bands = {}
+        rows = []
+        for partition, scope in enumerate(self.partitions()):
+            with scope:
+                User = self.User
+                bands.update(
+                    (user_id, age_band(age)) for user_id, age in self.db.session.query(User.id, User.age)
+                    .filter(User.user_type == 'child')
+                )
+                rows.extend(self._new_rows(partition, 'test', self.TestResult, self.TestResult.test_type))
+                rows.extend(self._new_rows(partition, 'game', self.GameScore, self.GameScore.game_type))
+        self._apply(bands, rows)
+
+    def rebuild(self):
+        with self._lock:
+            self._reset()
+            self._last_refresh = 0.0
+        self.refresh(force=True)
+
+    def _new_rows(self, partition, kind, model, type_column):
+        query = self.db.session.query(model.id, model.user_id, type_column, model.score)
+        last_id = self.watermarks.get((partition, kind))
+        if last_id is not None:
+            query = query.filter(model.id > last_id)
+        rows = query.order_by(model.id).all()
+        if rows:
+            self.watermarks[(partition, kind)] = rows[-1][0]
+        return [(user_id, _activity(kind, value), score) for _, user_id, value, score in rows]
+
+    def _apply(self, bands, rows):
+        # (band, best score) of every touched child and activity before this
+        # batch, so several new bests in one batch net out to one change.
+        before = {}
+
+        def touch(user_id, activity):
+            if (user_id, activity) not in before:
+                before[(user_id, activity)] = (self.bands.get(user_id), self.best.get((user_id, activity)))
+
+        # Children whose band changed take their best scores with them.
+        # Children who were deleted leave their band, and come back into it
+        # if they reappear, so this walks both the old and the new bands.
+        for user_id in self.bands.keys() | bands.keys():
+            if bands.get(user_id) != self.bands.get(user_id):
+                for activity in ACTIVITIES:
+                    if (user_id, activity) in self.best:
+                        touch(user_id, activity)
+
+        for user_id, activity, score in rows:
+            if activity not in ACTIVITIES or score is None:
+                continue
+            old = self.best.get((user_id, activity))
+            if old is None or score > old:
+                touch(user_id, activity)
+                self.best[(user_id, activity)] = score
+
+        removed = defaultdict(list)
+        added = defaultdict(list)
+        for (user_id, activity), (old_band, old_score) in before.items():
+            new_band = bands.get(user_id)
+            new_score = self.best.get((user_id, activity))
+            if (old_band, old_score) == (new_band, new_score):
+                continue
+            if old_band is not None and old_score is not None:
+                del self.members[(old_band, activity)][user_id]
+                removed[(old_band, activity)].append(old_score)
+            if new_band is not None and new_score is not None:
+                self.members[(new_band, activity)][user_id] = new_score
+                added[(new_band, activity)].append(new_score)
+        self.bands = bands
+
+        for key in set(removed) | set(added):
+            current = self.distributions.get(key, np.empty(0))
+            if (len(removed[key]) + len(added[key])) * 8 > len(current):
+                values = np.fromiter(self.members[key].values(), dtype=np.float64, count=len(self.members[key]))
+                self.distributions[key] = np.sort(values)
+            else:
+                current = _remove_sorted(current, np.array(removed[key], dtype=np.float64))
+                self.distributions[key] = _insert_sorted(current, np.array(added[key], dtype=np.float64))
+
+    # ---- queries -------------------------------------------------------
+
+    def ranks(self, user_id, age, highest_scores):
+        """Percentile rank of each of ``highest_scores`` among the age band.
+
+        ``None`` for activities the child has no score in yet, activities
+        with fewer than ``min_peers`` children in the band, and children
+        without an age.
+        """
+        band = age_band(age)
+        ranks = {}
+        for activity, score in highest_scores.items():
+            values = self.distributions.get((band, activity))
+            if band is None or values is None or len(values) < self.min_peers \
+                    or (user_id, activity) not in self.best:
+                ranks[activity] = None
+            else:
+                ranks[activity] = round(percentile_rank(values, score), 1)
+        return ranks
+
+    def stats(self):
+        return {
+            'children': sum(1 for band in self.bands.values() if band is not None),
+            'distributions': {
+                f'{band}/{activity}': len(self.distributions.get((band, activity), ()))
+                for band in AGE_BANDS for activity in ACTIVITIES
+            },
+        }
+
+    def check(self, exact_best, bands):
+        """Compare against exact ranks computed from ``exact_best``.
+
+        ``exact_best`` maps ``(user_id, activity)`` to the child's best score
+        and ``bands`` maps each child's id to its age band, both as read
+        straight from the database rather than from this structure. Returns
+        the number of comparisons and the largest absolute difference in
+        percentile points.
+        """
+        exact_best = {key: score for key, score in exact_best.items() if key[1] in ACTIVITIES}
+        peers = defaultdict(list)
+        for (user_id, activity), score in exact_best.items():
+            band = bands.get(user_id)
+            if band is not None:
+                peers[(band, activity)].append(score)
+
+        comparisons = 0
+        max_error = 0.0
+        for (user_id, activity), score in exact_best.items():
+            band = bands.get(user_id)
+            if band is None:
+                continue
+            values = peers[(band, activity)]
+            exact = 100.0 * (sum(v < score for v in values) + 0.5 * sum(v == score for v in values)) / len(values)
+            approx = percentile_rank(self.distributions.get((band, activity), np.empty(0)), score)
+            error = abs(exact - approx) if approx is not None else 100.0
+            max_error = max(max_error, error)
+            comparisons += 1
+        return {'comparisons': comparisons, 'max_error': round(max_error, 6)}
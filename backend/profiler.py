@@ -0,0 +1,424 @@
+"""On-demand profiling for diagnosing slow endpoints in production.
+
+Two modes, both started and stopped at runtime from the admin endpoints:
+
+* ``RequestProfiler`` runs cProfile on a configurable fraction of requests
+  to selected endpoints. It works by swapping those endpoints' view
+  functions for profiling wrappers and restores the originals when stopped,
+  so when it is off there is no hook left in the request path at all.
+* ``SamplingProfiler`` runs one background thread for a fixed time and
+  records the stack of every other thread at a fixed interval, so cost is
+  bounded by ``interval`` and the session length rather than request volume.
+
+Both produce a ``Profile``: collapsed stacks (``frame;frame;frame count``,
+the input format of flamegraph.pl and speedscope) plus a top-functions
+table.
+
+Under gunicorn each worker process has its own profilers, so sessions are
+coordinated through ``ProfileStore``'s shared directory. Starting a session
+writes a session file there; every worker checks for it at most once per
+``SYNC_INTERVAL`` (on its next request) and starts or stops its own part to
+match. Each worker writes its part of a profile to the directory, and
+reading a profile merges the parts, so any worker can serve the whole
+profile. A worker's part of a request profile is flushed when it syncs, so
+a worker that has been idle since the session stopped still shows its last
+flushed part. ``max_requests`` applies per worker.
+
+With gevent workers every greenlet runs on the worker's main thread. The
+sampler runs on a native thread (taken from before gevent's patching) so it
+keeps sampling while greenlets run, and each sample shows the greenlet that
+holds the CPU at that moment; greenlets waiting on I/O are not sampled.
+cProfile also follows the thread rather than the greenlet, so a profiled
+request includes whatever other greenlets ran while it waited on I/O.
+"""
+import cProfile
+import glob
+import importlib
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime
+from functools import wraps
+
+MAX_STACK_DEPTH = 128
+MIN_INTERVAL = 0.005
+MAX_DURATION = 300
+KEEP_PROFILES = 10
+SYNC_INTERVAL = 1.0
+
+
+def _original(module, name):
+    """``module.name`` as it was before gevent's monkey-patching, if any."""
+    if 'gevent.monkey' in sys.modules:
+        from gevent.monkey import get_original
+        return get_original(module, name)
+    return getattr(importlib.import_module(module), name)
+
+
+def _frame_label(filename, lineno, name):
+    return f'{name} ({os.path.basename(filename)}:{lineno})'
+
+
+class Profile:
+    def __init__(self, kind, settings, profile_id=None):
+        self.id = profile_id or uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.settings = settings
+        self.started_at = datetime.utcnow()
+        self.finished_at = None
+        self.samples = 0
+        self.unit = 'samples' if kind == 'sampling' else 'microseconds'
+        self.stacks = Counter()
+        # Shared with the sampler's native thread, so not a gevent lock.
+        self.lock = _original('_thread', 'allocate_lock')()
+
+    def to_dict(self):
+        with self.lock:
+            return {**self.summary(), 'stacks': dict(self.stacks)}
+
+    @classmethod
+    def merge(cls, parts):
+        """One profile from the parts written by each worker."""
+        first = parts[0]
+        profile = cls(first['kind'], first['settings'], first['id'])
+        profile.started_at = min(datetime.fromisoformat(p['started_at']) for p in parts)
+        finished = [p['finished_at'] for p in parts]
+        profile.finished_at = None if None in finished else max(map(datetime.fromisoformat, finished))
+        for part in parts:
+            profile.samples += part['samples']
+            profile.stacks.update(part['stacks'])
+        return profile
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stacks)
+
+    def top_functions(self, limit=30):
+        """Self and inclusive totals per function, aggregated from the stacks."""
+        stacks = self.snapshot()
+        self_totals = Counter()
+        inclusive = Counter()
+        for stack, value in stacks.items():
+            frames = stack.split(';')
+            self_totals[frames[-1]] += value
+            for frame in set(frames):
+                inclusive[frame] += value
+        grand_total = sum(stacks.values()) or 1
+        return [
+            {
+                'function': frame,
+                'self': value,
+                'self_percent': round(100.0 * value / grand_total, 2),
+                'inclusive': inclusive[frame],
+                'inclusive_percent': round(100.0 * inclusive[frame] / grand_total, 2),
+            }
+            for frame, value in self_totals.most_common(limit)
+        ]
+
+    def collapsed(self):
+        return ''.join(f'{stack} {value}\n' for stack, value in sorted(self.snapshot().items()))
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'settings': self.settings,
+            'started_at': self.started_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'samples': self.samples,
+            'unit': self.unit,
+        }
+
+
+class ProfileStore:
+    """Profiles and running sessions, shared by every worker through ``directory``.
+
+    Each worker writes its part of a profile to ``<id>.<pid>.json``. A
+    running session is described by ``<kind>.session.json``.
+    """
+
+    def __init__(self, directory, keep=KEEP_PROFILES):
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+
+    def _write(self, path, data):
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, profile):
+        """Write this worker's part of ``profile``."""
+        self._write(os.path.join(self.directory, f'{profile.id}.{os.getpid()}.json'), profile.to_dict())
+        self._prune()
+
+    def _parts(self):
+        parts = defaultdict(list)
+        for path in glob.glob(os.path.join(self.directory, '*.*.json')):
+            name = os.path.basename(path)
+            if not name.endswith('.session.json'):
+                parts[name.split('.')[0]].append(path)
+        return parts
+
+    def _prune(self):
+        by_age = sorted(self._parts().items(), key=lambda item: min(map(os.path.getmtime, item[1])))
+        for _, paths in by_age[:-self.keep]:
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def get(self, profile_id):
+        paths = glob.glob(os.path.join(self.directory, f'{glob.escape(profile_id)}.*.json'))
+        parts = [part for part in map(self._read, paths) if part and part.get('id') == profile_id]
+        return Profile.merge(parts) if parts else None
+
+    def list(self):
+        profiles = [self.get(profile_id) for profile_id in self._parts()]
+        profiles = [p for p in profiles if p is not None]
+        profiles.sort(key=lambda p: p.started_at, reverse=True)
+        return [p.summary() for p in profiles]
+
+    def session(self, kind):
+        """The running ``kind`` session, or None."""
+        session = self._read(os.path.join(self.directory, f'{kind}.session.json'))
+        if session and session.get('deadline') is not None and session['deadline'] <= time.time():
+            return None
+        return session
+
+    def start_session(self, kind, settings, duration=None):
+        if self.session(kind) is not None:
+            return None
+        session = {
+            'id': uuid.uuid4().hex[:12],
+            'settings': settings,
+            'deadline': time.time() + duration if duration is not None else None,
+        }
+        self._write(os.path.join(self.directory, f'{kind}.session.json'), session)
+        return session
+
+    def end_session(self, kind):
+        """Remove the ``kind`` session file; returns the ended session's id."""
+        session = self.session(kind)
+        try:
+            os.remove(os.path.join(self.directory, f'{kind}.session.json'))
+        except OSError:
+            pass
+        return session['id'] if session else None
+
+
+def _collapse_pstats(stats, profile, root):
+    """Turn cProfile's caller graph into collapsed stacks.
+
+    cProfile only records caller -> callee edges, so deeper paths are
+    approximated by splitting each function's time across its callees in
+    proportion to the time spent through each edge.
+    """
+    callees = {}
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    def label(func):
+        filename, lineno, name = func
+        return _frame_label(filename, lineno, name)
+
+    def walk(func, path, budget, depth):
+        cc, nc, tt, ct, callers = stats.stats[func]
+        scale = budget / ct if ct else 0.0
+        self_time = int(tt * scale * 1e6)
+        if self_time:
+            profile.stacks[';'.join(path)] += self_time
+        if depth >= MAX_STACK_DEPTH:
+            return
+        for callee, edge_time in callees.get(func, ()):
+            if label(callee) in path:
+                continue
+            child_budget = edge_time * scale
+            if child_budget * 1e6 >= 1:
+                walk(callee, path + [label(callee)], child_budget, depth + 1)
+
+    roots = [func for func, (cc, nc, tt, ct, callers) in stats.stats.items() if not callers]
+    for func in roots:
+        walk(func, [root, label(func)], stats.stats[func][3], 1)
+
+
+class RequestProfiler:
+    def __init__(self, store):
+        self.store = store
+        self.profile = None
+        self._lock = threading.Lock()
+        self._originals = {}
+        self._app = None
+        self._next_sync = 0.0
+        self._saved_samples = 0
+
+    @property
+    def active(self):
+        return self.store.session('requests') is not None
+
+    def start(self, app, endpoints, rate=0.1, max_requests=200):
+        unknown = [e for e in endpoints if e not in app.view_functions]
+        if unknown:
+            raise ValueError(f'Unknown endpoints: {", ".join(unknown)}')
+        session = self.store.start_session('requests', {
+            'endpoints': list(endpoints), 'rate': rate, 'max_requests': max_requests
+        })
+        if session is None:
+            raise RuntimeError('Request profiling is already running')
+        self.sync(app, force=True)
+        return self.profile or self.store.get(session['id'])
+
+    def stop(self, app):
+        """End the session; returns the profile, or None if none was running."""
+        profile_id = self.store.end_session('requests')
+        self.sync(app, force=True)
+        return self.store.get(profile_id) if profile_id else None
+
+    def sync(self, app, force=False):
+        """Match this worker to the shared session and flush new samples."""
+        now = time.monotonic()
+        if not force and now < self._next_sync:
+            return
+        self._next_sync = now + SYNC_INTERVAL
+        session = self.store.session('requests')
+        with self._lock:
+            if self.profile is not None and (session is None or session['id'] != self.profile.id):
+                self._stop_local()
+            if session is not None and self.profile is None:
+                self._start_local(app, session)
+            elif self.profile is not None and self.profile.samples != self._saved_samples:
+                self._saved_samples = self.profile.samples
+                self.store.save(self.profile)
+
+    def _start_local(self, app, session):
+        settings = session['settings']
+        self.profile = Profile('requests', settings, session['id'])
+        self._app = app
+        for endpoint in settings['endpoints']:
+            view = app.view_functions[endpoint]
+            self._originals[endpoint] = view
+            app.view_functions[endpoint] = self._wrap(endpoint, view, settings['rate'], settings['max_requests'])
+        self._saved_samples = 0
+        self.store.save(self.profile)
+
+    def _wrap(self, endpoint, view, rate, max_requests):
+        profile = self.profile
+
+        @wraps(view)
+        def profiled(*args, **kwargs):
+            if profile.samples >= max_requests or random.random() >= rate:
+                return view(*args, **kwargs)
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(view, *args, **kwargs)
+            finally:
+                with profile.lock:
+                    profile.samples += 1
+                    _collapse_pstats(pstats.Stats(profiler), profile, endpoint)
+        return profiled
+
+    def _stop_local(self):
+        for endpoint, view in self._originals.items():
+            self._app.view_functions[endpoint] = view
+        self._originals = {}
+        profile, self.profile = self.profile, None
+        profile.finished_at = datetime.utcnow()
+        self.store.save(profile)
+
+
+class SamplingProfiler:
+    def __init__(self, store):
+        self.store = store
+        self.profile = None
+        self._stopping = False
+        # Also taken by the sampler's native thread.
+        self._lock = _original('_thread', 'allocate_lock')()
+        self._next_sync = 0.0
+
+    @property
+    def active(self):
+        return self.store.session('sampling') is not None
+
+    def start(self, duration=30.0, interval=0.01):
+        duration = min(float(duration), MAX_DURATION)
+        interval = max(float(interval), MIN_INTERVAL)
+        session = self.store.start_session('sampling', {'duration': duration, 'interval': interval},
+                                           duration=duration)
+        if session is None:
+            raise RuntimeError('A sampling session is already running')
+        self.sync(force=True)
+        return self.profile or self.store.get(session['id'])
+
+    def stop(self):
+        self.store.end_session('sampling')
+        self.sync(force=True)
+
+    def sync(self, force=False):
+        """Start or stop this worker's sampler to match the shared session."""
+        now = time.monotonic()
+        if not force and now < self._next_sync:
+            return
+        self._next_sync = now + SYNC_INTERVAL
+        session = self.store.session('sampling')
+        with self._lock:
+            profile = self.profile
+            if profile is not None and (session is None or session['id'] != profile.id):
+                self._stopping = True
+            elif session is not None and profile is None:
+                self._start_local(session)
+
+    def _start_local(self, session):
+        self.profile = Profile('sampling', session['settings'], session['id'])
+        self._stopping = False
+        self.store.save(self.profile)
+        # A native thread, so under gevent it samples while greenlets run
+        # instead of only getting to run when they yield.
+        _original('_thread', 'start_new_thread')(
+            self._run, (self.profile, session['deadline'], session['settings']['interval'])
+        )
+
+    def _run(self, profile, deadline, interval):
+        own_id = _original('_thread', 'get_ident')()
+        sleep = _original('time', 'sleep')
+        names = {}
+        try:
+            while not self._stopping and time.time() < deadline:
+                for thread in threading.enumerate():
+                    names[thread.ident] = thread.name
+                samples = []
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    stack = []
+                    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                        code = frame.f_code
+                        stack.append(_frame_label(code.co_filename, code.co_firstlineno, code.co_name))
+                        frame = frame.f_back
+                    stack.append(names.get(thread_id, f'thread-{thread_id}'))
+                    samples.append(';'.join(reversed(stack)))
+                with profile.lock:
+                    profile.stacks.update(samples)
+                    profile.samples += 1
+                sleep(interval)
+        finally:
+            profile.finished_at = datetime.utcnow()
+            self.store.save(profile)
+            with self._lock:
+                if self.profile is profile:
+                    self.profile = None
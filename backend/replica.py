@@ -0,0 +1,167 @@
+"""Online snapshots of the SQLite database and a read-only reporting replica.
+
+Snapshots use SQLite's online backup API, copying ``pages`` pages per step
+and pausing between steps so submission writes are never held up for the
+length of a whole copy. If a write lands on the source while a copy is in
+progress, SQLite restarts that copy from the beginning. After
+``max_restarts`` restarts the remaining copy is done in a single step; with
+the source in WAL mode that step only holds a read snapshot, so writers
+still are not blocked.
+
+``Replica`` keeps a copy of the database at ``path`` refreshed every
+``interval`` seconds once ``start`` is called (the app calls it on its
+first request). Each refresh is written to a temporary file and
+renamed over the previous copy, so readers always open a complete file.
+The copy's modification time is set to when the snapshot was taken. That
+makes staleness visible to every worker process, and a worker skips its
+own refresh when another worker has refreshed recently.
+
+Queries go to the replica while ``read_target`` is ``'replica'`` (see
+``RoutingSession.get_bind``).
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+read_target = ContextVar('read_target', default=None)
+
+
+class _Restarted(Exception):
+    pass
+
+
+def snapshot(source_path, target_path, pages=256, pause=0.005, max_restarts=3):
+    """Copy the database at ``source_path`` to ``target_path``.
+
+    The copy is written next to the target and renamed into place. Returns
+    details of the copy.
+    """
+    started = time.time()
+    tmp_path = f'{target_path}.tmp-{os.getpid()}-{threading.get_ident()}'
+    progress = {'steps': 0, 'restarts': 0, 'remaining': None, 'total': 0}
+
+    def on_step(status, remaining, total):
+        progress['steps'] += 1
+        progress['total'] = total
+        restarted = progress['remaining'] is not None and remaining > progress['remaining']
+        progress['remaining'] = remaining
+        if restarted:
+            progress['restarts'] += 1
+            if progress['restarts'] >= max_restarts:
+                raise _Restarted()
+        if remaining and pause:
+            time.sleep(pause)
+
+    source = sqlite3.connect(f'file:{source_path}?mode=ro', uri=True, timeout=10)
+    target = sqlite3.connect(tmp_path)
+    try:
+        try:
+            source.backup(target, pages=pages, progress=on_step)
+        except _Restarted:
+            source.backup(target)
+        # The copy inherits WAL mode from the source, which a read-only
+        # connection cannot open without its -wal/-shm files.
+        target.execute('PRAGMA journal_mode=DELETE')
+        target.close()
+        os.utime(tmp_path, (started, started))
+        os.replace(tmp_path, target_path)
+    except BaseException:
+        target.close()
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    finally:
+        source.close()
+
+    return {
+        'path': target_path,
+        'taken_at': datetime.utcfromtimestamp(started).isoformat(),
+        'duration': round(time.time() - started, 4),
+        'pages': progress['total'],
+        'steps': progress['steps'],
+        'restarts': progress['restarts'],
+        'size': os.path.getsize(target_path),
+    }
+
+
+class Replica:
+    def __init__(self, source_path, path, interval=60.0, pages=256, pause=0.005):
+        self.source_path = source_path
+        self.path = path
+        self.interval = interval
+        self.pages = pages
+        self.pause = pause
+        self.last_snapshot = None
+        self.last_error = None
+        # Separate locks, so creating the engine never waits for a refresh.
+        self._lock = threading.Lock()
+        self._engine_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._engine = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def engine(self):
+        # NullPool: every checkout opens the file afresh, so a refresh
+        # renamed over the replica is picked up by the next query.
+        if self._engine is None:
+            with self._engine_lock:
+                if self._engine is None:
+                    self._engine = create_engine(
+                        f'sqlite:///file:{self.path}?mode=ro&uri=true', poolclass=NullPool
+                    )
+        return self._engine
+
+    def staleness(self):
+        """Seconds since the current replica was taken, or None if there is none."""
+        try:
+            return max(0.0, time.time() - os.stat(self.path).st_mtime)
+        except FileNotFoundError:
+            return None
+
+    def refresh(self, force=False):
+        staleness = self.staleness()
+        if not force and staleness is not None and staleness < self.interval:
+            return None
+        with self._lock:
+            self.last_snapshot = snapshot(self.source_path, self.path, self.pages, self.pause)
+            self.last_error = None
+            return self.last_snapshot
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='replica-refresh', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error refreshing replica: {e}")
+            self._stop.wait(min(self.interval, max(1.0, self.interval - (self.staleness() or 0))))
+
+    def status(self):
+        staleness = self.staleness()
+        return {
+            'path': self.path,
+            'available': staleness is not None,
+            'staleness_seconds': round(staleness, 3) if staleness is not None else None,
+            'interval': self.interval,
+            'last_snapshot': self.last_snapshot,
+            'last_error': self.last_error,
+        }
@@ -0,0 +1,298 @@
+"""Tenant-aware database sharding.
+
+With sharding enabled every tenant (a school, or a single family when no
+school is given) lives in one of ``shard_count`` SQLite files, so a busy
+school only holds the write lock of its own shard. A small catalog database
+records which tenant each user belongs to and which shard each tenant is on:
+
+* ``tenant``    -- tenant id, optional unique name, shard number
+* ``directory`` -- user id, username, email, tenant id
+
+The catalog also allocates user ids, so ids stay globally unique across
+shards and every ``/api/.../<user_id>`` URL keeps working unchanged. The
+shard for a request is kept in the ``current_shard`` context variable, and
+``RoutingSession.get_bind`` in ``app.py`` consults it. Shard engines (each
+with its own connection pool) are created lazily on first use.
+"""
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import (Column, Integer, MetaData, String, Table, create_engine,
+                        event, func, insert, or_, select)
+
+current_shard = ContextVar('current_shard', default=None)
+current_tenant = ContextVar('current_tenant', default=None)
+
+catalog_metadata = MetaData()
+
+tenant_table = Table(
+    'tenant', catalog_metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('name', String(120), unique=True, nullable=True),
+    Column('shard', Integer, nullable=False),
+)
+
+directory_table = Table(
+    'directory', catalog_metadata,
+    Column('user_id', Integer, primary_key=True, autoincrement=True),
+    Column('username', String(80), unique=True, nullable=False),
+    Column('email', String(120), unique=True, nullable=False),
+    Column('tenant_id', Integer, nullable=False, index=True),
+)
+
+
+def _sqlite_url(path):
+    return f'sqlite:///{os.path.abspath(path)}'
+
+
+def enable_wal(engine):
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA busy_timeout=10000')
+        cursor.close()
+
+
+class ShardRouter:
+    def __init__(self, shard_count, directory, metadata, cache_size=50000, migrate=None):
+        self.shard_count = shard_count
+        self.directory = directory
+        self.metadata = metadata
+        # Called with each shard engine when it is first created, to bring
+        # shards made by older versions up to date.
+        self.migrate = migrate
+        self.cache_size = cache_size
+        self._engines = {}
+        self._lock = threading.Lock()
+        self._user_shards = OrderedDict()
+        self._catalog = None
+
+    @property
+    def enabled(self):
+        return self.shard_count > 0
+
+    @property
+    def catalog(self):
+        if self._catalog is None:
+            with self._lock:
+                if self._catalog is None:
+                    os.makedirs(self.directory, exist_ok=True)
+                    engine = create_engine(_sqlite_url(os.path.join(self.directory, 'catalog.db')))
+                    enable_wal(engine)
+                    catalog_metadata.create_all(engine)
+                    self._catalog = engine
+        return self._catalog
+
+    def shard_path(self, shard):
+        return os.path.join(self.directory, f'shard_{shard:03d}.db')
+
+    def shard_ids(self):
+        return list(range(self.shard_count))
+
+    def engine(self, shard):
+        engine = self._engines.get(shard)
+        if engine is None:
+            with self._lock:
+                engine = self._engines.get(shard)
+                if engine is None:
+                    os.makedirs(self.directory, exist_ok=True)
+                    engine = create_engine(_sqlite_url(self.shard_path(shard)))
+                    enable_wal(engine)
+                    self.metadata.create_all(engine)
+                    if self.migrate is not None:
+                        self.migrate(engine)
+                    self._engines[shard] = engine
+        return engine
+
+    @contextmanager
+    def use_shard(self, shard, tenant_id=None):
+        shard_token = current_shard.set(shard)
+        tenant_token = current_tenant.set(tenant_id)
+        try:
+            yield
+        finally:
+            current_tenant.reset(tenant_token)
+            current_shard.reset(shard_token)
+
+    # ---- catalog lookups -------------------------------------------------
+
+    def _cache_user(self, user_id, location):
+        with self._lock:
+            self._user_shards[user_id] = location
+            self._user_shards.move_to_end(user_id)
+            if len(self._user_shards) > self.cache_size:
+                self._user_shards.popitem(last=False)
+
+    def locate_user(self, user_id):
+        """Return ``(shard, tenant_id)`` for a user id, or ``None``."""
+        location = self._user_shards.get(user_id)
+        if location is not None:
+            return location
+
+        with self.catalog.connect() as conn:
+            row = conn.execute(
+                select(tenant_table.c.shard, tenant_table.c.id)
+                .join(directory_table, directory_table.c.tenant_id == tenant_table.c.id)
+                .where(directory_table.c.user_id == user_id)
+            ).first()
+        if row is None:
+            return None
+        location = (row[0], row[1])
+        self._cache_user(user_id, location)
+        return location
+
+    def _locate_by(self, column, value):
+        with self.catalog.connect() as conn:
+            row = conn.execute(
+                select(tenant_table.c.shard, tenant_table.c.id)
+                .join(directory_table, directory_table.c.tenant_id == tenant_table.c.id)
+                .where(column == value)
+            ).first()
+        return (row[0], row[1]) if row else None
+
+    def locate_username(self, username):
+        return self._locate_by(directory_table.c.username, username)
+
+    def locate_email(self, email):
+        return self._locate_by(directory_table.c.email, email)
+
+    def find_users(self, usernames, emails):
+        """Return ``(user_id, username, email, shard)`` for every user on any
+        shard whose username is in ``usernames`` or email is in ``emails``."""
+        with self.catalog.connect() as conn:
+            return conn.execute(
+                select(directory_table.c.user_id, directory_table.c.username,
+                       directory_table.c.email, tenant_table.c.shard)
+                .join(tenant_table, directory_table.c.tenant_id == tenant_table.c.id)
+                .where(or_(directory_table.c.username.in_(usernames), directory_table.c.email.in_(emails)))
+            ).all()
+
+    def tenant_for(self, name=None):
+        """Return ``(shard, tenant_id)`` for a named tenant, creating it if needed.
+
+        Without a name a fresh anonymous tenant (one family) is created.
+        """
+        with self.catalog.begin() as conn:
+            if name is not None:
+                row = conn.execute(
+                    select(tenant_table.c.shard, tenant_table.c.id).where(tenant_table.c.name == name)
+                ).first()
+                if row:
+                    return row[0], row[1]
+
+            # The shard is chosen round-robin by tenant id.
+            tenant_id = conn.execute(insert(tenant_table).values(name=name, shard=0)).inserted_primary_key[0]
+            shard = tenant_id % self.shard_count
+            conn.execute(tenant_table.update().where(tenant_table.c.id == tenant_id).values(shard=shard))
+            return shard, tenant_id
+
+    def allocate_user_ids(self, users, tenant_id):
+        """Reserve global ids for ``[(username, email), ...]`` in ``tenant_id``.
+
+        Raises ``IntegrityError`` when a username or email is already taken on
+        any shard.
+        """
+        with self.catalog.begin() as conn:
+            ids = [
+                conn.execute(insert(directory_table).values(
+                    username=username, email=email, tenant_id=tenant_id
+                )).inserted_primary_key[0]
+                for username, email in users
+            ]
+        return ids
+
+    def release_user_ids(self, user_ids):
+        if not user_ids:
+            return
+        with self.catalog.begin() as conn:
+            conn.execute(directory_table.delete().where(directory_table.c.user_id.in_(user_ids)))
+        with self._lock:
+            for user_id in user_ids:
+                self._user_shards.pop(user_id, None)
+
+    def catalog_size(self):
+        with self.catalog.connect() as conn:
+            return conn.execute(select(func.count()).select_from(directory_table)).scalar()
+
+
+def install_id_allocation(router, session_class, user_model):
+    """Assign catalog ids to new ``User`` rows when a sharded session flushes."""
+
+    @event.listens_for(session_class, 'before_flush')
+    def allocate_ids(session, flush_context, instances):
+        if not router.enabled or current_shard.get() is None:
+            return
+        new_users = [obj for obj in session.new if isinstance(obj, user_model) and obj.id is None]
+        if not new_users:
+            return
+
+        tenant_id = current_tenant.get()
+        if tenant_id is None:
+            raise RuntimeError('No tenant selected for new users on a sharded database')
+        ids = router.allocate_user_ids([(u.username, u.email) for u in new_users], tenant_id)
+        for user, user_id in zip(new_users, ids):
+            user.id = user_id
+        session.info.setdefault('allocated_user_ids', []).extend(ids)
+
+    @event.listens_for(session_class, 'after_commit')
+    def keep_ids(session):
+        session.info.pop('allocated_user_ids', None)
+
+    @event.listens_for(session_class, 'after_soft_rollback')
+    def release_ids(session, previous_transaction):
+        if previous_transaction.parent is None:
+            router.release_user_ids(session.info.pop('allocated_user_ids', None))
+
+
+def split_database(source_engine, router, tables):
+    """Copy a single-file database into tenant shards.
+
+    Each parent and its children become one tenant; children without a
+    parent get a tenant of their own. Row ids are preserved. Returns the
+    number of users copied per shard.
+    """
+    user_table = tables['user']
+    with source_engine.connect() as conn:
+        users = conn.execute(select(user_table)).mappings().all()
+
+    family_of = {}
+    for user in users:
+        family_of[user['id']] = user['parent_id'] or user['id']
+
+    tenants = {}
+    for family in sorted(set(family_of.values())):
+        tenants[family] = router.tenant_for()
+
+    with router.catalog.begin() as conn:
+        conn.execute(insert(directory_table), [
+            {'user_id': u['id'], 'username': u['username'], 'email': u['email'],
+             'tenant_id': tenants[family_of[u['id']]][1]}
+            for u in users
+        ])
+
+    shard_of_user = {u['id']: tenants[family_of[u['id']]][0] for u in users}
+    counts = {shard: 0 for shard in router.shard_ids()}
+    for user_id, shard in shard_of_user.items():
+        counts[shard] += 1
+
+    with source_engine.connect() as source:
+        for name, table in tables.items():
+            rows = source.execute(select(table)).mappings().all()
+            by_shard = {}
+            for row in rows:
+                owner = row['id'] if name == 'user' else row['user_id']
+                if owner in shard_of_user:
+                    by_shard.setdefault(shard_of_user[owner], []).append(dict(row))
+            for shard, shard_rows in by_shard.items():
+                # Parents sort before their children so the self-referencing
+                # parent_id foreign key is always satisfied.
+                if name == 'user':
+                    shard_rows.sort(key=lambda r: (r['parent_id'] is not None, r['id']))
+                with router.engine(shard).begin() as target:
+                    target.execute(insert(table), shard_rows)
+    return counts
+
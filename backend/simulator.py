@@ -0,0 +1,196 @@
+"""Vectorized simulator for tuning the difficulty policy.
+
+Steps a synthetic learner population through the same decisions that
+``update_difficulty_internal`` makes for a real child (low-score streaks,
+recent trend, ``predict_adjustment``, ``calculate_new_difficulty``), for all
+learners at once as NumPy array operations.
+
+Learner model: every learner has a hidden ability on the difficulty scale
+(0.5-3.0). A session at difficulty ``d`` scores
+``sigmoid(slope * (ability - d) + bias)`` plus Gaussian noise, and ability
+grows fastest when the material is slightly above the learner's level.
+
+Reported per-learner metrics:
+
+* convergence -- sessions until difficulty stays within ``tolerance`` of
+  ability for the rest of the run (NaN if it never settles)
+* oscillation -- share of sessions where difficulty reverses direction
+* frustration -- share of sessions scoring below the low-score threshold
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+class PolicyParams:
+    def __init__(self, low_score_threshold=0.4, high_score_threshold=0.75, consecutive_threshold=3,
+                 confidence=0.65, up_bands=(0.85, 0.75), up_steps=(0.2, 0.15, 0.1),
+                 down_bands=(0.3, 0.4), down_steps=(0.2, 0.15, 0.1),
+                 min_difficulty=0.5, max_difficulty=3.0):
+        self.low_score_threshold = low_score_threshold
+        self.high_score_threshold = high_score_threshold
+        self.consecutive_threshold = consecutive_threshold
+        self.confidence = confidence
+        self.up_bands = up_bands
+        self.up_steps = up_steps
+        self.down_bands = down_bands
+        self.down_steps = down_steps
+        self.min_difficulty = min_difficulty
+        self.max_difficulty = max_difficulty
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class SimulatedPolicy:
+    """Array version of ``predict_adjustment`` and ``calculate_new_difficulty``.
+
+    With ``model`` set it mirrors the ML system (an SVC with
+    ``predict_proba``); without one it mirrors the rule-based fallback.
+    """
+
+    def __init__(self, model=None, params=None):
+        self.model = model
+        self.params = params or PolicyParams()
+
+    def adjust(self, scores, trends, consecutive_low):
+        p = self.params
+        high = scores > p.high_score_threshold
+        low = scores < p.low_score_threshold
+
+        if self.model is None:
+            adjustment = np.where(high, 1, np.where(low, 0, -1))
+        else:
+            proba = self.model.predict_proba(np.column_stack([scores, trends]))
+            adjustment = np.where(
+                (proba[:, 1] > p.confidence) & high, 1,
+                np.where((proba[:, 0] > p.confidence) & low, 0, -1)
+            )
+        return np.where(consecutive_low >= p.consecutive_threshold, 0, adjustment)
+
+    def next_difficulty(self, difficulty, adjustment, scores):
+        p = self.params
+        increase = np.select(
+            [scores > p.up_bands[0], scores > p.up_bands[1]], p.up_steps[:2], p.up_steps[2]
+        )
+        decrease = np.select(
+            [scores < p.down_bands[0], scores < p.down_bands[1]], p.down_steps[:2], p.down_steps[2]
+        )
+        return np.where(
+            adjustment == 1, np.minimum(p.max_difficulty, difficulty + increase),
+            np.where(adjustment == 0, np.maximum(p.min_difficulty, difficulty - decrease), difficulty)
+        )
+
+
+class LearnerParams:
+    def __init__(self, ability_mean=1.2, ability_sd=0.35, learning_rate=0.01, learning_rate_sd=0.5,
+                 slope=4.0, bias=0.4, noise=0.12, stretch=0.15, stretch_width=0.4):
+        self.ability_mean = ability_mean
+        self.ability_sd = ability_sd
+        self.learning_rate = learning_rate
+        self.learning_rate_sd = learning_rate_sd
+        self.slope = slope
+        self.bias = bias
+        self.noise = noise
+        self.stretch = stretch
+        self.stretch_width = stretch_width
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def _simulate_chunk(policy, learners, sessions, learner_params, seed, tolerance, start_difficulty):
+    rng = np.random.default_rng(seed)
+    lp = learner_params
+    low_threshold = policy.params.low_score_threshold
+
+    ability = np.clip(rng.normal(lp.ability_mean, lp.ability_sd, learners), 0.5, 3.0)
+    rate = lp.learning_rate * rng.lognormal(0.0, lp.learning_rate_sd, learners)
+    difficulty = np.full(learners, start_difficulty)
+
+    recent = np.zeros((learners, 3))
+    consecutive_low = np.zeros(learners, dtype=np.int64)
+    last_direction = np.zeros(learners, dtype=np.int8)
+    reversals = np.zeros(learners, dtype=np.int64)
+    frustrated = np.zeros(learners, dtype=np.int64)
+    last_outside = np.full(learners, -1, dtype=np.int64)
+
+    for step in range(sessions):
+        expected = 1.0 / (1.0 + np.exp(-(lp.slope * (ability - difficulty) + lp.bias)))
+        scores = np.clip(expected + rng.normal(0.0, lp.noise, learners), 0.0, 1.0)
+
+        # Matches the app: the trend is measured against the last three
+        # scores, or against 0.5 until three are available.
+        baseline = recent.mean(axis=1) if step >= 3 else 0.5
+        trends = scores - baseline
+        consecutive_low = np.where(scores < low_threshold, consecutive_low + 1, 0)
+        frustrated += scores < low_threshold
+
+        adjustment = policy.adjust(scores, trends, consecutive_low)
+        new_difficulty = policy.next_difficulty(difficulty, adjustment, scores)
+
+        direction = np.sign(new_difficulty - difficulty).astype(np.int8)
+        moved = direction != 0
+        reversals += moved & (last_direction != 0) & (direction != last_direction)
+        last_direction = np.where(moved, direction, last_direction)
+
+        recent[:, step % 3] = scores
+        gap = difficulty - ability
+        ability = np.minimum(3.0, ability + rate * np.exp(-((gap - lp.stretch) / lp.stretch_width) ** 2))
+        difficulty = new_difficulty
+        last_outside = np.where(np.abs(difficulty - ability) >= tolerance, step, last_outside)
+
+    convergence = (last_outside + 1).astype(np.float64)
+    convergence[last_outside == sessions - 1] = np.nan
+    return {
+        'convergence': convergence,
+        'oscillation': reversals / sessions,
+        'frustration': frustrated / sessions,
+        'final_gap': difficulty - ability,
+    }
+
+
+def _summary(values):
+    finite = values[~np.isnan(values)]
+    if not len(finite):
+        return {'mean': None, 'p50': None, 'p90': None}
+    p50, p90 = np.percentile(finite, [50, 90])
+    return {'mean': round(float(finite.mean()), 4), 'p50': round(float(p50), 4), 'p90': round(float(p90), 4)}
+
+
+def simulate(policy, learners=10000, sessions=100, learner_params=None, seed=0, workers=1,
+             tolerance=0.25, start_difficulty=1.0):
+    """Simulate ``learners`` x ``sessions`` and return aggregate metrics.
+
+    With ``workers > 1`` the population is split into chunks that run in
+    separate processes, each with its own random stream.
+    """
+    learner_params = learner_params or LearnerParams()
+    workers = max(1, min(workers, learners))
+    chunks = [len(c) for c in np.array_split(np.arange(learners), workers)]
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    args = [(policy, n, sessions, learner_params, s, tolerance, start_difficulty)
+            for n, s in zip(chunks, seeds)]
+
+    if workers == 1:
+        results = [_simulate_chunk(*args[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, os.cpu_count() or 1)) as pool:
+            results = list(pool.map(_simulate_chunk, *zip(*args)))
+
+    merged = {key: np.concatenate([r[key] for r in results]) for key in results[0]}
+    converged = ~np.isnan(merged['convergence'])
+    return {
+        'learners': learners,
+        'sessions': sessions,
+        'learner_sessions': learners * sessions,
+        'policy': policy.params.as_dict(),
+        'uses_model': policy.model is not None,
+        'learner_model': learner_params.as_dict(),
+        'converged_share': round(float(converged.mean()), 4),
+        'convergence_sessions': _summary(merged['convergence']),
+        'oscillation_rate': _summary(merged['oscillation']),
+        'time_in_frustration': _summary(merged['frustration']),
+        'final_gap': _summary(merged['final_gap']),
+    }
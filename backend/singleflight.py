@@ -0,0 +1,77 @@
+"""Single-flight coalescing of identical concurrent computations.
+
+When several identical dashboard requests arrive together (a family opening
+the app on a few devices, React remounting components) only the first one,
+the leader, runs the view. The others wait for the leader and reuse its
+serialized response. Nothing is cached once the leader finishes; the next
+request after that computes a fresh result.
+"""
+import threading
+from collections import Counter, defaultdict
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = defaultdict(Counter)
+
+    def do(self, key, fn, timeout=10.0, group='default'):
+        """Run ``fn`` once for all concurrent callers sharing ``key``.
+
+        A waiter that is still waiting after ``timeout`` seconds stops
+        waiting and runs ``fn`` itself, so a stuck leader delays its
+        followers but never fails them.
+        """
+        with self._lock:
+            stats = self._stats[group]
+            stats['requests'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                stats['executions'] += 1
+            else:
+                stats['coalesced'] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.result
+
+        if not call.done.wait(timeout):
+            with self._lock:
+                stats['timeouts'] += 1
+                stats['executions'] += 1
+            return fn()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls)
+            groups = {
+                group: {
+                    'requests': counts['requests'],
+                    'executions': counts['executions'],
+                    'coalesced': counts['coalesced'],
+                    'timeouts': counts['timeouts'],
+                }
+                for group, counts in self._stats.items()
+            }
+        return {'in_flight': in_flight, 'groups': groups}
@@ -0,0 +1,55 @@
+"""Shared fixtures for the backend tests.
+
+``app`` is imported once per session with its database, model registry and
+replica under a temporary directory, so running the tests never touches
+``instance/`` or ``models/``. Tests share that database and keep apart by
+registering their own users with unique names.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP_DIR = tempfile.mkdtemp(prefix='dyslexia-tests-')
+
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TMP_DIR, 'dyslexia.db')}"
+os.environ['MODEL_REGISTRY_DIR'] = os.path.join(TMP_DIR, 'models')
+os.environ['REPLICA_PATH'] = os.path.join(TMP_DIR, 'replica.db')
+os.environ['PROFILE_DIR'] = os.path.join(TMP_DIR, 'profiles')
+os.environ['SHARD_DIR'] = TMP_DIR
+os.environ.pop('SHARD_COUNT', None)
+os.environ.pop('EVENT_BROKER_URL', None)
+sys.path.insert(0, BACKEND_DIR)
+
+import app as app_module  # noqa: E402
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def backend():
+    return app_module
+
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
+
+
+@pytest.fixture
+def register_child(client):
+    def register(age=8):
+        name = f'kid-{uuid.uuid4().hex[:10]}'
+        response = client.post('/api/register', json={
+            'username': name, 'email': f'{name}@example.com', 'password': 'secret',
+            'user_type': 'child', 'age': age,
+        })
+        assert response.status_code == 201, response.json
+        return response.json['user_id']
+    return register
@@ -0,0 +1,26 @@
+"""Incremental loading of the columnar cohort store (user-026)."""
+from datetime import datetime, timedelta
+
+
+def test_row_committed_late_with_an_older_timestamp_is_loaded(backend, client, register_child):
+    user_id = register_child()
+    assert client.post('/api/save-game-score', json={
+        'user_id': user_id, 'game_type': 'word_jumble', 'score': 40,
+    }).status_code == 200
+
+    with backend.app.app_context():
+        store = backend.cohort_store
+        store.refresh(force=True)
+        loaded = len(store.games)
+
+        # created_at is set before the INSERT waits for the write lock, so a
+        # row can commit after rows stamped later than it.
+        backend.db.session.add(backend.GameScore(
+            user_id=user_id, game_type='word_jumble', score=90, level=1, time_spent=120,
+            difficulty_level=1.0, created_at=datetime.utcnow() - timedelta(hours=1),
+        ))
+        backend.db.session.commit()
+        store.refresh(force=True)
+
+        assert len(store.games) == loaded + 1
+        assert len(store.games) == backend.GameScore.query.filter(backend.GameScore.created_at.isnot(None)).count()
@@ -0,0 +1,49 @@
+"""Load test for single-flight coalescing of dashboard GETs (user-028)."""
+import threading
+import time
+
+from sqlalchemy import event
+
+READERS = 32
+
+
+def test_burst_of_identical_dashboard_reads_shares_db_work(backend, client, register_child):
+    user_id = register_child()
+    before = client.get('/api/metrics/coalescing').json['groups'].get('get_dashboard_data', {})
+
+    # Slow every statement down a little so the burst overlaps the leader,
+    # as it does in production when a family opens the app together.
+    def slow_statement(*args):
+        time.sleep(0.01)
+
+    with backend.app.app_context():
+        engine = backend.db.engine
+    event.listen(engine, 'before_cursor_execute', slow_statement)
+    try:
+        start = threading.Barrier(READERS)
+        bodies = []
+
+        def read():
+            reader = backend.app.test_client()
+            start.wait()
+            response = reader.get(f'/api/dashboard-data/{user_id}')
+            bodies.append((response.status_code, response.data))
+
+        threads = [threading.Thread(target=read) for _ in range(READERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        event.remove(engine, 'before_cursor_execute', slow_statement)
+
+    assert len(bodies) == READERS
+    assert {status for status, _ in bodies} == {200}
+    assert len({body for _, body in bodies}) == 1
+
+    after = client.get('/api/metrics/coalescing').json['groups']['get_dashboard_data']
+    requests = after['requests'] - before.get('requests', 0)
+    executions = after['executions'] - before.get('executions', 0)
+    assert requests == READERS
+    assert executions <= READERS // 4, (executions, requests)
+
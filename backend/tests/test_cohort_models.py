@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+pytest.importorskip('sklearn')
+
+from cohort_models import CohortModelCache, retrain_cohorts  # noqa: E402
+
+
+def sequences(learners=40, length=12):
+    rng = random.Random(0)
+    result = []
+    for _ in range(learners):
+        difficulty = 1.0
+        sequence = []
+        for _ in range(length):
+            score = rng.random()
+            sequence.append((score, difficulty, rng.choice(['speech', 'listening', 'games'])))
+            difficulty += 0.1 if score > 0.6 else -0.1
+        result.append(sequence)
+    return result
+
+
+def test_cohort_without_a_model_is_not_rechecked_until_the_interval(tmp_path, monkeypatch):
+    cache = CohortModelCache(str(tmp_path), check_interval=60)
+    assert cache.get('8to10') == (None, None)
+
+    registry = cache._entries['8to10'].registry
+    checks = []
+    monkeypatch.setattr(registry, '_pointer_changed', lambda: checks.append(1) or (False, None))
+    for _ in range(100):
+        assert cache.get('8to10') == (None, None)
+    assert checks == []
+
+
+def test_models_retrained_in_another_process_reach_the_cache(backend, tmp_path):
+    cache = CohortModelCache(str(tmp_path), check_interval=0)
+    assert cache.get('8to10') == (None, None)
+
+    results = backend.model_fit_executor.submit(retrain_cohorts, str(tmp_path), '8to10', sequences()).result()
+
+    assert results['8to10']['trained']
+    version, model = cache.get('8to10')
+    assert version == results['8to10']['version'] and model is not None
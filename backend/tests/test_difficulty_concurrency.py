@@ -0,0 +1,72 @@
+"""Stress tests for the optimistic difficulty updates (user-037)."""
+import json
+import threading
+
+THREADS = 8
+
+
+def hammer(backend, requests_per_thread, make_request):
+    start = threading.Barrier(THREADS)
+    statuses = []
+
+    def worker(thread):
+        client = backend.app.test_client()
+        start.wait()
+        for i in range(requests_per_thread):
+            path, body = make_request(thread, i)
+            statuses.append(client.post(path, json=body).status_code)
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+
+def test_concurrent_submissions_for_one_user_are_all_applied(backend, register_child):
+    user_id = register_child()
+    per_thread = 10
+
+    def submission(thread, i):
+        if i % 3 == 0:
+            return '/api/save-game-score', {'user_id': user_id, 'game_type': 'word_jumble', 'score': 50 + thread}
+        if i % 3 == 1:
+            return '/api/speech-test', {'user_id': user_id, 'spoken_text': 'the cat',
+                                        'original_text': 'the cat sat'}
+        return '/api/update-difficulty', {'user_id': user_id, 'score': 0.1 * thread}
+
+    statuses = hammer(backend, per_thread, submission)
+    assert statuses == [200] * THREADS * per_thread
+
+    games = THREADS * len(range(0, per_thread, 3))
+    speech_tests = THREADS * len(range(1, per_thread, 3))
+    with backend.app.app_context():
+        user = backend.db.session.get(backend.User, user_id)
+        # Every submission bumped the version exactly once, and no
+        # learning-time increment was overwritten by a concurrent one.
+        assert user.version == 1 + THREADS * per_thread
+        assert user.total_learning_time == games * 2 + speech_tests
+        assert backend.GameScore.query.filter_by(user_id=user_id).count() == games
+        assert backend.TestResult.query.filter_by(user_id=user_id).count() == speech_tests
+        assert len(json.loads(user.performance_history)) == 20
+
+
+def test_concurrent_updates_keep_every_history_entry(backend, register_child):
+    user_id = register_child()
+    # Fewer updates than the 20 kept in performance_history, each with a
+    # score that identifies it.
+    per_thread = 2
+    scores = {(t, i): round(0.05 + 0.05 * (t * per_thread + i), 2)
+              for t in range(THREADS) for i in range(per_thread)}
+
+    statuses = hammer(backend, per_thread, lambda t, i: (
+        '/api/update-difficulty', {'user_id': user_id, 'score': scores[(t, i)]}
+    ))
+    assert statuses == [200] * len(scores)
+
+    with backend.app.app_context():
+        user = backend.db.session.get(backend.User, user_id)
+        history = json.loads(user.performance_history)
+        assert sorted(entry['score'] for entry in history) == sorted(scores.values())
+        assert user.version == 1 + len(scores)
@@ -0,0 +1,72 @@
+"""Server-Sent Events brokers and streams (user-027)."""
+import threading
+import time
+
+import pytest
+
+from events import EventHub, InProcessBroker, SQLiteBroker
+
+
+def frames(stream, count):
+    return [next(stream) for _ in range(count)]
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def broker(request, tmp_path):
+    if request.param == 'memory':
+        return InProcessBroker()
+    return SQLiteBroker(str(tmp_path / 'events.db'), poll_interval=0.05)
+
+
+def test_stream_resumes_with_only_its_channels(broker):
+    hub = EventHub(broker)
+    first = hub.publish([1], 'score', {'n': 1})
+    hub.publish([2], 'score', {'n': 2})
+    hub.publish([1, 3], 'score', {'n': 3})
+
+    stream = hub.stream([1], last_event_id=first - 1, heartbeat=0.05)
+    _, a, b = frames(stream, 3)
+    assert '"n": 1' in a and '"n": 3' in b
+
+
+def test_publish_wakes_only_subscribed_waiters(broker):
+    latest = broker.latest_id()
+    woken = {}
+
+    def wait(channel):
+        woken[channel] = broker.wait(latest, [channel], timeout=1.0)
+
+    threads = [threading.Thread(target=wait, args=(channel,)) for channel in (1, 2)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    broker.publish([1], 'score', '{}')
+    for thread in threads:
+        thread.join()
+    assert woken == {1: True, 2: False}
+
+
+def test_last_event_id_ahead_of_the_broker_resets(broker):
+    hub = EventHub(broker)
+    hub.publish([1], 'score', {})
+    stream = hub.stream([1], last_event_id=500, heartbeat=0.05)
+    assert 'event: reset' in frames(stream, 2)[1]
+    hub.publish([1], 'score', {'n': 2})
+    assert '"n": 2' in next(stream)
+
+
+def test_sqlite_events_reach_other_processes(tmp_path):
+    path = str(tmp_path / 'events.db')
+    publisher = SQLiteBroker(path)
+    old = publisher.publish([1], 'score', '{"n": 0}')
+    subscriber = SQLiteBroker(path, poll_interval=0.05)
+
+    # From before the subscriber started: read from the table.
+    events, complete = subscriber.read_since(old - 1, [1])
+    assert complete and [e[0] for e in events] == [old]
+
+    stream = EventHub(subscriber).stream([1], heartbeat=1.0)
+    next(stream)
+    publisher.publish([2], 'score', '{"n": 1}')
+    publisher.publish([1], 'score', '{"n": 2}')
+    assert '"n": 2' in next(stream)
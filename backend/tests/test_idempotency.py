@@ -0,0 +1,116 @@
+"""Idempotency-Key handling on the submission endpoints (user-041)."""
+import hashlib
+import json
+import threading
+import time
+import uuid
+
+DUPLICATES = 12
+
+
+def speech_body(user_id, spoken_text='the cat sat'):
+    return {'user_id': user_id, 'spoken_text': spoken_text, 'original_text': 'the cat sat'}
+
+
+def test_concurrent_duplicates_are_written_once(backend, register_child):
+    user_id = register_child()
+    key = str(uuid.uuid4())
+    start = threading.Barrier(DUPLICATES)
+    responses = []
+
+    def deliver():
+        client = backend.app.test_client()
+        start.wait()
+        response = client.post('/api/speech-test', json=speech_body(user_id),
+                               headers={'Idempotency-Key': key})
+        responses.append((response.status_code, response.headers.get('Idempotent-Replayed'), response.data,
+                          response.headers.get('Retry-After')))
+
+    threads = [threading.Thread(target=deliver) for _ in range(DUPLICATES)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Duplicates that arrive while the first is running are told to retry;
+    # later ones get its stored response.
+    assert {status for status, _, _, _ in responses} <= {200, 409}
+    assert all(retry_after == '1' for status, _, _, retry_after in responses if status == 409)
+    succeeded = [(replayed, body) for status, replayed, body, _ in responses if status == 200]
+    assert sum(1 for replayed, _ in succeeded if replayed != 'true') == 1
+    assert len({body for _, body in succeeded}) == 1
+    with backend.app.app_context():
+        assert backend.TestResult.query.filter_by(user_id=user_id).count() == 1
+        assert backend.db.session.get(backend.User, user_id).version == 2
+
+
+def test_sequential_retry_is_replayed(client, register_child):
+    user_id = register_child()
+    headers = {'Idempotency-Key': str(uuid.uuid4())}
+    first = client.post('/api/save-game-score', headers=headers,
+                        json={'user_id': user_id, 'game_type': 'word_jumble', 'score': 70})
+    retry = client.post('/api/save-game-score', headers=headers,
+                        json={'user_id': user_id, 'game_type': 'word_jumble', 'score': 70})
+    assert first.status_code == retry.status_code == 200
+    assert first.headers.get('Idempotent-Replayed') is None
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.json == first.json
+
+
+def test_key_reused_with_a_different_body_is_rejected(client, register_child):
+    user_id = register_child()
+    headers = {'Idempotency-Key': str(uuid.uuid4())}
+    assert client.post('/api/speech-test', json=speech_body(user_id), headers=headers).status_code == 200
+    response = client.post('/api/speech-test', json=speech_body(user_id, 'the bat sat'), headers=headers)
+    assert response.status_code == 422
+
+
+def test_concurrent_update_conflict_is_not_replayed(backend, client, register_child, monkeypatch):
+    user_id = register_child()
+    headers = {'Idempotency-Key': str(uuid.uuid4())}
+
+    # No attempts left: the difficulty update reports a lost race.
+    monkeypatch.setattr(backend, 'DIFFICULTY_UPDATE_RETRIES', 0)
+    conflict = client.post('/api/speech-test', json=speech_body(user_id), headers=headers)
+    assert conflict.status_code == 409
+
+    monkeypatch.setattr(backend, 'DIFFICULTY_UPDATE_RETRIES', 8)
+    retry = client.post('/api/speech-test', json=speech_body(user_id), headers=headers)
+    assert retry.status_code == 200
+    assert retry.headers.get('Idempotent-Replayed') is None
+    with backend.app.app_context():
+        assert backend.TestResult.query.filter_by(user_id=user_id).count() == 1
+
+
+def test_response_is_stored_with_the_write(client, backend, register_child, monkeypatch):
+    user_id = register_child()
+    headers = {'Idempotency-Key': str(uuid.uuid4())}
+
+    # The wrapper's own bookkeeping is not needed once the write committed.
+    def fail(*args):
+        raise AssertionError('finish_idempotency_key called after the write')
+    monkeypatch.setattr(backend, 'finish_idempotency_key', fail)
+    first = client.post('/api/listening-test', headers=headers, json={
+        'user_id': user_id, 'typed_text': 'a big dog', 'original_text': 'a big dog'})
+    retry = client.post('/api/listening-test', headers=headers, json={
+        'user_id': user_id, 'typed_text': 'a big dog', 'original_text': 'a big dog'})
+    assert first.status_code == retry.status_code == 200
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.json == first.json
+
+
+def test_duplicate_of_a_request_in_progress_gets_409_at_once(backend, client, register_child):
+    user_id = register_child()
+    key = str(uuid.uuid4())
+    body = speech_body(user_id)
+    with backend.app.test_request_context('/api/speech-test', method='POST', json=body,
+                                          headers={'Idempotency-Key': key}):
+        digest = hashlib.sha256(f'speech_test\0{user_id}\0{key}'.encode()).digest()[:16]
+        fingerprint = hashlib.sha256(json.dumps(body, sort_keys=True).encode()).digest()[:8]
+        assert backend.claim_idempotency_key(digest, fingerprint) is None
+
+    started = time.monotonic()
+    response = client.post('/api/speech-test', json=body, headers={'Idempotency-Key': key})
+    assert response.status_code == 409
+    assert response.headers['Retry-After'] == '1'
+    assert time.monotonic() - started < 1
@@ -0,0 +1,90 @@
+"""Peer percentile ranks on the dashboards (user-042)."""
+import uuid
+from datetime import datetime
+
+from age_bands import age_band
+from replica import read_target
+
+# Other tests register 8-year-olds; this band is left to these tests.
+AGE = 12
+BAND = '11to13'
+
+
+def register(client, age=AGE):
+    name = f'peer-{uuid.uuid4().hex[:10]}'
+    response = client.post('/api/register', json={
+        'username': name, 'email': f'{name}@example.com', 'password': 'secret',
+        'user_type': 'child', 'age': age,
+    })
+    assert response.status_code == 201, response.json
+    user_id = response.json['user_id']
+    assert client.post('/api/save-game-score', json={
+        'user_id': user_id, 'game_type': 'memory_match', 'score': 10 + user_id % 90,
+    }).status_code == 200
+    return user_id
+
+
+def refresh(backend):
+    # What the background thread does every PERCENTILES_INTERVAL seconds.
+    with backend.app.app_context():
+        backend.peer_percentiles.refresh(force=True)
+
+
+def test_refresh_reads_the_primary_even_in_a_fast_read_context(backend, client):
+    first = register(client)
+    backend.replica.refresh(force=True)
+
+    # Registered after the replica was taken, so only the primary has them.
+    peers = [first] + [register(client) for _ in range(6)]
+    token = read_target.set('replica')
+    try:
+        refresh(backend)
+    finally:
+        read_target.reset(token)
+
+    fast = client.get(f'/api/dashboard-data/{first}?consistency=fast')
+    assert fast.headers['X-Read-Source'] == 'replica'
+    assert fast.json['percentile_ranks']['memory_match'] is not None
+
+    fresh = client.get(f'/api/dashboard-data/{peers[-1]}')
+    assert fresh.json['peer_group'] == BAND
+    assert fresh.json['percentile_ranks']['memory_match'] is not None
+    assert backend.peer_percentiles.stats()['distributions'][f'{BAND}/memory_match'] == len(peers)
+
+
+def test_dashboards_do_not_refresh_on_the_request_path(backend, client, monkeypatch):
+    user_id = register(client)
+
+    def fail():
+        raise AssertionError('refreshed on the request path')
+    monkeypatch.setattr(backend.peer_percentiles, '_refresh', fail)
+    assert client.get(f'/api/dashboard-data/{user_id}').status_code == 200
+
+
+def test_late_committed_rows_are_loaded(backend, client):
+    user_id = register(client)
+    refresh(backend)
+    with backend.app.app_context():
+        # Stamped before the last refresh but committed after it.
+        backend.db.session.add(backend.GameScore(
+            user_id=user_id, game_type='spelling_bee', score=50, level=1, time_spent=60,
+            created_at=datetime(2000, 1, 1)))
+        backend.db.session.commit()
+    refresh(backend)
+    assert (user_id, 'spelling_bee') in backend.peer_percentiles.best
+
+
+def test_ranks_match_exact_ranks(backend, client):
+    for _ in range(5):
+        register(client)
+
+    refresh(backend)
+    with backend.app.app_context():
+        rows = backend.db.session.query(
+            backend.GameScore.user_id, backend.GameScore.game_type, backend.db.func.max(backend.GameScore.score)
+        ).group_by(backend.GameScore.user_id, backend.GameScore.game_type).all()
+        bands = {user_id: age_band(age) for user_id, age in backend.db.session.query(
+            backend.User.id, backend.User.age).filter(backend.User.user_type == 'child')}
+    result = backend.peer_percentiles.check({(user_id, game): best for user_id, game, best in rows}, bands)
+    assert result['comparisons'] >= 5
+    assert result['max_error'] == 0
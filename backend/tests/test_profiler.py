@@ -0,0 +1,64 @@
+import multiprocessing
+import time
+
+from flask import Flask
+
+from profiler import ProfileStore, RequestProfiler, SamplingProfiler
+
+
+def make_app():
+    app = Flask(__name__)
+
+    @app.route('/work')
+    def work():
+        return str(sum(range(1000)))
+    return app
+
+
+def other_worker(directory):
+    app = make_app()
+    profiler = RequestProfiler(ProfileStore(directory))
+    profiler.sync(app, force=True)
+    client = app.test_client()
+    for _ in range(5):
+        client.get('/work')
+    profiler.sync(app, force=True)
+
+
+def test_request_profile_merges_every_worker(tmp_path):
+    app = make_app()
+    profiler = RequestProfiler(ProfileStore(str(tmp_path)))
+    view = app.view_functions['work']
+    started = profiler.start(app, ['work'], rate=1.0)
+
+    worker = multiprocessing.get_context('fork').Process(target=other_worker, args=(str(tmp_path),))
+    worker.start()
+    worker.join()
+    assert worker.exitcode == 0
+
+    client = app.test_client()
+    for _ in range(3):
+        client.get('/work')
+    profile = profiler.stop(app)
+
+    assert profile.id == started.id
+    assert profile.samples == 8
+    assert any('work' in line for line in profile.collapsed().splitlines())
+    assert app.view_functions['work'] is view
+    assert not profiler.active
+    assert [p['id'] for p in ProfileStore(str(tmp_path)).list()] == [started.id]
+
+
+def test_sampling_session_is_visible_to_other_workers(tmp_path):
+    profiler = SamplingProfiler(ProfileStore(str(tmp_path)))
+    started = profiler.start(duration=5, interval=0.005)
+    assert SamplingProfiler(ProfileStore(str(tmp_path))).active
+    time.sleep(0.1)
+    profiler.stop()
+
+    deadline = time.monotonic() + 5
+    while profiler.profile is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    profile = ProfileStore(str(tmp_path)).get(started.id)
+    assert profile.samples > 0 and profile.finished_at is not None
+    assert not profiler.active
@@ -0,0 +1,18 @@
+import sqlite3
+import threading
+
+from replica import Replica
+
+
+def test_engine_does_not_wait_for_a_refresh(tmp_path):
+    source = str(tmp_path / 'source.db')
+    sqlite3.connect(source).close()
+    replica = Replica(source, str(tmp_path / 'replica.db'))
+
+    # Stands in for a refresh copying the database.
+    with replica._lock:
+        created = []
+        thread = threading.Thread(target=lambda: created.append(replica.engine))
+        thread.start()
+        thread.join(timeout=2)
+        assert created, 'engine creation blocked on the refresh lock'
@@ -0,0 +1,24 @@
+import uuid
+
+
+def test_generated_parent_email_clashing_with_another_row_fails_only_that_row(client):
+    tag = uuid.uuid4().hex[:8]
+    response = client.post('/api/register-roster', json={'children': [
+        {'username': f'ann-{tag}', 'email': f'ann-{tag}@example.com', 'password': 'secret'},
+        {'username': f'bob-{tag}', 'email': f'ann-{tag}+parent@example.com', 'password': 'secret'},
+        {'username': f'cat-{tag}', 'email': f'cat-{tag}@example.com', 'password': 'secret'},
+    ]})
+    assert response.status_code == 201, response.json
+    rows = response.json['rows']
+    assert [row['status'] for row in rows] == ['error', 'created', 'created']
+    assert 'used by another row' in rows[0]['error']
+
+
+def test_parent_username_clashing_with_another_row_fails_only_that_row(client):
+    tag = uuid.uuid4().hex[:8]
+    response = client.post('/api/register-roster', json={'children': [
+        {'username': f'dan-{tag}', 'email': f'dan-{tag}@example.com', 'password': 'secret'},
+        {'username': f'parent_dan-{tag}', 'email': f'pd-{tag}@example.com', 'password': 'secret'},
+    ]})
+    assert response.status_code == 201, response.json
+    assert [row['status'] for row in response.json['rows']] == ['error', 'created']
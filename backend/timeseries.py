@@ -0,0 +1,89 @@
+"""Downsampling helpers for long progress time series.
+
+Charts for long-time users need months of history, but the payload should not
+grow with the number of raw ``TestResult``/``GameScore`` rows. Series are
+either averaged into calendar buckets (day, week, month) or reduced to a
+target number of points with Largest-Triangle-Three-Buckets (LTTB), which
+keeps the visual shape (peaks, dips) that plain averaging flattens.
+
+Timestamps are ``datetime64[s]`` arrays and values are float arrays with NaN
+for missing measurements.
+"""
+import numpy as np
+
+BUCKETS = ('day', 'week', 'month')
+
+# NumPy counts days from 1970-01-01, a Thursday; shift so weeks start Monday.
+_WEEK_OFFSET = 3
+
+
+def bucket_starts(timestamps, bucket):
+    if bucket == 'day':
+        return timestamps.astype('datetime64[D]')
+    if bucket == 'week':
+        days = timestamps.astype('datetime64[D]').astype(np.int64)
+        return (((days + _WEEK_OFFSET) // 7) * 7 - _WEEK_OFFSET).astype('datetime64[D]')
+    if bucket == 'month':
+        return timestamps.astype('datetime64[M]').astype('datetime64[D]')
+    raise ValueError(f'bucket must be one of {", ".join(BUCKETS)}')
+
+
+def bucket_mean(timestamps, values, bucket):
+    """Average ``values`` per calendar bucket, ignoring NaNs.
+
+    Returns ``(bucket_start_dates, means)``; buckets without any measurement
+    for this metric are dropped.
+    """
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return np.empty(0, dtype='datetime64[D]'), np.empty(0)
+
+    starts, inverse = np.unique(bucket_starts(timestamps[valid], bucket), return_inverse=True)
+    sums = np.bincount(inverse, weights=values[valid])
+    counts = np.bincount(inverse)
+    return starts, sums / counts
+
+
+def lttb(x, y, threshold):
+    """Return the indices of ``threshold`` points chosen by LTTB.
+
+    ``x`` must be increasing. The first and last points are always kept; each
+    bucket in between contributes the point forming the largest triangle with
+    the previously chosen point and the average of the next bucket.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n) if threshold >= n else np.array([0, n - 1])[:max(threshold, 0)]
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    previous = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_start, next_stop = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        if next_stop <= next_start:
+            next_start, next_stop = n - 1, n
+        avg_x = x[next_start:next_stop].mean()
+        avg_y = y[next_start:next_stop].mean()
+
+        area = np.abs(
+            (x[previous] - avg_x) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+
+    return selected
+
+
+def downsample(timestamps, values, points):
+    """LTTB-downsample one metric to at most ``points`` measurements."""
+    valid = ~np.isnan(values)
+    timestamps, values = timestamps[valid], values[valid]
+    keep = lttb(timestamps.astype(np.int64), values, points)
+    return timestamps[keep], values[keep]
@@ -0,0 +1,284 @@
+"""Server-side word bank for game content.
+
+Loads the lexicon once (``lexicon/words.txt`` and ``lexicon/sentences.txt``,
+or the files in ``WORD_BANK_DIR``) and precomputes indexes over it:
+
+* word length and estimated syllable count (``by_length``,
+  ``by_syllables``), which the spelling tiers are built from
+* phonics patterns (digraphs, vowel teams, r-controlled vowels, blends,
+  silent e)
+* commonly confused letter pairs (b/d, p/q, m/w, n/u)
+* anagram signature (the word's letters, sorted)
+
+For every game and difficulty tier the matching candidates are precomputed
+into an array, so serving a round is a handful of random picks. From
+``CONFUSABLE_FROM_TIER`` up, part of each spelling round is drawn from the
+tier's words containing a b/d or p/q letter, the reversals that trouble
+dyslexic readers most. Each user gets a bounded window of recently served
+items that new rounds avoid.
+"""
+import os
+import random
+import re
+import threading
+from collections import OrderedDict, defaultdict, deque
+
+import numpy as np
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexicon')
+
+# Same boundaries as get_adaptive_content, plus an extra tier below 1.0.
+TIER_BOUNDARIES = (1.0, 1.3, 1.8, 2.3)
+
+# (min length, max length, max syllables) of spelling words per tier.
+SPELLING_TIERS = (
+    (3, 3, 1),
+    (3, 4, 1),
+    (4, 6, 2),
+    (6, 8, 3),
+    (8, 20, 8),
+)
+
+# (max words, max word length) of word_jumble sentences per tier.
+JUMBLE_TIERS = (
+    (4, 5),
+    (6, 6),
+    (8, 9),
+    (10, 13),
+    (30, 30),
+)
+
+PHONICS_PATTERNS = {
+    'digraph_sh': r'sh', 'digraph_ch': r'ch', 'digraph_th': r'th', 'digraph_wh': r'wh',
+    'digraph_ph': r'ph', 'digraph_ck': r'ck', 'digraph_ng': r'ng',
+    'vowel_team_ee': r'ee', 'vowel_team_ea': r'ea', 'vowel_team_oa': r'oa', 'vowel_team_ai': r'ai',
+    'vowel_team_ay': r'ay', 'vowel_team_oo': r'oo', 'vowel_team_ou': r'ou', 'vowel_team_ow': r'ow',
+    'r_controlled': r'[aeiou]r', 'initial_blend': r'^(bl|cl|fl|gl|pl|sl|br|cr|dr|fr|gr|pr|tr|sc|sk|sm|sn|sp|st|sw)',
+    'silent_e': r'^[^aeiou]*[aeiou][^aeiouwxy]e$',
+}
+
+CONFUSABLE_PAIRS = (('b', 'd'), ('p', 'q'), ('m', 'w'), ('n', 'u'))
+
+# Spelling rounds from this tier up draw CONFUSABLE_SHARE of their words
+# from those containing one of REVERSAL_PAIRS.
+REVERSAL_PAIRS = ('b/d', 'p/q')
+CONFUSABLE_FROM_TIER = 2
+CONFUSABLE_SHARE = 0.5
+
+RECENT_PER_USER = 50
+MAX_TRACKED_USERS = 10000
+
+
+def estimate_syllables(word):
+    word = word.lower()
+    groups = re.findall(r'[aeiouy]+', word)
+    count = len(groups)
+    if word.endswith('e') and not word.endswith(('le', 'ee')) and count > 1:
+        count -= 1
+    return max(count, 1)
+
+
+def difficulty_tier(difficulty):
+    return int(np.searchsorted(TIER_BOUNDARIES, difficulty, side='right'))
+
+
+def _read_lines(path):
+    with open(path, encoding='utf-8') as f:
+        return [line.rstrip('\n') for line in f if line.strip() and not line.startswith('#')]
+
+
+class WordBank:
+    def __init__(self, directory=None, seed=None):
+        directory = directory or os.environ.get('WORD_BANK_DIR') or LEXICON_DIR
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recent = OrderedDict()
+
+        self.words = []
+        self.emoji = {}
+        for line in _read_lines(os.path.join(directory, 'words.txt')):
+            word, _, emoji = line.partition('\t')
+            word = word.strip().lower()
+            if word.isalpha():
+                self.words.append(word)
+                if emoji.strip():
+                    self.emoji[word] = emoji.strip()
+        self.sentences = _read_lines(os.path.join(directory, 'sentences.txt'))
+
+        self._build_indexes()
+
+    def _build_indexes(self):
+        self.word_ids = {word: i for i, word in enumerate(self.words)}
+        self.lengths = np.array([len(w) for w in self.words], dtype=np.int16)
+        self.syllables = np.array([estimate_syllables(w) for w in self.words], dtype=np.int16)
+
+        self.by_length = defaultdict(list)
+        self.by_syllables = defaultdict(list)
+        self.by_pattern = defaultdict(list)
+        self.by_confusable = defaultdict(list)
+        self.anagrams = defaultdict(list)
+        compiled = {name: re.compile(p) for name, p in PHONICS_PATTERNS.items()}
+
+        for i, word in enumerate(self.words):
+            self.by_length[len(word)].append(i)
+            self.by_syllables[int(self.syllables[i])].append(i)
+            for name, pattern in compiled.items():
+                if pattern.search(word):
+                    self.by_pattern[name].append(i)
+            for pair in CONFUSABLE_PAIRS:
+                if pair[0] in word or pair[1] in word:
+                    self.by_confusable['/'.join(pair)].append(i)
+            self.anagrams[''.join(sorted(word))].append(i)
+
+        self.patterns_of = defaultdict(list)
+        for name, ids in self.by_pattern.items():
+            for i in ids:
+                self.patterns_of[i].append(name)
+
+        # Each tier's pool is the union of its lengths' buckets, so building
+        # it reads only the words it can hold.
+        self.spelling_pools = []
+        for lo, hi, max_syl in SPELLING_TIERS:
+            ids = np.array(sorted(i for length in range(lo, hi + 1) for i in self.by_length.get(length, ())),
+                           dtype=np.int64)
+            self.spelling_pools.append(ids[self.syllables[ids] <= max_syl])
+        reversal_ids = np.unique(np.array(
+            [i for pair in REVERSAL_PAIRS for i in self.by_confusable[pair]], dtype=np.int64
+        ))
+        self.confusable_pools = [
+            np.intersect1d(pool, reversal_ids) if tier >= CONFUSABLE_FROM_TIER else pool[:0]
+            for tier, pool in enumerate(self.spelling_pools)
+        ]
+        picture_ids = np.array([self.word_ids[w] for w in self.emoji], dtype=np.int64)
+        self.picture_pools = [
+            picture_ids[(self.lengths[picture_ids] >= lo) & (self.lengths[picture_ids] <= max(hi, 5))]
+            for lo, hi, _ in SPELLING_TIERS
+        ]
+
+        sentence_words = [s.split() for s in self.sentences]
+        counts = np.array([len(w) for w in sentence_words])
+        longest = np.array([max(len(x) for x in w) for w in sentence_words])
+        self.jumble_pools = []
+        previous = (0, 0)
+        for max_words, max_len in JUMBLE_TIERS:
+            # Each tier takes the sentences that outgrow the tier below it.
+            fits = (counts <= max_words) & (longest <= max_len)
+            harder = (counts > previous[0]) | (longest > previous[1])
+            pool = np.flatnonzero(fits & harder)
+            self.jumble_pools.append(pool if len(pool) else np.flatnonzero(fits))
+            previous = (max_words, max_len)
+
+    # ---- per-user recently served window ------------------------------
+
+    def _recent_for(self, user_id, game_type):
+        key = (user_id, game_type)
+        recent = self._recent.get(key)
+        if recent is None:
+            recent = self._recent[key] = (deque(maxlen=RECENT_PER_USER), set())
+            if len(self._recent) > MAX_TRACKED_USERS:
+                self._recent.popitem(last=False)
+        else:
+            self._recent.move_to_end(key)
+        return recent
+
+    def _pick(self, pool, count, user_id, game_type, exclude=()):
+        """Pick ``count`` distinct items from ``pool`` avoiding recent ones.
+
+        Items in ``exclude`` are never picked.
+        """
+        if not len(pool) or count <= 0:
+            return []
+        count = min(count, len(pool))
+        with self._lock:
+            order, recent = self._recent_for(user_id, game_type) if user_id is not None else (None, set())
+            picked = list(exclude)
+            count += len(picked)
+            # A few random probes per item is constant time; when nearly the
+            # whole pool was served recently, fall back to allowing repeats.
+            for attempt in range(count * 8):
+                item = int(pool[self._random.randrange(len(pool))])
+                if item in picked:
+                    continue
+                if item in recent and attempt < count * 6:
+                    continue
+                picked.append(item)
+                if len(picked) == count:
+                    break
+            picked = picked[len(exclude):]
+            if order is not None:
+                for item in picked:
+                    if len(order) == order.maxlen:
+                        recent.discard(order[0])
+                    order.append(item)
+                    recent.add(item)
+            return picked
+
+    # ---- rounds -------------------------------------------------------
+
+    def confusable_variants(self, word, limit=3):
+        """Misspellings made by swapping commonly confused letters."""
+        swaps = {a: b for pair in CONFUSABLE_PAIRS for a, b in (pair, pair[::-1])}
+        variants = []
+        for i, letter in enumerate(word):
+            if letter in swaps:
+                variant = word[:i] + swaps[letter] + word[i + 1:]
+                if variant != word and variant not in self.word_ids:
+                    variants.append(variant)
+        return variants[:limit]
+
+    def spelling_round(self, tier, count, user_id):
+        ids = self._pick(self.confusable_pools[tier], round(count * CONFUSABLE_SHARE), user_id, 'spelling_bee')
+        ids += self._pick(self.spelling_pools[tier], count - len(ids), user_id, 'spelling_bee', exclude=ids)
+        self._random.shuffle(ids)
+        items = []
+        for i in ids:
+            word = self.words[i]
+            anagrams = [self.words[j] for j in self.anagrams[''.join(sorted(word))] if j != i]
+            items.append({
+                'word': word,
+                'length': len(word),
+                'syllables': int(self.syllables[i]),
+                'patterns': self.patterns_of.get(i, []),
+                'distractors': (self.confusable_variants(word) + anagrams)[:3],
+            })
+        return items
+
+    def memory_round(self, tier, count, user_id):
+        return [
+            {'word': self.words[i].upper(), 'emoji': self.emoji[self.words[i]]}
+            for i in self._pick(self.picture_pools[tier], count, user_id, 'memory_match')
+        ]
+
+    def jumble_round(self, tier, count, user_id):
+        items = []
+        for i in self._pick(self.jumble_pools[tier], count, user_id, 'word_jumble'):
+            words = self.sentences[i].split()
+            shuffled = words[:]
+            self._random.shuffle(shuffled)
+            items.append({'sentence': self.sentences[i], 'words': shuffled})
+        return items
+
+    def round(self, game_type, difficulty, count=None, user_id=None):
+        tier = difficulty_tier(difficulty)
+        if game_type == 'spelling_bee':
+            return tier, self.spelling_round(tier, count or 11, user_id)
+        if game_type == 'memory_match':
+            return tier, self.memory_round(tier, count or 6, user_id)
+        if game_type == 'word_jumble':
+            return tier, self.jumble_round(tier, count or 5, user_id)
+        raise ValueError(f'Unknown game type: {game_type}')
+
+    def stats(self):
+        return {
+            'words': len(self.words),
+            'picture_words': len(self.emoji),
+            'sentences': len(self.sentences),
+            'lengths': {length: len(ids) for length, ids in sorted(self.by_length.items())},
+            'syllables': {count: len(ids) for count, ids in sorted(self.by_syllables.items())},
+            'patterns': {name: len(ids) for name, ids in sorted(self.by_pattern.items())},
+            'confusable': {pair: len(ids) for pair, ids in sorted(self.by_confusable.items())},
+            'spelling_pool_sizes': [len(p) for p in self.spelling_pools],
+            'confusable_pool_sizes': [len(p) for p in self.confusable_pools],
+            'picture_pool_sizes': [len(p) for p in self.picture_pools],
+            'jumble_pool_sizes': [len(p) for p in self.jumble_pools],
+        }
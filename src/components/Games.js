@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useState, useRef } from 'react';
 import { useAuth } from '../contexts/AuthContext';
 import axios from 'axios';
 import './Games.css';
@@ -31,19 +31,32 @@ const Games = () => {
     }
   ];
 
-  // Function to save game scores to the backend
-  const saveGameScore = async (gameType, score, level, timeTaken = null) => {
-    try {
-      await axios.post('http://localhost:5000/api/save-game-score', {
-        user_id: user.user_id,
-        game_type: gameType,
-        score: score,
-        level: level,
-        time_taken: timeTaken
-      });
-      console.log('Final game score saved successfully');
-    } catch (error) {
-      console.error('Error saving game score:', error);
+  // Function to save game scores to the backend. Each finished game passes
+  // its own Idempotency-Key, and every retry here reuses it, so a score is
+  // saved once even when a response is lost.
+  const saveGameScore = async (gameType, score, level, idempotencyKey, timeTaken = null) => {
+    for (let attempt = 1; ; attempt++) {
+      try {
+        await axios.post('http://localhost:5000/api/save-game-score', {
+          user_id: user.user_id,
+          game_type: gameType,
+          score: score,
+          level: level,
+          time_taken: timeTaken
+        }, {
+          headers: { 'Idempotency-Key': idempotencyKey }
+        });
+        console.log('Final game score saved successfully');
+        return;
+      } catch (error) {
+        // No response, or 409 while the first attempt is still in progress.
+        const retry = !error.response || error.response.status === 409;
+        if (!retry || attempt >= 3) {
+          console.error('Error saving game score:', error);
+          return;
+        }
+        await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+      }
     }
   };
 
@@ -87,6 +100,7 @@ const Games = () => {
 
 // Word Jumble Game Component
 function WordJumbleGame({ saveGameScore }) {
+  const scoreKeyRef = useRef(null);
   const [currentSentence, setCurrentSentence] = useState('');
   const [scrambledWords, setScrambledWords] = useState([]);
   const [selectedWords, setSelectedWords] = useState([]);
@@ -384,7 +398,10 @@ function WordJumbleGame({ saveGameScore }) {
   const endGame = () => {
     setGameCompleted(true);
     const level = Math.floor(score / 50) + 1;
-    saveGameScore('word_jumble', score, level);
+    if (!scoreKeyRef.current) {
+      scoreKeyRef.current = window.crypto.randomUUID();
+    }
+    saveGameScore('word_jumble', score, level, scoreKeyRef.current);
   };
 
   const downloadResults = () => {
@@ -416,6 +433,7 @@ function WordJumbleGame({ saveGameScore }) {
   };
 
   const restartGame = () => {
+    scoreKeyRef.current = null;
     setScore(0);
     setMoves(0);
     setGameCompleted(false);
@@ -559,6 +577,7 @@ function WordJumbleGame({ saveGameScore }) {
 
 // Memory Match Game Component
 function MemoryMatchGame({ saveGameScore }) {
+  const scoreKeyRef = useRef(null);
   const [cards, setCards] = useState([]);
   const [flipped, setFlipped] = useState([]);
   const [matched, setMatched] = useState([]);
@@ -613,6 +632,7 @@ function MemoryMatchGame({ saveGameScore }) {
     setScore(0);
     setMoves(0);
     setGameCompleted(false);
+    scoreKeyRef.current = null;
   };
 
   React.useEffect(() => {
@@ -650,7 +670,10 @@ function MemoryMatchGame({ saveGameScore }) {
   const endGame = () => {
     setGameCompleted(true);
     const level = Math.floor(score / 60) + 1;
-    saveGameScore('memory_match', score, level);
+    if (!scoreKeyRef.current) {
+      scoreKeyRef.current = window.crypto.randomUUID();
+    }
+    saveGameScore('memory_match', score, level, scoreKeyRef.current);
   };
 
   return (
@@ -694,6 +717,7 @@ function MemoryMatchGame({ saveGameScore }) {
 
 // Spelling Bee Game Component
 function SpellingBeeGame({ saveGameScore }) {
+  const scoreKeyRef = useRef(null);
   const [currentWord, setCurrentWord] = useState('');
   const [userInput, setUserInput] = useState('');
   const [score, setScore] = useState(0);
@@ -775,10 +799,14 @@ function SpellingBeeGame({ saveGameScore }) {
   const endGame = () => {
     setGameCompleted(true);
     const level = Math.floor(score / 100) + 1;
-    saveGameScore('spelling_bee', score, level);
+    if (!scoreKeyRef.current) {
+      scoreKeyRef.current = window.crypto.randomUUID();
+    }
+    saveGameScore('spelling_bee', score, level, scoreKeyRef.current);
   };
 
   const restartGame = () => {
+    scoreKeyRef.current = null;
     setScore(0);
     setMoves(0);
     setGameCompleted(false);
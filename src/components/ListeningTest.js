@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useAuth } from '../contexts/AuthContext';
 import axios from 'axios';
 import './Tests.css';
@@ -12,6 +12,8 @@ const ListeningTest = () => {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
   const [speechSynthesisSupported, setSpeechSynthesisSupported] = useState(true);
+  // Reused until the server answers or a new sentence is loaded
+  const submissionKeyRef = useRef(null);
 
   const audioSamples = [
     // Simple & Basic Sentences
@@ -196,17 +198,26 @@ const ListeningTest = () => {
     setLoading(true);
     setError('');
 
+    if (!submissionKeyRef.current) {
+      submissionKeyRef.current = window.crypto.randomUUID();
+    }
+
     try {
       const response = await axios.post('http://localhost:5000/api/listening-test', {
         user_id: user.user_id,
         typed_text: userInput,
         original_text: audioText
+      }, {
+        headers: { 'Idempotency-Key': submissionKeyRef.current }
       });
 
       setResults(response.data);
       
     } catch (error) {
       console.error('Error submitting test:', error);
+      if (error.response) {
+        submissionKeyRef.current = null;
+      }
       setError(error.response?.data?.error || 'Failed to submit test. Please try again.');
     } finally {
       setLoading(false);
@@ -218,6 +229,7 @@ const ListeningTest = () => {
     setAudioText(randomText);
     setUserInput('');
     setResults(null);
+    submissionKeyRef.current = null;
     setError('');
     // Cancel any playing audio
     if (window.speechSynthesis) {
@@ -16,6 +16,8 @@ const SpeechTest = () => {
 
   const recognitionRef = useRef(null);
   const mediaStreamRef = useRef(null);
+  // One key per attempt, so re-clicks and retries are saved only once
+  const submissionKeyRef = useRef(null);
 
   const paragraphs = [
     // Easy & Simple Sentences
@@ -233,17 +235,26 @@ const SpeechTest = () => {
     setLoading(true);
     setError('');
 
+    if (!submissionKeyRef.current) {
+      submissionKeyRef.current = window.crypto.randomUUID();
+    }
+
     try {
       const response = await axios.post('http://localhost:5000/api/speech-test', {
         user_id: user.user_id,
         spoken_text: textToSubmit,
         original_text: paragraph
+      }, {
+        headers: { 'Idempotency-Key': submissionKeyRef.current }
       });
 
       setResults(response.data);
       
     } catch (error) {
       console.error('Error submitting test:', error);
+      if (error.response) {
+        submissionKeyRef.current = null;
+      }
       setError(error.response?.data?.error || 'Failed to submit test. Please try again.');
     } finally {
       setLoading(false);
@@ -256,6 +267,7 @@ const SpeechTest = () => {
     setTranscript('');
     setManualText('');
     setResults(null);
+    submissionKeyRef.current = null;
     setError('');
     stopRecording();
   };